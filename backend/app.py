@@ -1,24 +1,45 @@
 #app -> controller -> service -> engine model
-import sys
-import collections
 # Fixed 'collections' has no attribute 'Mapping' error in Python 3.10+
-if sys.version_info >= (3, 10):
-    import collections.abc
-    collections.Mapping = collections.abc.Mapping
-    collections.MutableMapping = collections.abc.MutableMapping
-    collections.Iterable = collections.abc.Iterable
-    collections.MutableSet = collections.abc.MutableSet
-    collections.Callable = collections.abc.Callable
-
-from fastapi import FastAPI
+import compat
+
+from contextlib import asynccontextmanager
+
+from typing import Any, List, Optional
+
+from fastapi import Body, FastAPI, Request
 from fastapi.middleware.cors import CORSMiddleware
 from controllers.controller import (
-    run_analysis
+    start_analysis,
+    stop_analysis,
+    run_analysis,
+    get_analysis_fields,
+    run_batch,
+    stream_batch,
+    get_result_cache_stats,
+    get_engine_pool_metrics,
+    get_analysis_metrics,
+    get_stage_metrics,
+    get_prometheus_metrics,
+    get_rule_profile_report,
+    clear_rule_profile,
+    get_layer_profile_report,
+    clear_layer_profile,
+    profile_layers,
+    ServerTimingMiddleware
 )
 from models.request import MarketingAnalysisRequest
+import config
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    # Warm engines / worker processes before the first request, stop workers on shutdown
+    start_analysis()
+    yield
+    stop_analysis()
 
 
-app = FastAPI(title="MARX Marketing Expert System")
+app = FastAPI(title="MARX Marketing Expert System", lifespan=lifespan)
 
 #CORS for frontend communication
 app.add_middleware(
@@ -27,11 +48,78 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    # Let the frontend read per-phase durations (response.headers / PerformanceServerTiming)
+    expose_headers=["Server-Timing"],
 )
-# POST endpoint for analysis
+if config.SERVER_TIMING:
+    app.add_middleware(ServerTimingMiddleware)
+# POST endpoint for analysis; ?fields=recommended_strategies,budget_allocation returns only those sections
 @app.post('/api/analyze')
-async def analyze(request: MarketingAnalysisRequest):
-    return await run_analysis(request)
+async def analyze(request: MarketingAnalysisRequest, fields: Optional[str] = None):
+    return await run_analysis(request, fields)
+
+# GET endpoint for the sections ?fields= accepts and the rule layers each one depends on
+@app.get('/api/analyze/fields')
+async def analyze_fields():
+    return get_analysis_fields()
+
+# POST endpoint for many analyses in one round trip (items validated individually)
+@app.post('/api/analyze/batch')
+async def analyze_batch(items: List[Any] = Body(...)):
+    return await run_batch(items)
+
+# POST endpoint streaming NDJSON: one payload per input line, one result per output line
+@app.post('/api/analyze/stream')
+async def analyze_stream(request: Request):
+    return stream_batch(request)
+
+# GET endpoint for result cache counters
+@app.get('/api/cache/stats')
+async def cache_stats():
+    return get_result_cache_stats()
+
+# Prometheus scrape endpoint: per-phase latency histograms, request and engine counters
+@app.get('/metrics')
+async def metrics():
+    return get_prometheus_metrics()
+
+# GET endpoint for analysis queue depth / wait-time counters
+@app.get('/api/analysis/stats')
+async def analysis_stats():
+    return get_analysis_metrics()
+
+# GET endpoint for engine pool checkout/wait-time counters
+@app.get('/api/engine-pool/stats')
+async def engine_pool_stats():
+    return get_engine_pool_metrics()
+
+# GET endpoint for the staged engine's per-stage cache counters and input dependencies
+@app.get('/api/stages/stats')
+async def stage_stats():
+    return get_stage_metrics()
+
+# Debug endpoints for the per-rule firing profile (MARX_PROFILE_RULES=1)
+@app.get('/api/debug/rule-profile')
+async def rule_profile(sort: str = "time", top: Optional[int] = None):
+    return get_rule_profile_report(sort, top)
+
+@app.delete('/api/debug/rule-profile')
+async def rule_profile_reset():
+    return clear_rule_profile()
+
+# Debug endpoints for per-layer firing time and facts added (MARX_PROFILE_LAYERS=1)
+@app.get('/api/debug/layer-profile')
+async def layer_profile():
+    return get_layer_profile_report()
+
+@app.delete('/api/debug/layer-profile')
+async def layer_profile_reset():
+    return clear_layer_profile()
+
+# Layer breakdown of one uncached run of the given request (any MARX_PROFILE_* setting)
+@app.post('/api/debug/layer-profile')
+async def layer_profile_request(request: MarketingAnalysisRequest, engine: Optional[str] = None):
+    return await profile_layers(request, engine)
 
 # # GET endpoints for input options
 # @app.get('/api/inputs/product-types')
@@ -0,0 +1,221 @@
+"""
+Run analyses offline, straight through the service layer (no HTTP server needed).
+
+Reads scenarios from CSV (header row with the MarketingAnalysisRequest field names) or
+JSONL (one payload per line), fans them out over a process pool in chunks and writes
+one result per input row, in input order, as soon as each chunk is done.
+
+Usage:
+    python batch_runner.py scenarios.csv --output results.jsonl --workers 8
+    python batch_runner.py scenarios.jsonl --output results.csv --chunk-size 500
+    cat scenarios.jsonl | python batch_runner.py - --output results.jsonl
+
+JSONL output lines look like the /api/analyze/batch results. CSV output has one row per
+input with the list fields of the recommendation as JSON strings.
+"""
+import compat
+import argparse
+import csv
+import json
+import os
+import sys
+import time
+from collections import deque
+from itertools import islice
+from multiprocessing import Pool
+
+import config
+from services.batch_service import item_result, validate_item
+from services.comprehensive_service import ENGINE_CLASSES, get_template_blocking, scenario_key
+from services.process_backend import init_worker
+
+INPUT_FORMATS = ("csv", "jsonl")
+CSV_OUTPUT_FIELDS = [
+    "index",
+    "status",
+    "error",
+    "recommended_strategies",
+    "critical_insights",
+    "budget_allocation",
+    "total_monthly_budget",
+    "channel_tactics",
+    "action_plan",
+    "resources",
+]
+
+_mode = None
+
+
+def _input_format(path: str, requested: str = None) -> str:
+    if requested:
+        return requested
+    if path.endswith(".csv"):
+        return "csv"
+    return "jsonl"
+
+
+def read_rows(stream, input_format: str):
+    """Raw payloads, one per scenario; JSONL lines that are not valid JSON come back as errors"""
+    if input_format == "csv":
+        for row in csv.DictReader(stream):
+            # Empty cells are missing fields, so validation reports them by name
+            yield {name: value for name, value in row.items() if value not in ("", None)}
+        return
+
+    for line in stream:
+        if not line.strip():
+            continue
+        try:
+            yield json.loads(line)
+        except ValueError as e:
+            yield ValueError(f"Invalid JSON: {e}")
+
+
+def _chunks(rows, size: int):
+    index = 0
+    rows = iter(rows)
+    while True:
+        chunk = list(islice(rows, size))
+        if not chunk:
+            return
+        yield index, chunk
+        index += len(chunk)
+
+
+def _init(mode: str):
+    global _mode
+    _mode = mode
+    init_worker(mode)
+
+
+def analyze_chunk(task) -> list:
+    """Results of one chunk; runs in a worker process (or inline with --workers 1)"""
+    start, rows = task
+    results = []
+    for index, row in enumerate(rows, start):
+        if isinstance(row, Exception):
+            results.append(item_result(index, error=str(row)))
+            continue
+        request, errors = validate_item(row)
+        if request is None:
+            results.append(item_result(index, error="Invalid request", details=errors))
+            continue
+        try:
+            # Repeated scenarios inside a worker come from its result cache
+            template = get_template_blocking(request, scenario_key(request), _mode)
+        except Exception as e:
+            results.append(item_result(index, request, error=str(e)))
+            continue
+        results.append(item_result(index, request, template))
+    return results
+
+
+class ResultWriter:
+    """Writes results as they come and flushes after every chunk"""
+
+    def __init__(self, stream, output_format: str):
+        self.stream = stream
+        self.output_format = output_format
+        self.rows = 0
+        self.errors = 0
+        if output_format == "csv":
+            self._csv = csv.DictWriter(stream, fieldnames=CSV_OUTPUT_FIELDS)
+            self._csv.writeheader()
+
+    def write(self, results: list):
+        for result in results:
+            self.rows += 1
+            if result["status"] == "error":
+                self.errors += 1
+            if self.output_format == "csv":
+                self._csv.writerow(self._csv_row(result))
+            else:
+                self.stream.write(json.dumps(result) + "\n")
+        self.stream.flush()
+
+    @staticmethod
+    def _csv_row(result: dict) -> dict:
+        row = {"index": result["index"], "status": result["status"]}
+        if result["status"] == "error":
+            details = result.get("details")
+            row["error"] = result["error"] + (f": {json.dumps(details)}" if details else "")
+            return row
+        for name, value in result["data"].items():
+            row[name] = json.dumps(value) if isinstance(value, (list, dict)) else value
+        return row
+
+
+def run(rows, writer: ResultWriter, workers: int = 1, chunk_size: int = 200,
+        mode: str = None, progress_every: int = 1000):
+    mode = mode or config.ENGINE_MODE
+    started = time.perf_counter()
+    reported = 0
+
+    def report(final=False):
+        nonlocal reported
+        if not final and writer.rows - reported < progress_every:
+            return
+        reported = writer.rows
+        elapsed = time.perf_counter() - started
+        rate = writer.rows / elapsed if elapsed else 0.0
+        print(f"  {writer.rows} scenarios, {writer.errors} errors ({rate:.1f}/s)", file=sys.stderr)
+
+    if workers > 1:
+        with Pool(workers, initializer=_init, initargs=(mode,)) as pool:
+            # Results are written in input order; only a few chunks per worker are read ahead
+            # so memory does not grow with the size of the input
+            pending = deque()
+            for task in _chunks(rows, chunk_size):
+                pending.append(pool.apply_async(analyze_chunk, (task,)))
+                if len(pending) >= workers * 2:
+                    writer.write(pending.popleft().get())
+                    report()
+            while pending:
+                writer.write(pending.popleft().get())
+                report()
+    else:
+        _init(mode)
+        for task in _chunks(rows, chunk_size):
+            writer.write(analyze_chunk(task))
+            report()
+
+    report(final=True)
+    return time.perf_counter() - started
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Analyze scenarios from CSV/JSONL without the API server")
+    parser.add_argument("input", help="CSV or JSONL file of request payloads ('-' reads JSONL from stdin)")
+    parser.add_argument("--output", "-o", default="-", help="Results file, .csv or .jsonl ('-' writes JSONL to stdout)")
+    parser.add_argument("--input-format", choices=INPUT_FORMATS)
+    parser.add_argument("--output-format", choices=INPUT_FORMATS)
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    parser.add_argument("--chunk-size", type=int, default=200, help="Scenarios per task sent to a worker")
+    parser.add_argument("--engine", choices=sorted(ENGINE_CLASSES), default=config.ENGINE_MODE)
+    parser.add_argument("--progress-every", type=int, default=1000)
+    args = parser.parse_args()
+
+    input_format = _input_format(args.input, args.input_format)
+    output_format = _input_format(args.output, args.output_format)
+    source = sys.stdin if args.input == "-" else open(args.input, newline="", encoding="utf-8")
+    target = sys.stdout if args.output == "-" else open(args.output, "w", newline="", encoding="utf-8")
+
+    print(f"Analyzing {args.input} ({input_format}) with {args.workers} worker(s), "
+          f"{args.chunk_size} scenarios per chunk", file=sys.stderr)
+    try:
+        writer = ResultWriter(target, output_format)
+        elapsed = run(read_rows(source, input_format), writer, args.workers, args.chunk_size,
+                      args.engine, args.progress_every)
+    finally:
+        if source is not sys.stdin:
+            source.close()
+        if target is not sys.stdout:
+            target.close()
+
+    rate = writer.rows / elapsed if elapsed else 0.0
+    print(f"Wrote {writer.rows} results ({writer.errors} errors) to {args.output} "
+          f"in {elapsed:.1f}s ({rate:.1f} scenarios/s)", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
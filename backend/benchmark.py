@@ -0,0 +1,219 @@
+"""
+Benchmark the analysis pipeline phase by phase.
+
+Every scenario is timed through the same steps /api/analyze takes on a cache miss,
+each phase separately:
+
+    construct   build a fresh engine (no pool), for the request's product with MARX_PRODUCT_ENGINES
+    declare     _declare_inputs: reset (or warm fork) and declare the eight input facts
+    run         forward chaining (engine.run)
+    aggregate   _aggregate_recommendations: facts -> MarketingRecommendation
+    serialize   recommendation.dict() and JSON encoding, as the API response does
+
+and reported as mean/p50/p95/p99/max per phase plus single-thread throughput.
+Results are written as JSON (with the git commit and machine details) so runs on
+different commits can be compared with --compare.
+
+Usage:
+    python benchmark.py --samples 500 --output bench.json
+    python benchmark.py --engine native --engine experta --samples 200
+    python benchmark.py --all --engine native --output bench-full.json
+    python benchmark.py --samples 500 --compare bench.json --max-regression 15
+"""
+import compat
+import argparse
+import datetime
+import gc
+import json
+import os
+import platform
+import random
+import subprocess
+import sys
+import time
+
+import config
+from models.model import ProductType
+from services.comprehensive_service import (
+    ENGINE_CLASSES,
+    _aggregate_recommendations,
+    _declare_inputs,
+    _new_engine,
+    request_for_scenario
+)
+from services.decision_table import iter_scenario_keys
+
+BENCHMARK_VERSION = 1
+PHASES = ["construct", "declare", "run", "aggregate", "serialize"]
+
+
+def percentile(sorted_values, pct: float) -> float:
+    """Nearest-rank percentile of an already sorted list"""
+    if not sorted_values:
+        return 0.0
+    rank = max(1, -(-len(sorted_values) * pct // 100))
+    return sorted_values[int(rank) - 1]
+
+
+def summarize(samples) -> dict:
+    ordered = sorted(samples)
+    return {
+        "mean_ms": round(sum(ordered) / len(ordered) * 1000, 4),
+        "p50_ms": round(percentile(ordered, 50) * 1000, 4),
+        "p95_ms": round(percentile(ordered, 95) * 1000, 4),
+        "p99_ms": round(percentile(ordered, 99) * 1000, 4),
+        "max_ms": round(ordered[-1] * 1000, 4),
+    }
+
+
+def time_scenario(request, mode: str) -> dict:
+    """Seconds spent in each phase for one scenario"""
+    clock = time.perf_counter
+    timings = {}
+
+    started = clock()
+    engine = _new_engine(mode, request.product_type.value if config.PRODUCT_ENGINES else None)
+    timings["construct"] = clock() - started
+
+    # The service's own declaration path, so warm forks and product engines are timed as served
+    started = clock()
+    _declare_inputs(engine, request)
+    timings["declare"] = clock() - started
+
+    started = clock()
+    engine.run()
+    timings["run"] = clock() - started
+
+    started = clock()
+    recommendation = _aggregate_recommendations(engine, request)
+    timings["aggregate"] = clock() - started
+
+    started = clock()
+    json.dumps({'status': 'success', 'data': recommendation.dict()})
+    timings["serialize"] = clock() - started
+
+    return timings
+
+
+def benchmark_engine(keys, mode: str, warmup: int = 20, progress_every: int = 0) -> dict:
+    for key in keys[:warmup]:
+        time_scenario(request_for_scenario(key), mode)
+
+    samples = {phase: [] for phase in PHASES + ["total"]}
+    gc.collect()
+    # Requests are built per scenario, outside the timed phases, so --all stays small in memory
+    for done, key in enumerate(keys, 1):
+        timings = time_scenario(request_for_scenario(key), mode)
+        for phase in PHASES:
+            samples[phase].append(timings[phase])
+        samples["total"].append(sum(timings.values()))
+        if progress_every and done % progress_every == 0:
+            print(f"  {mode}: {done}/{len(keys)} scenarios", file=sys.stderr)
+
+    busy = sum(samples["total"])
+    return {
+        "scenarios": len(keys),
+        "throughput_per_s": round(len(keys) / busy, 2) if busy else 0.0,
+        "phases": {phase: summarize(values) for phase, values in samples.items()},
+    }
+
+
+def _git_commit():
+    try:
+        return subprocess.run(["git", "rev-parse", "--short", "HEAD"], capture_output=True, text=True,
+                              cwd=os.path.dirname(os.path.abspath(__file__)), check=True).stdout.strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def print_report(report: dict):
+    for mode, result in report["engines"].items():
+        print(f"\n{mode}: {result['scenarios']} scenarios, {result['throughput_per_s']:.1f} scenarios/s (single thread)")
+        print(f"  {'phase':<10} {'mean':>9} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+        for phase, stats in result["phases"].items():
+            print(f"  {phase:<10} {stats['mean_ms']:>9.3f} {stats['p50_ms']:>9.3f} {stats['p95_ms']:>9.3f} "
+                  f"{stats['p99_ms']:>9.3f} {stats['max_ms']:>9.3f}")
+
+
+def compare(report: dict, baseline: dict, max_regression: float = None) -> bool:
+    """Print p50/p95 changes against a baseline report; False if total latency regressed too much"""
+    ok = True
+    print(f"\nCompared with {baseline.get('git_commit') or 'baseline'} ({baseline.get('timestamp')}):")
+    for mode, result in report["engines"].items():
+        previous = baseline.get("engines", {}).get(mode)
+        if previous is None:
+            print(f"  {mode}: not in baseline")
+            continue
+        for phase, stats in result["phases"].items():
+            before = previous["phases"].get(phase)
+            if before is None:
+                continue
+            changes = []
+            for stat in ("p50_ms", "p95_ms"):
+                change = (stats[stat] - before[stat]) / before[stat] * 100 if before[stat] else 0.0
+                changes.append(f"{stat[:3]} {before[stat]:.3f} -> {stats[stat]:.3f} ms ({change:+.1f}%)")
+                if phase == "total" and max_regression is not None and change > max_regression:
+                    ok = False
+            print(f"  {mode:<8} {phase:<10} " + ", ".join(changes))
+    if not ok:
+        print(f"Total latency regressed by more than {max_regression}%", file=sys.stderr)
+    return ok
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark engine construction, declaration, run, aggregation and serialization")
+    parser.add_argument("--engine", action="append", choices=sorted(ENGINE_CLASSES),
+                        help="Engine mode to benchmark (repeatable, default: native and bitset)")
+    parser.add_argument("--samples", type=int, default=500, help="Random scenarios per engine")
+    parser.add_argument("--all", action="store_true", help="Time every scenario of the input space instead of a sample")
+    parser.add_argument("--product", action="append", choices=[p.value for p in ProductType],
+                        help="Only use scenarios for this product type (repeatable)")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--warmup", type=int, default=20, help="Untimed scenarios run first")
+    parser.add_argument("--output", help="Write the report as JSON")
+    parser.add_argument("--compare", help="Baseline JSON report to compare against")
+    parser.add_argument("--max-regression", type=float,
+                        help="With --compare, exit 1 if total p50 or p95 grew by more than this percentage")
+    args = parser.parse_args()
+
+    modes = args.engine or ["native", "bitset"]
+    keys = list(iter_scenario_keys(args.product))
+    if not args.all and args.samples < len(keys):
+        keys = random.Random(args.seed).sample(keys, args.samples)
+
+    report = {
+        "benchmark_version": BENCHMARK_VERSION,
+        "timestamp": datetime.datetime.now(datetime.timezone.utc).isoformat(timespec="seconds"),
+        "git_commit": _git_commit(),
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "cpu_count": os.cpu_count(),
+        "config": {
+            "samples": len(keys),
+            "exhaustive": args.all,
+            "products": args.product,
+            "seed": args.seed,
+            "warmup": args.warmup,
+        },
+        "engines": {},
+    }
+    for mode in modes:
+        print(f"Benchmarking {mode} on {len(keys)} scenarios", file=sys.stderr)
+        report["engines"][mode] = benchmark_engine(keys, mode, args.warmup, progress_every=10000 if args.all else 0)
+
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}", file=sys.stderr)
+
+    if args.compare:
+        with open(args.compare, encoding="utf-8") as f:
+            baseline = json.load(f)
+        if not compare(report, baseline, args.max_regression):
+            sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""
+Build the precomputed decision table used by /api/analyze.
+
+Runs every scenario (product x customer x goal x horizon x content x sales x KPI x budget tier)
+through the engine once, at a representative budget for each tier, and writes the
+budget-invariant templates.
+
+Usage:
+    python build_decision_table.py --output decision_table.json.gz --workers 4
+    python build_decision_table.py --product local_service --product hospitality
+
+Then start the API with MARX_DECISION_TABLE=decision_table.json.gz
+"""
+import compat
+import argparse
+import sys
+import time
+from multiprocessing import Pool
+
+from models.model import ProductType
+from services.comprehensive_service import aggregation_fingerprint, compute_template, request_for_scenario
+from services.decision_table import DecisionTable, iter_scenario_keys, count_scenarios
+
+
+def _run_scenario(key):
+    return key, compute_template(request_for_scenario(key)).dict()
+
+
+def build(product_types=None, workers=1, progress_every=1000):
+    table = DecisionTable()
+    total = count_scenarios(product_types)
+    keys = iter_scenario_keys(product_types)
+    started = time.perf_counter()
+
+    def report(done):
+        elapsed = time.perf_counter() - started
+        rate = done / elapsed if elapsed else 0.0
+        print(f"  {done}/{total} scenarios ({rate:.1f}/s)", file=sys.stderr)
+
+    if workers > 1:
+        with Pool(workers) as pool:
+            results = pool.imap_unordered(_run_scenario, keys, chunksize=64)
+            for done, (key, result) in enumerate(results, 1):
+                table.add(key, result)
+                if done % progress_every == 0:
+                    report(done)
+    else:
+        for done, key in enumerate(keys, 1):
+            table.add(*_run_scenario(key))
+            if done % progress_every == 0:
+                report(done)
+
+    report(len(table))
+    return table
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Precompute the MARX decision table")
+    parser.add_argument("--output", default="decision_table.json.gz")
+    parser.add_argument("--workers", type=int, default=1)
+    parser.add_argument("--product", action="append", choices=[p.value for p in ProductType],
+                        help="Only build scenarios for this product type (repeatable)")
+    args = parser.parse_args()
+
+    print(f"Building {count_scenarios(args.product)} scenarios with {args.workers} worker(s)", file=sys.stderr)
+    table = build(args.product, args.workers)
+    table.save(args.output, aggregation_fingerprint())
+    print(f"Wrote {len(table)} scenarios ({table.unique_results} unique results) to {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
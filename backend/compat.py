@@ -0,0 +1,15 @@
+"""
+Python 3.10+ compatibility shim for experta's dependencies
+Import this before anything that imports experta
+"""
+import sys
+import collections
+
+# Fixed 'collections' has no attribute 'Mapping' error in Python 3.10+
+if sys.version_info >= (3, 10):
+    import collections.abc
+    collections.Mapping = collections.abc.Mapping
+    collections.MutableMapping = collections.abc.MutableMapping
+    collections.Iterable = collections.abc.Iterable
+    collections.MutableSet = collections.abc.MutableSet
+    collections.Callable = collections.abc.Callable
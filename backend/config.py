@@ -0,0 +1,65 @@
+"""
+Runtime settings for the MARX backend, read once from environment variables
+"""
+import os
+
+# Prebuilt decision table (see build_decision_table.py); empty disables table lookups
+DECISION_TABLE_PATH = os.getenv("MARX_DECISION_TABLE", "")
+
+# In-process LRU cache of recommendation templates (0 disables it)
+RESULT_CACHE_SIZE = int(os.getenv("MARX_RESULT_CACHE_SIZE", "4096"))
+# Seconds before a cached template expires (0 = never)
+RESULT_CACHE_TTL = float(os.getenv("MARX_RESULT_CACHE_TTL", "0"))
+
+# Rule engine behind the analysis: "experta" the original Rete engine (the reference, hash-seed
+# dependent on ties), "native" runs the compiled rule base, "bitset" the same rule base with
+# bit-mask matching. The compiled engines are opt-in: they break ties deterministically, so a
+# few templates differ from Experta's.
+ENGINE_MODE = os.getenv("MARX_ENGINE", "experta")
+
+# Where analyses run: "thread" (engine pool in the server process) or "process"
+# (pre-warmed worker processes, so inference is not serialized by the GIL)
+ANALYSIS_BACKEND = os.getenv("MARX_ANALYSIS_BACKEND", "thread")
+# Worker processes of the process backend (0 = one per CPU)
+PROCESS_WORKERS = int(os.getenv("MARX_PROCESS_WORKERS", "0")) or (os.cpu_count() or 1)
+
+# Working-memory snapshots after product, budget and customer are declared, per engine class
+# and (product, customer, budget tier), that compiled-engine runs start from (0 disables them)
+WARM_FORK_CACHE_SIZE = int(os.getenv("MARX_WARM_FORK_CACHE_SIZE", "1024"))
+
+# Native and bitset engines per product type, each with only the rules that can fire for it
+PRODUCT_ENGINES = os.getenv("MARX_PRODUCT_ENGINES", "1") != "0"
+
+# Minimized rule set written by minimize_rules.py, run by the native and bitset engines (empty = all rules)
+RULE_SET_PATH = os.getenv("MARX_RULE_SET", "")
+
+# Entries kept per stage by the staged engine (MARX_ENGINE=staged), keyed on the stage's input facts
+STAGE_CACHE_SIZE = int(os.getenv("MARX_STAGE_CACHE_SIZE", "4096"))
+
+# Per-rule activation/firing/time counters, see GET /api/debug/rule-profile (adds overhead)
+PROFILE_RULES = os.getenv("MARX_PROFILE_RULES", "0") == "1"
+# Per-layer firing time and facts added, see GET /api/debug/layer-profile and /metrics (adds overhead)
+PROFILE_LAYERS = os.getenv("MARX_PROFILE_LAYERS", "0") == "1"
+# File the rule profile is written to when the app shuts down (empty = don't write)
+RULE_PROFILE_PATH = os.getenv("MARX_RULE_PROFILE_PATH", "")
+
+# Send a Server-Timing header (phase durations, cache hit/miss) with /api/analyze responses
+SERVER_TIMING = os.getenv("MARX_SERVER_TIMING", "1") == "1"
+
+# Concurrent requests for the same scenario share one in-flight analysis (0 disables it)
+SINGLE_FLIGHT = os.getenv("MARX_SINGLE_FLIGHT", "1") != "0"
+
+# Maximum items accepted by /api/analyze/batch in one request
+BATCH_MAX_ITEMS = int(os.getenv("MARX_BATCH_MAX_ITEMS", "1000"))
+
+# Threads of the dedicated analysis executor (thread backend; 0 = min(32, CPUs + 4))
+ANALYSIS_WORKERS = int(os.getenv("MARX_ANALYSIS_WORKERS", "0")) or min(32, (os.cpu_count() or 1) + 4)
+# Analyses allowed to wait for a busy executor; beyond that requests get 503 + Retry-After
+ANALYSIS_QUEUE_SIZE = int(os.getenv("MARX_ANALYSIS_QUEUE_SIZE", "64"))
+# Minimum Retry-After (seconds) sent with a 503
+ANALYSIS_RETRY_AFTER = int(os.getenv("MARX_ANALYSIS_RETRY_AFTER", "1"))
+
+# Pre-built engines per engine mode, checked out per analysis (0 = one per analysis thread)
+ENGINE_POOL_SIZE = int(os.getenv("MARX_ENGINE_POOL_SIZE", "0")) or ANALYSIS_WORKERS
+# Seconds a request waits for a free engine before failing
+ENGINE_POOL_TIMEOUT = float(os.getenv("MARX_ENGINE_POOL_TIMEOUT", "30"))
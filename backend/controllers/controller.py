@@ -1,6 +1,32 @@
-from fastapi import HTTPException
-from services.comprehensive_service import run_comprehensive_analysis
+import time
+from typing import Any, List, Optional
+
+from fastapi import HTTPException, Request
+from fastapi.responses import Response, StreamingResponse
+from starlette.concurrency import run_in_threadpool
+import config
+from services.comprehensive_service import (
+    run_comprehensive_analysis,
+    run_section_analysis,
+    parse_sections,
+    get_section_dependencies,
+    get_cache_stats,
+    get_engine_pool_stats,
+    get_stage_stats,
+    get_analysis_stats,
+    get_rule_profile,
+    reset_rule_profile,
+    get_layer_report,
+    reset_layer_report,
+    profile_request_layers,
+    start_analysis_backend,
+    stop_analysis_backend
+)
 from models.request import MarketingAnalysisRequest
+from services.analysis_executor import AnalysisQueueFull
+from services.batch_service import run_batch_analysis, stream_batch_analysis
+from services.metrics import count_error, count_request, observe_phase, render_metrics
+from services.server_timing import mark_handler_done, record_since_start, record_timing, start_timing
 from models.model import (
     ProductType,
     TargetCustomer,
@@ -11,20 +37,213 @@ from models.model import (
     PriorityKPI
 )
 
-async def run_analysis(request: MarketingAnalysisRequest):
+def start_analysis():
+    """Bring up the analysis backend (engine pool or worker processes) before serving"""
+    start_analysis_backend()
+
+
+def stop_analysis():
+    stop_analysis_backend()
+
+
+async def run_analysis(request: MarketingAnalysisRequest, fields: Optional[str] = None):
+    started = time.perf_counter()
+    # Body parsing and validation happened before the handler was called
+    record_since_start('validation')
+    count_request('analyze')
     try:
-        # Use comprehensive analysis instead of simple service
-        result = await run_comprehensive_analysis(request)
+        sections = parse_sections(fields) if fields is not None else None
+        if sections is not None:
+            # Only the selected sections, computed from the rules they depend on
+            result = await run_section_analysis(request, sections)
+        else:
+            # Use comprehensive analysis instead of simple service
+            result = await run_comprehensive_analysis(request)
 
+        serializing = time.perf_counter()
+        data = result if sections is not None else result.dict()
+        serialized = time.perf_counter() - serializing
+        observe_phase('serialization', serialized)
+        record_timing('serialization', serialized)
         return{
             'status': 'success',
-            'data': result.dict()
+            'data': data
         }
+    except AnalysisQueueFull as e:
+        # Shed load quickly instead of queueing without bound
+        count_error('analyze', 503)
+        raise HTTPException(status_code=503, detail=str(e), headers={'Retry-After': str(e.retry_after)})
+    except ValueError as e:
+        # Unknown ?fields= (analysis errors reach here wrapped in Exception)
+        count_error('analyze', 400)
+        raise HTTPException(status_code=400, detail=str(e))
     except Exception as e:
         #Handle error
+        count_error('analyze', 500)
+        raise HTTPException(status_code=500, detail=str(e))
+    finally:
+        observe_phase('request', time.perf_counter() - started)
+        mark_handler_done()
+
+
+async def run_batch(items: List[Any]):
+    count_request('batch')
+    if len(items) > config.BATCH_MAX_ITEMS:
+        count_error('batch', 413)
+        raise HTTPException(status_code=413, detail=f"Batch has {len(items)} items, the limit is {config.BATCH_MAX_ITEMS}")
+    try:
+        # Invalid items and failed analyses are reported per item, not as a failed batch
+        result = await run_batch_analysis(items)
+
+        return {
+            'status': 'success',
+            'data': result
+        }
+    except Exception as e:
+        count_error('batch', 500)
+        raise HTTPException(status_code=500, detail=str(e))
+
+
+class DuplexStreamingResponse(StreamingResponse):
+    """
+    StreamingResponse that can be sent while the request body is still being read.
+    The stock one (ASGI < 2.4) listens for disconnects on receive() during the response,
+    which swallows request body chunks; here a disconnect surfaces from request.stream().
+    """
+
+    async def __call__(self, scope, receive, send):
+        await self.stream_response(send)
+
+
+class ServerTimingMiddleware:
+    """
+    ASGI middleware adding a Server-Timing header to responses of the given paths.
+    The ServerTiming it starts is filled in by the controller and service layer
+    through a context variable while the request is handled.
+    """
+
+    def __init__(self, app, paths=('/api/analyze',)):
+        self.app = app
+        self.paths = set(paths)
+
+    async def __call__(self, scope, receive, send):
+        if scope['type'] != 'http' or scope['path'] not in self.paths:
+            await self.app(scope, receive, send)
+            return
+
+        timing = start_timing()
+
+        async def send_with_timing(message):
+            if message['type'] == 'http.response.start':
+                headers = list(message.get('headers', []))
+                headers.append((b'server-timing', timing.header().encode('latin-1')))
+                message = {**message, 'headers': headers}
+            await send(message)
+
+        await self.app(scope, receive, send_with_timing)
+
+
+def stream_batch(request: Request):
+    count_request('stream')
+    # Body is consumed as it arrives, results are sent as they finish: one JSON object per line
+    return DuplexStreamingResponse(stream_batch_analysis(request.stream()), media_type='application/x-ndjson')
+
+
+def get_prometheus_metrics():
+    """Phase latency histograms and request/engine counters in Prometheus text format"""
+    return Response(render_metrics(), media_type='text/plain; version=0.0.4; charset=utf-8')
+
+
+def get_result_cache_stats():
+    """Hit/miss/eviction counters of the analysis result cache"""
+    return {
+        'status': 'success',
+        'data': get_cache_stats()
+    }
+
+
+def get_analysis_metrics():
+    """Queue depth, rejections and wait times of the analysis executor"""
+    return {
+        'status': 'success',
+        'data': get_analysis_stats()
+    }
+
+
+def get_stage_metrics():
+    """Per-stage cache counters and input dependencies of the staged engine"""
+    return {
+        'status': 'success',
+        'data': get_stage_stats()
+    }
+
+
+def get_analysis_fields():
+    """Output sections /api/analyze can select with ?fields=, and the rule layers each one needs"""
+    return {
+        'status': 'success',
+        'data': get_section_dependencies()
+    }
+
+
+def get_rule_profile_report(sort: str = "time", top: int = None):
+    """Aggregated per-rule profile (enable with MARX_PROFILE_RULES=1)"""
+    try:
+        return {
+            'status': 'success',
+            'data': get_rule_profile(sort, top)
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+
+
+def clear_rule_profile():
+    reset_rule_profile()
+    return {
+        'status': 'success',
+        'data': get_rule_profile()
+    }
+
+
+def get_layer_profile_report():
+    """Per-layer firing time and facts added (enable with MARX_PROFILE_LAYERS=1)"""
+    return {
+        'status': 'success',
+        'data': get_layer_report()
+    }
+
+
+def clear_layer_profile():
+    reset_layer_report()
+    return {
+        'status': 'success',
+        'data': get_layer_report()
+    }
+
+
+async def profile_layers(request: MarketingAnalysisRequest, engine: str = None):
+    """Layer breakdown of one uncached engine run for the given request"""
+    try:
+        # A full engine run, keep it off the event loop
+        result = await run_in_threadpool(profile_request_layers, request, engine)
+        return {
+            'status': 'success',
+            'data': result
+        }
+    except ValueError as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except Exception as e:
         raise HTTPException(status_code=500, detail=str(e))
 
 
+def get_engine_pool_metrics():
+    """Checkout and wait-time counters of the engine pools, per engine mode"""
+    return {
+        'status': 'success',
+        'data': get_engine_pool_stats()
+    }
+
+
 # def get_product_types():
 #     """Get all available product types"""
 #     return {
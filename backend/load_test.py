@@ -0,0 +1,282 @@
+"""
+Load-test the API under concurrent requests.
+
+Drives the FastAPI app in-process through an ASGI transport (no server needed), a
+locally spawned uvicorn, or any running server, with a fixed number of concurrent
+clients for a fixed duration. Reports throughput, latency percentiles and error
+rates per endpoint.
+
+Usage:
+    python load_test.py --concurrency 32 --duration 20
+    python load_test.py --target uvicorn --uvicorn-workers 2 --concurrency 64
+    python load_test.py --url http://127.0.0.1:8000 --mix analyze=8,batch=1,stats=1
+    python load_test.py --hot-fraction 0.9 --hot-scenarios 10 --output load.json
+
+The request mix sets how often each endpoint is called (analyze, batch, stream,
+stats); --hot-fraction sets the share of analyses drawn from a small set of
+repeated scenarios (cache hits, coalescing) against unique random ones. MARX_*
+environment variables configure the app under test as usual. In-process runs
+share one event loop and CPU with the load generator, so compare them with each
+other rather than with spawned-server numbers.
+"""
+import compat
+import argparse
+import asyncio
+import json
+import os
+import random
+import socket
+import subprocess
+import sys
+import time
+from collections import defaultdict
+
+import httpx
+
+from benchmark import percentile
+from models.model import ProductType
+from services.comprehensive_engine import BUDGET_TIER_LIMITS
+from services.decision_table import iter_scenario_keys
+
+ENDPOINTS = ("analyze", "batch", "stream", "stats")
+
+
+def parse_mix(text: str) -> dict:
+    """'analyze=8,batch=1' -> {'analyze': 8.0, 'batch': 1.0}"""
+    mix = {}
+    for part in text.split(","):
+        name, _, weight = part.partition("=")
+        name = name.strip()
+        if name not in ENDPOINTS:
+            raise argparse.ArgumentTypeError(f"Unknown endpoint {name!r}, expected one of {ENDPOINTS}")
+        mix[name] = float(weight or 1)
+    return mix
+
+
+class ScenarioSource:
+    """Request payloads: a share from a small hot set, the rest drawn from the whole input space"""
+
+    def __init__(self, products=None, hot_fraction: float = 0.0, hot_scenarios: int = 10, seed: int = 1):
+        self.keys = list(iter_scenario_keys(products))
+        self.random = random.Random(seed)
+        self.hot = self.random.sample(self.keys, min(hot_scenarios, len(self.keys)))
+        self.hot_fraction = hot_fraction
+
+    def payload(self) -> dict:
+        keys = self.hot if self.random.random() < self.hot_fraction else self.keys
+        product, customer, goal, horizon, content, sales, kpi, tier = self.random.choice(keys)
+        return {
+            "product_type": product,
+            "target_customer": customer,
+            "primary_goal": goal,
+            "time_horizon": horizon,
+            "content_capability": content,
+            "sales_structure": sales,
+            "priority_kpi": kpi,
+            # Any amount of the tier gives the same analysis; vary it like real traffic
+            "raw_budget_amount": _budget_for_tier(tier, self.random),
+        }
+
+
+def _budget_for_tier(tier: str, rng: random.Random) -> float:
+    """Random whole-dollar amount inside a budget tier"""
+    low = 1
+    for limit, limit_tier in BUDGET_TIER_LIMITS:
+        if limit_tier.value == tier:
+            return float(rng.randint(low, int(limit)))
+        low = int(limit) + 1
+    return float(rng.randint(low, low * 10))
+
+
+class Recorder:
+    def __init__(self):
+        self.latencies = defaultdict(list)
+        self.statuses = defaultdict(lambda: defaultdict(int))
+
+    def record(self, endpoint: str, status, seconds: float):
+        self.latencies[endpoint].append(seconds)
+        self.statuses[endpoint][str(status)] += 1
+
+    def report(self, elapsed: float) -> dict:
+        endpoints = {}
+        total = errors = 0
+        for endpoint, samples in self.latencies.items():
+            ordered = sorted(samples)
+            statuses = dict(self.statuses[endpoint])
+            failed = sum(count for status, count in statuses.items() if not status.startswith("2"))
+            total += len(ordered)
+            errors += failed
+            endpoints[endpoint] = {
+                "requests": len(ordered),
+                "throughput_per_s": round(len(ordered) / elapsed, 2),
+                "error_rate": round(failed / len(ordered), 4),
+                "statuses": statuses,
+                "p50_ms": round(percentile(ordered, 50) * 1000, 3),
+                "p90_ms": round(percentile(ordered, 90) * 1000, 3),
+                "p95_ms": round(percentile(ordered, 95) * 1000, 3),
+                "p99_ms": round(percentile(ordered, 99) * 1000, 3),
+                "max_ms": round(ordered[-1] * 1000, 3),
+            }
+        return {
+            "duration_s": round(elapsed, 3),
+            "requests": total,
+            "throughput_per_s": round(total / elapsed, 2) if elapsed else 0.0,
+            "error_rate": round(errors / total, 4) if total else 0.0,
+            "endpoints": endpoints,
+        }
+
+
+async def _call(client: httpx.AsyncClient, endpoint: str, source: ScenarioSource, batch_size: int):
+    if endpoint == "analyze":
+        return await client.post("/api/analyze", json=source.payload())
+    if endpoint == "batch":
+        return await client.post("/api/analyze/batch", json=[source.payload() for _ in range(batch_size)])
+    if endpoint == "stream":
+        body = "".join(json.dumps(source.payload()) + "\n" for _ in range(batch_size))
+        response = await client.post("/api/analyze/stream", content=body,
+                                     headers={"Content-Type": "application/x-ndjson"})
+        response.read()
+        return response
+    return await client.get("/api/analysis/stats")
+
+
+async def run_load(client: httpx.AsyncClient, mix: dict, concurrency: int, duration: float,
+                   source: ScenarioSource, batch_size: int = 20, seed: int = 1) -> dict:
+    """Closed loop: each of `concurrency` clients sends its next request as soon as the last one returns"""
+    recorder = Recorder()
+    endpoints = list(mix)
+    weights = [mix[name] for name in endpoints]
+    deadline = time.perf_counter() + duration
+
+    async def client_loop(rng: random.Random):
+        while time.perf_counter() < deadline:
+            endpoint = rng.choices(endpoints, weights)[0]
+            started = time.perf_counter()
+            try:
+                response = await _call(client, endpoint, source, batch_size)
+                status = response.status_code
+            except httpx.HTTPError as e:
+                status = type(e).__name__
+            recorder.record(endpoint, status, time.perf_counter() - started)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(client_loop(random.Random(seed + i)) for i in range(concurrency)))
+    return recorder.report(time.perf_counter() - started)
+
+
+def _free_port() -> int:
+    with socket.socket() as s:
+        s.bind(("127.0.0.1", 0))
+        return s.getsockname()[1]
+
+
+def spawn_uvicorn(workers: int = 1, port: int = None):
+    """Start uvicorn on the app in a child process; returns (process, base URL)"""
+    port = port or _free_port()
+    command = [sys.executable, "-m", "uvicorn", "app:app", "--host", "127.0.0.1", "--port", str(port),
+               "--workers", str(workers), "--log-level", "warning"]
+    process = subprocess.Popen(command, cwd=os.path.dirname(os.path.abspath(__file__)))
+    return process, f"http://127.0.0.1:{port}"
+
+
+async def wait_until_ready(base_url: str, process=None, timeout: float = 60.0):
+    deadline = time.perf_counter() + timeout
+    async with httpx.AsyncClient(base_url=base_url) as client:
+        while time.perf_counter() < deadline:
+            if process is not None and process.poll() is not None:
+                raise RuntimeError(f"uvicorn exited with status {process.returncode}")
+            try:
+                if (await client.get("/api/cache/stats")).status_code == 200:
+                    return
+            except httpx.HTTPError:
+                pass
+            await asyncio.sleep(0.2)
+    raise RuntimeError(f"Server at {base_url} did not become ready within {timeout}s")
+
+
+async def main_async(args) -> dict:
+    source = ScenarioSource(args.product, args.hot_fraction, args.hot_scenarios, args.seed)
+    limits = httpx.Limits(max_connections=args.concurrency, max_keepalive_connections=args.concurrency)
+    timeout = httpx.Timeout(args.timeout)
+
+    if args.url or args.target == "uvicorn":
+        process = None
+        base_url = args.url
+        if base_url is None:
+            process, base_url = spawn_uvicorn(args.uvicorn_workers)
+        try:
+            await wait_until_ready(base_url, process)
+            async with httpx.AsyncClient(base_url=base_url, limits=limits, timeout=timeout) as client:
+                return await run_load(client, args.mix, args.concurrency, args.duration, source,
+                                      args.batch_size, args.seed)
+        finally:
+            if process is not None:
+                process.terminate()
+                process.wait(timeout=30)
+
+    import app
+    # Run the app's startup/shutdown too, so engines and workers are warm as in a real server
+    async with app.lifespan(app.app):
+        transport = httpx.ASGITransport(app=app.app)
+        async with httpx.AsyncClient(transport=transport, base_url="http://marx.test", timeout=timeout) as client:
+            return await run_load(client, args.mix, args.concurrency, args.duration, source,
+                                  args.batch_size, args.seed)
+
+
+def print_report(report: dict):
+    print(f"\n{report['requests']} requests in {report['duration_s']:.1f}s: "
+          f"{report['throughput_per_s']:.1f} req/s, error rate {report['error_rate'] * 100:.2f}%")
+    print(f"  {'endpoint':<9} {'requests':>9} {'req/s':>8} {'errors':>7} {'p50':>9} {'p95':>9} {'p99':>9} {'max':>9}  (ms)")
+    for endpoint, stats in report["endpoints"].items():
+        print(f"  {endpoint:<9} {stats['requests']:>9} {stats['throughput_per_s']:>8.1f} "
+              f"{stats['error_rate'] * 100:>6.2f}% {stats['p50_ms']:>9.2f} {stats['p95_ms']:>9.2f} "
+              f"{stats['p99_ms']:>9.2f} {stats['max_ms']:>9.2f}")
+        failures = {status: count for status, count in stats["statuses"].items() if not status.startswith("2")}
+        if failures:
+            print(f"  {'':<9} non-2xx: {failures}")
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Concurrent load test of the MARX API")
+    parser.add_argument("--target", choices=["inprocess", "uvicorn"], default="inprocess",
+                        help="Drive the app in-process over ASGI, or spawn a local uvicorn")
+    parser.add_argument("--url", help="Load-test an already running server instead")
+    parser.add_argument("--uvicorn-workers", type=int, default=1)
+    parser.add_argument("--concurrency", type=int, default=16, help="Concurrent clients")
+    parser.add_argument("--duration", type=float, default=10.0, help="Seconds to generate load")
+    parser.add_argument("--mix", type=parse_mix, default={"analyze": 1.0},
+                        help="Endpoint weights, e.g. analyze=8,batch=1,stream=1,stats=1")
+    parser.add_argument("--batch-size", type=int, default=20, help="Items per batch/stream request")
+    parser.add_argument("--hot-fraction", type=float, default=0.0,
+                        help="Share of analyses drawn from the hot scenario set")
+    parser.add_argument("--hot-scenarios", type=int, default=10, help="Size of the hot scenario set")
+    parser.add_argument("--product", action="append", choices=[p.value for p in ProductType],
+                        help="Only draw scenarios for this product type (repeatable)")
+    parser.add_argument("--timeout", type=float, default=60.0, help="Per-request timeout in seconds")
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--output", help="Write the report as JSON")
+    args = parser.parse_args()
+
+    target = args.url or args.target
+    print(f"Load testing {target}: {args.concurrency} clients for {args.duration:g}s, mix {args.mix}", file=sys.stderr)
+    report = asyncio.run(main_async(args))
+    report["config"] = {
+        "target": target,
+        "concurrency": args.concurrency,
+        "duration": args.duration,
+        "mix": args.mix,
+        "batch_size": args.batch_size,
+        "hot_fraction": args.hot_fraction,
+        "hot_scenarios": args.hot_scenarios,
+        "seed": args.seed,
+    }
+    print_report(report)
+
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            json.dump(report, f, indent=2)
+        print(f"\nWrote {args.output}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
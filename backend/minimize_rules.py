@@ -0,0 +1,148 @@
+"""
+Build a minimized, output-equivalent rule set for the compiled engines.
+
+1. Static analysis (services/rule_graph.py): the fact-class dependency graph, rules that
+   cannot fire for any product type and rules whose facts never reach aggregation.
+2. Every scenario of the input space is run once with the full rule base, recording
+   each template and which rules fired. The budget amount only matters through its
+   tier, so the scenarios cover every possible request.
+3. Each remaining rule is dropped if the template of every scenario it fired in stays
+   the same without it. This finds rules that never fire, ChannelPriorityFact producers
+   that a higher layer always overrides, and intermediate facts that happen not to
+   change any recommendation (e.g. market maturity). --channel-rules only tries rules
+   that never fired and ChannelPriorityFact producers, which is quicker.
+4. The final rule set is checked against the recorded templates on every scenario.
+
+Usage:
+    python minimize_rules.py --output rule_set.json
+    python minimize_rules.py --graph rule_graph.json --channel-rules
+
+Then start the API with MARX_RULE_SET=rule_set.json
+"""
+import compat
+import argparse
+import hashlib
+import json
+import sys
+import time
+from array import array
+
+from models.intermediate_facts import ChannelPriorityFact
+from services.comprehensive_service import _build_template, _declare_and_run, request_for_scenario
+from services.decision_table import iter_scenario_keys
+from services.native_engine import NativeMarketingEngine
+from services.rule_compiler import compile_rule_base
+from services.rule_graph import build_rule_graph, unreachable_rules, unused_rules
+
+
+class _FiringEngine(NativeMarketingEngine):
+    """Native engine that remembers which rules fired in the last run"""
+
+    def reset(self):
+        super().reset()
+        self.fired_rules = set()
+
+    def restore(self, memory):
+        super().restore(memory)
+        self.fired_rules = set()
+
+    def _fire(self, rule, branch, fact_ids):
+        self.fired_rules.add(rule.name)
+        super()._fire(rule, branch, fact_ids)
+
+
+def _fingerprint(template) -> bytes:
+    return hashlib.md5(json.dumps(template.dict(), sort_keys=True).encode()).digest()
+
+
+def _run(engine, key) -> bytes:
+    request = request_for_scenario(key)
+    _declare_and_run(engine, request)
+    return _fingerprint(_build_template(engine, request))
+
+
+def record(rule_base, keys, progress_every=20000):
+    """Template fingerprint of every scenario, and rule name -> indexes of the scenarios it fired in"""
+    engine = _FiringEngine(rule_base)
+    fingerprints = []
+    fired = {rule.name: array("I") for rule in rule_base.rules}
+    started = time.perf_counter()
+    for i, key in enumerate(keys):
+        fingerprints.append(_run(engine, key))
+        for name in engine.fired_rules:
+            fired[name].append(i)
+        if progress_every and (i + 1) % progress_every == 0:
+            print(f"  {i + 1}/{len(keys)} scenarios ({(i + 1) / (time.perf_counter() - started):.0f}/s)", file=sys.stderr)
+    return fingerprints, fired
+
+
+def equivalent(rule_base, keys, fingerprints, indexes) -> bool:
+    """Whether the rule base reproduces the recorded template of every given scenario"""
+    engine = NativeMarketingEngine(rule_base)
+    return all(_run(engine, keys[i]) == fingerprints[i] for i in indexes)
+
+
+def minimize(channel_rules=False):
+    full = compile_rule_base()
+    graph = build_rule_graph(full)
+    removed = {name: "unreachable" for name in unreachable_rules(full)}
+    removed.update((name, "unused") for name in unused_rules(graph, removed))
+    print(f"{len(full.rules)} rules: {sum(r == 'unreachable' for r in removed.values())} unreachable, "
+          f"{sum(r == 'unused' for r in removed.values())} unused", file=sys.stderr)
+
+    # Templates are recorded with the full rule base, the reference every removal is checked against
+    keys = list(iter_scenario_keys())
+    print(f"Recording {len(keys)} scenarios", file=sys.stderr)
+    fingerprints, fired = record(full, keys)
+    current = full.subset([rule.name for rule in full.rules if rule.name not in removed])
+
+    # Facts are never retracted and NOT only tests inputs, so dropping a rule can only
+    # shrink the set of rules that fire: the recorded scenarios of a rule stay a superset
+    candidates = [
+        rule.name for rule in current.rules
+        if not channel_rules or ChannelPriorityFact in graph.produces[rule.name] or not fired[rule.name]
+    ]
+    print(f"Trying {len(candidates)} candidate rules", file=sys.stderr)
+    for name in candidates:
+        trial = current.subset([rule.name for rule in current.rules if rule.name != name])
+        if not fired[name]:
+            removed[name] = "never fires"
+        elif equivalent(trial, keys, fingerprints, fired[name]):
+            removed[name] = "no effect on output"
+        else:
+            continue
+        current = trial
+        print(f"  dropped {name} ({removed[name]}, fired in {len(fired[name])} scenarios)", file=sys.stderr)
+
+    print(f"Verifying {len(current.rules)} rules on every scenario", file=sys.stderr)
+    if not equivalent(current, keys, fingerprints, range(len(keys))):
+        raise RuntimeError("Minimized rule set changes some recommendation")
+    return current, removed, len(keys), graph
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Build a minimized, output-equivalent rule set")
+    parser.add_argument("--output", default="rule_set.json")
+    parser.add_argument("--graph", help="Also write the fact dependency graph to this JSON file")
+    parser.add_argument("--channel-rules", action="store_true",
+                        help="Only try dropping rules that never fired and ChannelPriorityFact producers (quicker)")
+    args = parser.parse_args()
+
+    started = time.perf_counter()
+    rule_base, removed, scenarios, graph = minimize(args.channel_rules)
+    with open(args.output, "w", encoding="utf-8") as f:
+        json.dump({
+            "scenarios": scenarios,
+            "rules": [rule.name for rule in rule_base.rules],
+            "removed": removed,
+        }, f, indent=2)
+    if args.graph:
+        with open(args.graph, "w", encoding="utf-8") as f:
+            json.dump(graph.to_dict(), f, indent=2)
+
+    print(f"{len(rule_base.rules)} of {len(rule_base.rules) + len(removed)} rules kept, "
+          f"written to {args.output} in {time.perf_counter() - started:.0f}s")
+
+
+if __name__ == "__main__":
+    main()
@@ -75,3 +75,61 @@ class MarketingRecommendation(BaseModel):
         default=[],
         description="Combined resources: recommended tools, required capabilities, potential partners, and cost-saving tips"
     )
+
+
+# === BUDGET-INVARIANT TEMPLATE ===
+# Everything in a MarketingRecommendation except the monthly amounts depends only on
+# the budget tier, so one template serves every budget inside that tier.
+
+class StrategyBudgetShare(BaseModel):
+    """Budget share of a strategy, before any amount is attached"""
+    strategy_code: str
+    percentage: float = Field(..., ge=0, le=100)
+
+class RecommendationTemplate(BaseModel):
+    """Recommendation with the monetary fields left unbound"""
+    recommended_strategies: List[str]
+    critical_insights: List[str]
+    budget_shares: List[StrategyBudgetShare]
+    channel_tactics: List[ChannelTactic]
+    action_plan: List[str] = []
+    resources: List[str] = []
+
+    def bind(self, monthly_budget: float) -> MarketingRecommendation:
+        """Fill in the monthly amounts for a concrete monthly budget"""
+        return MarketingRecommendation(
+            recommended_strategies=list(self.recommended_strategies),
+            critical_insights=list(self.critical_insights),
+            budget_allocation=self._budget_allocation(monthly_budget),
+            total_monthly_budget=monthly_budget,
+            channel_tactics=[tactic.copy() for tactic in self.channel_tactics],
+            action_plan=list(self.action_plan),
+            resources=list(self.resources)
+        )
+
+    def bind_fields(self, monthly_budget: float, fields) -> dict:
+        """
+        Only the given MarketingRecommendation fields, in model order, as plain values.
+        A template computed for some fields leaves the others empty, so it cannot bind
+        a full (validated) MarketingRecommendation.
+        """
+        values = {
+            "recommended_strategies": lambda: list(self.recommended_strategies),
+            "critical_insights": lambda: list(self.critical_insights),
+            "budget_allocation": lambda: [a.dict() for a in self._budget_allocation(monthly_budget)],
+            "total_monthly_budget": lambda: monthly_budget,
+            "channel_tactics": lambda: [tactic.dict() for tactic in self.channel_tactics],
+            "action_plan": lambda: list(self.action_plan),
+            "resources": lambda: list(self.resources),
+        }
+        return {name: values[name]() for name in MarketingRecommendation.__fields__ if name in fields}
+
+    def _budget_allocation(self, monthly_budget: float) -> List[BudgetAllocation]:
+        return [
+            BudgetAllocation(
+                strategy_code=share.strategy_code,
+                percentage=share.percentage,
+                monthly_amount=round(monthly_budget * (share.percentage / 100), 2)
+            )
+            for share in self.budget_shares
+        ]
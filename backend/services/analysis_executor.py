@@ -0,0 +1,127 @@
+"""
+Analysis Admission Control
+Analyses run on a dedicated executor (analysis threads or worker processes) with a
+bounded wait queue in front of it. When every worker is busy and the queue is full,
+new analyses are rejected immediately with AnalysisQueueFull instead of queueing
+without limit, so latency stays bounded under bursts. Queue depth and the time
+analyses spend waiting for a worker are recorded to size capacity.
+"""
+import asyncio
+import math
+import threading
+import time
+from concurrent.futures import Executor, Future
+from typing import Callable
+
+
+class AnalysisQueueFull(Exception):
+    """Every worker is busy and the wait queue is full; retry after `retry_after` seconds"""
+
+    def __init__(self, message: str, retry_after: int):
+        super().__init__(message)
+        self.retry_after = retry_after
+
+
+def timed_call(fn: Callable, submitted: float, *args):
+    """Run fn on a worker and report when it started; time.monotonic is comparable across processes"""
+    started = time.monotonic()
+    return started - submitted, fn(*args)
+
+
+class AnalysisAdmission:
+    """Bounded admission in front of an executor with `workers` workers"""
+
+    def __init__(self, workers: int, max_queue: int, retry_after: int = 1):
+        if workers < 1:
+            raise ValueError("Analysis executor needs at least one worker")
+        self.workers = workers
+        self.max_queue = max_queue
+        self.retry_after = retry_after
+        self._lock = threading.Lock()
+        self.in_flight = 0
+        self.max_queued = 0
+        self.admitted = 0
+        self.rejected = 0
+        self.completed = 0
+        self.failed = 0
+        self.cancelled = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        self.total_run = 0.0
+
+    @property
+    def queued(self) -> int:
+        return max(0, self.in_flight - self.workers)
+
+    def _admit(self):
+        with self._lock:
+            if self.in_flight >= self.workers + self.max_queue:
+                self.rejected += 1
+                raise AnalysisQueueFull(
+                    f"Analysis queue is full ({self.max_queue} waiting on {self.workers} workers)",
+                    self._retry_after_seconds(),
+                )
+            self.in_flight += 1
+            self.admitted += 1
+            self.max_queued = max(self.max_queued, self.queued)
+
+    def _retry_after_seconds(self) -> int:
+        # Roughly the time the current queue needs to drain, never below the configured floor
+        if not self.completed:
+            return self.retry_after
+        drain = self.queued * (self.total_run / self.completed) / self.workers
+        return max(self.retry_after, math.ceil(drain))
+
+    async def run(self, executor: Executor, fn: Callable, *args):
+        """Run fn(*args) on the executor if there is room, otherwise raise AnalysisQueueFull"""
+        self._admit()
+        submitted = time.monotonic()
+        try:
+            future = executor.submit(timed_call, fn, submitted, *args)
+        except BaseException:
+            self._release(None, submitted)
+            raise
+        # The slot is freed when the worker is really done, not when the caller stops waiting:
+        # a cancelled caller (client gone, stream closed) leaves a running analysis behind
+        future.add_done_callback(lambda f: self._release(f, submitted))
+        try:
+            wait, result = await asyncio.wrap_future(future)
+        except asyncio.CancelledError:
+            with self._lock:
+                self.cancelled += 1
+            raise
+        return result
+
+    def _release(self, future: Future, submitted: float):
+        elapsed = time.monotonic() - submitted
+        with self._lock:
+            self.in_flight -= 1
+            if future is None or future.cancelled():
+                # Never started (submit failed, or cancelled while still queued)
+                return
+            if future.exception() is not None:
+                self.failed += 1
+                return
+            wait = future.result()[0]
+            self.completed += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            self.total_run += max(0.0, elapsed - wait)
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {
+                "workers": self.workers,
+                "max_queue": self.max_queue,
+                "in_flight": self.in_flight,
+                "queue_depth": self.queued,
+                "max_queue_depth": self.max_queued,
+                "admitted": self.admitted,
+                "rejected": self.rejected,
+                "completed": self.completed,
+                "failed": self.failed,
+                "cancelled": self.cancelled,
+                "avg_wait_ms": round(self.total_wait / self.completed * 1000, 3) if self.completed else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+                "avg_run_ms": round(self.total_run / self.completed * 1000, 3) if self.completed else 0.0,
+            }
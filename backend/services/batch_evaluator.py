@@ -0,0 +1,616 @@
+"""
+Vectorized Batch Evaluator
+Scores a whole array of encoded scenarios in one pass with NumPy instead of
+running an engine per row.
+
+Every fact the compiled rule base can produce is an "atom" known ahead of time
+(input values, precomputed RHS facts, one RawBudget per budget tier), so a run
+is fully described per row by which atoms exist and in which order they appeared.
+Rule matching is kept as (rows x branches) matrices, updated from per-atom hit
+tables on every declaration, and each step fires the best activation of every
+row at once, using the same key as NativeMarketingEngine (salience, most recent
+facts, rule order).
+
+Channel facts are then resolved like _extract_strategy_codes (per channel: higher
+layer, then lower priority, first seen on ties) and _generate_budget_shares (top 7
+channel facts by priority), giving strategy codes and budget shares for every row.
+Rows the vectorized model cannot represent exactly fall back to the native engine.
+"""
+from dataclasses import dataclass
+from typing import Dict, Iterable, List, Optional, Tuple
+
+import numpy as np
+
+from experta.fact import InitialFact
+
+from models.model import (
+    ProductFact,
+    RawBudget,
+    TargetCustomerFact,
+    PrimaryGoalFact,
+    TimeHorizonFact,
+    ContentCapabilityFact,
+    SalesStructureFact,
+    PriorityKPIFact,
+    ProductType,
+    TargetCustomer,
+    SalesStructure,
+    TimeHorizon,
+    BudgetLevel,
+)
+from models.intermediate_facts import ChannelPriorityFact
+from models.output import StrategyBudgetShare
+from models.request import MarketingAnalysisRequest
+from services.comprehensive_engine import budget_tier_sample_amount, classify_budget_amount
+from services.comprehensive_service import (
+    CHANNEL_TO_STRATEGY,
+    STRATEGY_LABELS,
+    DEFAULT_STRATEGIES_BY_HORIZON,
+    ABM_PRODUCT_TYPES,
+    DEFAULT_STRATEGY_BUDGET,
+    FALLBACK_BUDGET_SHARES,
+    compute_template,
+)
+from services.decision_table import SCENARIO_DIMENSIONS
+from services.rule_compiler import CompiledRuleBase, compile_rule_base, fact_identity, record_effects
+
+STRATEGY_CODES = sorted(STRATEGY_LABELS)
+_STRATEGY_INDEX = {code: i for i, code in enumerate(STRATEGY_CODES)}
+
+# Column of each input in an encoded row, in SCENARIO_DIMENSIONS order
+PRODUCT, CUSTOMER, GOAL, HORIZON, CONTENT, SALES, KPI, TIER = range(len(SCENARIO_DIMENSIONS))
+
+# Input facts in the order comprehensive_service._run_engine declares them
+INPUT_FACTS = [
+    (PRODUCT, lambda v: ProductFact(product_type=v)),
+    (TIER, lambda v: RawBudget(amount=budget_tier_sample_amount(BudgetLevel(v)))),
+    (CUSTOMER, lambda v: TargetCustomerFact(customer=v)),
+    (GOAL, lambda v: PrimaryGoalFact(goal=v)),
+    (HORIZON, lambda v: TimeHorizonFact(horizon=v)),
+    (CONTENT, lambda v: ContentCapabilityFact(capability=v)),
+    (SALES, lambda v: SalesStructureFact(structure=v)),
+    (KPI, lambda v: PriorityKPIFact(kpi=v)),
+]
+
+TOP_CHANNELS = 7
+
+
+@dataclass
+class BatchResult:
+    """Per-row strategy codes and budget shares, as indexes into STRATEGY_CODES"""
+    # (N, 3) recommended strategies, in the order _extract_strategy_codes returns them
+    strategies: np.ndarray
+    # (N, 3) strategies of the budget shares, largest first; -1 where a row has fewer shares
+    share_strategies: np.ndarray
+    # (N, 3) percentage of each share
+    share_percentages: np.ndarray
+    # Rows that were evaluated by the native engine instead
+    fallback_rows: np.ndarray
+
+    def __len__(self) -> int:
+        return len(self.strategies)
+
+    def recommended_strategies(self, row: int) -> List[str]:
+        return [STRATEGY_LABELS[STRATEGY_CODES[i]] for i in self.strategies[row]]
+
+    def budget_shares(self, row: int) -> List[StrategyBudgetShare]:
+        return [
+            StrategyBudgetShare(
+                strategy_code=STRATEGY_LABELS[STRATEGY_CODES[code]],
+                percentage=float(pct)
+            )
+            for code, pct in zip(self.share_strategies[row], self.share_percentages[row])
+            if code >= 0
+        ]
+
+
+def encode_scenarios(scenarios: Iterable) -> np.ndarray:
+    """
+    Encode scenario keys (see comprehensive_service.scenario_key) or MarketingAnalysisRequests
+    as an (N, 8) array of enum positions in SCENARIO_DIMENSIONS order
+    """
+    positions = [{item.value: i for i, item in enumerate(enum)} for enum in SCENARIO_DIMENSIONS]
+    rows = []
+    for scenario in scenarios:
+        if isinstance(scenario, MarketingAnalysisRequest):
+            scenario = (
+                scenario.product_type.value,
+                scenario.target_customer.value,
+                scenario.primary_goal.value,
+                scenario.time_horizon.value,
+                scenario.content_capability.value,
+                scenario.sales_structure.value,
+                scenario.priority_kpi.value,
+                classify_budget_amount(scenario.raw_budget_amount).value,
+            )
+        rows.append([positions[d][value] for d, value in enumerate(scenario)])
+    return np.array(rows, dtype=np.int64).reshape(-1, len(SCENARIO_DIMENSIONS))
+
+
+class BatchEvaluator:
+    """Compiles the rule base into dense arrays once, then evaluates encoded scenarios in chunks"""
+
+    def __init__(self, rule_base: Optional[CompiledRuleBase] = None):
+        self.rule_base = rule_base or compile_rule_base()
+        self._compile_atoms()
+        self._compile_branches()
+        self._compile_channels()
+
+    # ------------------------------------------------------------------ compilation
+
+    def _atom(self, fact, identity=None) -> int:
+        identity = identity if identity is not None else fact_identity(fact)
+        idx = self._atom_index.get(identity)
+        if idx is None:
+            idx = len(self.atoms)
+            self._atom_index[identity] = idx
+            self.atoms.append(fact)
+        return idx
+
+    def _compile_atoms(self):
+        rb = self.rule_base
+        self.atoms = []
+        self._atom_index: Dict[frozenset, int] = {}
+        self._atom(InitialFact())
+
+        # atom of each value of each input dimension
+        self.input_atoms = [None] * len(SCENARIO_DIMENSIONS)
+        for dim, factory in INPUT_FACTS:
+            self.input_atoms[dim] = np.array(
+                [self._atom(factory(item.value)) for item in SCENARIO_DIMENSIONS[dim]], dtype=np.int64
+            )
+
+        self.static_effects = {}
+        for r_pos, rule in enumerate(rb.rules):
+            if rule.effects is not None:
+                self.static_effects[r_pos] = tuple(self._atom(f, i) for f, i in rule.effects)
+
+        # RHS with bindings: probe once per atom that can fill the bound pattern, until no new atoms appear
+        self.dynamic_effects: Dict[Tuple[int, int], Dict[int, Tuple[int, ...]]] = {}
+        for r_pos, rule in enumerate(rb.rules):
+            if rule.effects is not None:
+                continue
+            for b_pos, branch in enumerate(rule.branches):
+                bound = [p for p in branch.positive if rb.patterns[p].bindings]
+                if len(bound) != 1:
+                    raise NotImplementedError(
+                        f"Rule {rule.name}: batch evaluation needs all bindings on one pattern"
+                    )
+                self.dynamic_effects[(r_pos, b_pos)] = {}
+
+        probed = 0
+        while probed < len(self.atoms):
+            for a_idx in range(probed, len(self.atoms)):
+                fact = self.atoms[a_idx]
+                for (r_pos, b_pos), by_atom in self.dynamic_effects.items():
+                    rule = rb.rules[r_pos]
+                    for p_idx in rule.branches[b_pos].positive:
+                        pattern = rb.patterns[p_idx]
+                        if pattern.bindings and pattern.matches(fact):
+                            bindings = {var: fact[key] for var, key in pattern.bindings}
+                            by_atom[a_idx] = tuple(
+                                self._atom(f, i) for f, i in record_effects(rule.rhs, **bindings)
+                            )
+            probed = a_idx + 1
+
+        self.atom_patterns = [tuple(rb.matching_patterns(fact)) for fact in self.atoms]
+
+    def _compile_branches(self):
+        rb = self.rule_base
+        n_patterns = len(rb.patterns)
+        # Two extra pattern columns: PAD (never matched, id -1) and INITIAL (InitialFact, id 0)
+        self.pad_column = n_patterns
+        self.initial_column = n_patterns + 1
+
+        branches = [(r_pos, b_pos) for r_pos, rule in enumerate(rb.rules) for b_pos in range(len(rule.branches))]
+        self.branches = branches
+        width = rb.max_branch_facts
+
+        self.branch_columns = np.full((len(branches), width), self.pad_column, dtype=np.int64)
+        self.required_counts = np.zeros(len(branches), dtype=np.int8)
+        hits = [[] for _ in self.atoms]
+        blocks = [[] for _ in self.atoms]
+        for k, (r_pos, b_pos) in enumerate(branches):
+            branch = rb.rules[r_pos].branches[b_pos]
+            self.required_counts[k] = len(branch.positive)
+            columns = list(branch.positive) + ([self.initial_column] if branch.uses_initial_fact else [])
+            self.branch_columns[k, :len(columns)] = columns
+            for a_idx, patterns in enumerate(self.atom_patterns):
+                count = sum(1 for p in branch.positive if p in patterns)
+                if count:
+                    hits[a_idx].append((k, count))
+                if any(p in patterns for p in branch.negative):
+                    blocks[a_idx].append(k)
+
+        # atom -> branches whose positive patterns it satisfies (and how many), and branches it blocks
+        self.hit_ptr, self.hit_branch = _csr([[k for k, _ in h] for h in hits])
+        _, self.hit_count = _csr([[c for _, c in h] for h in hits])
+        self.block_ptr, self.block_branch = _csr(blocks)
+
+        most = max(len(p) for p in self.atom_patterns)
+        self.atom_pattern_table = np.full((len(self.atoms), max(most, 1)), -1, dtype=np.int64)
+        for a_idx, patterns in enumerate(self.atom_patterns):
+            self.atom_pattern_table[a_idx, :len(patterns)] = patterns
+
+        self._check_branch_collapse()
+
+        # Agenda key: salience | fact ids, most recent first (id + 1, 0 = none) | earlier rule | earlier branch
+        saliences = [rb.rules[r].salience for r, _ in branches]
+        low = min(saliences)
+        self.id_bits = (len(self.atoms) + 1).bit_length()
+        rule_bits = len(rb.rules).bit_length()
+        branch_bits = max(len(r.branches) for r in rb.rules).bit_length()
+        salience_bits = (max(saliences) - low).bit_length()
+        self.id_shift = rule_bits + branch_bits
+        if salience_bits + width * self.id_bits + self.id_shift > 62:
+            raise NotImplementedError("Agenda key does not fit in 64 bits")
+
+        self.base_keys = np.array([
+            ((rb.rules[r].salience - low) << (width * self.id_bits + self.id_shift))
+            | ((len(rb.rules) - 1 - rb.rules[r].index) << branch_bits)
+            | (len(rb.rules[r].branches) - 1 - b)
+            for r, b in branches
+        ], dtype=np.int64)
+
+        # Effects as rows of an atom table; dynamic branches look theirs up by the atom that filled the pattern
+        effect_rows = [()]
+        self.effect_row = np.zeros(len(branches), dtype=np.int64)
+        self.dynamic_slot = np.full(len(branches), -1, dtype=np.int64)
+        self.dynamic_pattern = []
+        dynamic_tables = []
+        for k, (r_pos, b_pos) in enumerate(branches):
+            if r_pos in self.static_effects:
+                effect_rows.append(self.static_effects[r_pos])
+                self.effect_row[k] = len(effect_rows) - 1
+            else:
+                table = np.zeros(len(self.atoms), dtype=np.int64)
+                for a_idx, effects in self.dynamic_effects[(r_pos, b_pos)].items():
+                    effect_rows.append(effects)
+                    table[a_idx] = len(effect_rows) - 1
+                branch = rb.rules[r_pos].branches[b_pos]
+                self.dynamic_slot[k] = len(dynamic_tables)
+                self.dynamic_pattern.append(next(p for p in branch.positive if rb.patterns[p].bindings))
+                dynamic_tables.append(table)
+        self.dynamic_pattern = np.array(self.dynamic_pattern, dtype=np.int64)
+        self.dynamic_tables = np.array(dynamic_tables, dtype=np.int64).reshape(-1, len(self.atoms))
+
+        longest = max(len(row) for row in effect_rows)
+        self.effects = np.full((len(effect_rows), max(longest, 1)), -1, dtype=np.int64)
+        for i, row in enumerate(effect_rows):
+            self.effects[i, :len(row)] = row
+
+    def _check_branch_collapse(self):
+        """
+        Engines keep one activation per rule and fact set. If two branches of a rule could match
+        the same facts with different NOT conditions, firing would depend on which one was queued first.
+        """
+        rb = self.rule_base
+        matchers = {}
+        for a_idx, patterns in enumerate(self.atom_patterns):
+            for p_idx in patterns:
+                matchers.setdefault(p_idx, set()).add(a_idx)
+
+        for rule in rb.rules:
+            for i, first in enumerate(rule.branches):
+                for second in rule.branches[i + 1:]:
+                    if set(first.negative) == set(second.negative):
+                        continue
+                    first_atoms = [matchers.get(p, set()) for p in first.positive]
+                    second_atoms = set().union(*[matchers.get(p, set()) for p in second.positive])
+                    first_union = set().union(*first_atoms)
+                    if all(a & second_atoms for a in first_atoms) and all(
+                        matchers.get(p, set()) & first_union for p in second.positive
+                    ):
+                        raise NotImplementedError(
+                            f"Rule {rule.name}: branches with different NOT conditions can share facts"
+                        )
+
+    def _compile_channels(self):
+        channel_atoms = [a for a, fact in enumerate(self.atoms) if isinstance(fact, ChannelPriorityFact)]
+        self.channel_atoms = np.array(channel_atoms, dtype=np.int64)
+        facts = [self.atoms[a] for a in channel_atoms]
+
+        names = sorted({f['channel'] for f in facts})
+        self.channel_names = names
+        self.channel_group = np.array([names.index(f['channel']) for f in facts], dtype=np.int64)
+        self.channel_priority = np.array([f['priority'] for f in facts], dtype=np.float64)
+        self.channel_layer = np.array([f.get('layer', 0) for f in facts], dtype=np.float64)
+        self.channel_budget = np.array([f.get('budget_percent', 0) for f in facts], dtype=np.float64)
+        self.channel_strategy = np.array(
+            [_STRATEGY_INDEX[CHANNEL_TO_STRATEGY[f['channel']]] if f['channel'] in CHANNEL_TO_STRATEGY else -1
+             for f in facts],
+            dtype=np.int64
+        )
+        self.group_strategy = np.array(
+            [_STRATEGY_INDEX[CHANNEL_TO_STRATEGY[n]] if n in CHANNEL_TO_STRATEGY else -1 for n in names],
+            dtype=np.int64
+        )
+
+    # ------------------------------------------------------------------ evaluation
+
+    def evaluate(self, encoded: np.ndarray, chunk_size: int = 4096) -> BatchResult:
+        """Evaluate an (N, 8) array from encode_scenarios()"""
+        encoded = np.asarray(encoded, dtype=np.int64).reshape(-1, len(SCENARIO_DIMENSIONS))
+        parts = []
+        for start in range(0, len(encoded), chunk_size):
+            parts.append(self._evaluate_chunk(encoded[start:start + chunk_size], start))
+
+        if not parts:
+            empty = np.zeros((0, 3), dtype=np.int64)
+            return BatchResult(empty, empty.copy(), np.zeros((0, 3)), np.zeros(0, dtype=np.int64))
+
+        return BatchResult(
+            strategies=np.concatenate([p[0] for p in parts]),
+            share_strategies=np.concatenate([p[1] for p in parts]),
+            share_percentages=np.concatenate([p[2] for p in parts]),
+            fallback_rows=np.concatenate([p[3] for p in parts]),
+        )
+
+    def _evaluate_chunk(self, codes: np.ndarray, offset: int):
+        present, fact_ids, conflict = self._run(codes)
+        strategies = self._strategy_codes(codes, present, fact_ids)
+        share_strategies, share_percentages = self._budget_shares(present, fact_ids, strategies)
+
+        fallback = np.nonzero(conflict)[0]
+        for row in fallback:
+            self._fill_from_engine(codes[row], row, strategies, share_strategies, share_percentages)
+        return strategies, share_strategies, share_percentages, fallback + offset
+
+    def _run(self, codes: np.ndarray):
+        """Forward chaining for all rows at once; returns atom presence, fact ids and rows to fall back"""
+        n = len(codes)
+        rows = np.arange(n)
+        n_patterns = len(self.rule_base.patterns)
+        n_branches = len(self.branches)
+        width = self.branch_columns.shape[1]
+
+        present = np.zeros((n, len(self.atoms)), dtype=bool)
+        fact_ids = np.full((n, len(self.atoms)), -1, dtype=np.int64)
+        pattern_atom = np.full((n, n_patterns + 2), -1, dtype=np.int64)
+        pattern_fact = np.full((n, n_patterns + 2), -1, dtype=np.int64)
+        pattern_fact[:, self.initial_column] = 0
+        next_id = np.zeros(n, dtype=np.int64)
+        conflict = np.zeros(n, dtype=bool)
+
+        # Branch match matrices: matched positive patterns, NOT conditions hit, and the agenda
+        # (key of every queued activation, -1 when the branch is not matched, blocked or fired)
+        matched = np.zeros((n, n_branches), dtype=np.int8)
+        blocked = np.zeros((n, n_branches), dtype=bool)
+        agenda = np.full((n, n_branches), -1, dtype=np.int64)
+
+        def queue(r, k):
+            # Fact ids of a branch are fixed once all its patterns matched, so its key is computed once
+            ids = np.sort(pattern_fact[r[:, None], self.branch_columns[k]], axis=1)[:, ::-1] + 1
+            key = self.base_keys[k].copy()
+            for j in range(width):
+                key |= ids[:, j] << (self.id_shift + (width - 1 - j) * self.id_bits)
+            agenda[r, k] = np.where(blocked[r, k], -1, key)
+
+        def declare(at_rows, atoms):
+            new = ~present[at_rows, atoms]
+            at_rows, atoms = at_rows[new], atoms[new]
+            if not len(at_rows):
+                return
+            ids = next_id[at_rows]
+            fact_ids[at_rows, atoms] = ids
+            next_id[at_rows] += 1
+            present[at_rows, atoms] = True
+            for column in self.atom_pattern_table[atoms].T:
+                has = column >= 0
+                r, p = at_rows[has], column[has]
+                # A pattern with two facts would need several activations per branch
+                conflict[r] |= pattern_atom[r, p] >= 0
+                pattern_atom[r, p] = atoms[has]
+                pattern_fact[r, p] = ids[has]
+
+            r, flat = _expand(at_rows, atoms, self.hit_ptr)
+            k = self.hit_branch[flat]
+            matched[r, k] += self.hit_count[flat].astype(np.int8)
+            complete = matched[r, k] == self.required_counts[k]
+
+            b_rows, b_flat = _expand(at_rows, atoms, self.block_ptr)
+            b_branches = self.block_branch[b_flat]
+            blocked[b_rows, b_branches] = True
+            agenda[b_rows, b_branches] = -1
+
+            if complete.any():
+                queue(r[complete], k[complete])
+
+        declare(rows, np.zeros(n, dtype=np.int64))
+        initial_only = np.nonzero(self.required_counts == 0)[0]
+        if len(initial_only):
+            queue(np.repeat(rows, len(initial_only)), np.tile(initial_only, n))
+        for dim, _ in INPUT_FACTS:
+            declare(rows, self.input_atoms[dim][codes[:, dim]])
+
+        alive = rows
+        while len(alive):
+            choice = agenda[alive].argmax(axis=1)
+            best = agenda[alive, choice]
+            keep = best >= 0
+            alive, chosen = alive[keep], choice[keep]
+            if not len(alive):
+                break
+            agenda[alive, chosen] = -1
+
+            effect_rows = self.effect_row[chosen]
+            slots = self.dynamic_slot[chosen]
+            dynamic = slots >= 0
+            if dynamic.any():
+                bound_atoms = pattern_atom[alive[dynamic], self.dynamic_pattern[slots[dynamic]]]
+                effect_rows[dynamic] = self.dynamic_tables[slots[dynamic], bound_atoms]
+
+            for column in self.effects[effect_rows].T:
+                has = column >= 0
+                declare(alive[has], column[has])
+
+        return present, fact_ids, conflict
+
+    def _strategy_codes(self, codes, present, fact_ids) -> np.ndarray:
+        n = len(codes)
+        rows = np.arange(n)
+        ch_present = present[:, self.channel_atoms]
+        ch_ids = fact_ids[:, self.channel_atoms]
+        n_groups = len(self.channel_names)
+        big = np.iinfo(np.int64).max
+
+        # STEP 1: best fact per channel (higher layer, then lower priority, first seen on ties)
+        best_priority = np.full((n, n_groups), np.inf)
+        first_seen = np.full((n, n_groups), big, dtype=np.int64)
+        for g in range(n_groups):
+            members = np.nonzero(self.channel_group == g)[0]
+            if not len(members):
+                continue
+            mp = ch_present[:, members]
+            order = np.lexsort((
+                np.where(mp, ch_ids[:, members], big).T,
+                np.broadcast_to(self.channel_priority[members][:, None], (len(members), n)),
+                np.broadcast_to(-self.channel_layer[members][:, None], (len(members), n)),
+                ~mp.T,
+            ), axis=0)[0]
+            has = mp.any(axis=1)
+            best_priority[has, g] = self.channel_priority[members][order[has]]
+            first_seen[has, g] = np.where(mp, ch_ids[:, members], big).min(axis=1)[has]
+
+        # STEP 2 + 3: by priority (dict order on ties), first three distinct strategies
+        order = np.lexsort((first_seen, best_priority), axis=1)
+        selected = np.zeros((n, len(STRATEGY_CODES)), dtype=bool)
+        count = np.zeros(n, dtype=np.int64)
+        for position in range(n_groups):
+            group = order[:, position]
+            strategy = self.group_strategy[group]
+            take = np.isfinite(best_priority[rows, group]) & (strategy >= 0) & (count < 3)
+            take &= ~selected[rows, np.maximum(strategy, 0)]
+            selected[rows[take], strategy[take]] = True
+            count += take
+
+        abm = (
+            np.isin(codes[:, PRODUCT], [_position(ProductType, p) for p in ABM_PRODUCT_TYPES])
+            & (codes[:, CUSTOMER] == _position(TargetCustomer, TargetCustomer.B2B_LARGE))
+            & (codes[:, SALES] == _position(SalesStructure, SalesStructure.SALES_TEAM))
+        )
+        selected[abm, _STRATEGY_INDEX["S7"]] = True
+
+        # Sorted codes first, then horizon defaults until there are three
+        chosen = np.full((n, 3), -1, dtype=np.int64)
+        filled = np.zeros(n, dtype=np.int64)
+        for s in range(len(STRATEGY_CODES)):
+            take = selected[:, s] & (filled < 3)
+            chosen[rows[take], filled[take]] = s
+            filled += take
+        for step in range(3):
+            defaults = np.array([
+                _STRATEGY_INDEX[DEFAULT_STRATEGIES_BY_HORIZON[h][step]] for h in TimeHorizon
+            ])[codes[:, HORIZON]]
+            take = (filled < 3) & ~selected[rows, defaults]
+            chosen[rows[take], filled[take]] = defaults[take]
+            selected[rows[take], defaults[take]] = True
+            filled += take
+        return chosen
+
+    def _budget_shares(self, present, fact_ids, strategies):
+        n = len(strategies)
+        rows = np.arange(n)
+        big = np.iinfo(np.int64).max
+        ch_present = present[:, self.channel_atoms]
+        ch_ids = np.where(ch_present, fact_ids[:, self.channel_atoms], big)
+
+        # Top channel facts by priority, in fact order on ties
+        priority = np.where(ch_present, self.channel_priority[None, :], np.inf)
+        top = np.lexsort((ch_ids, priority), axis=1)[:, :TOP_CHANNELS]
+        top_valid = np.take_along_axis(ch_present, top, axis=1)
+
+        sums = np.zeros((n, 3))
+        seen_at = np.full((n, 3), big, dtype=np.int64)
+        for position in range(top.shape[1]):
+            atom = top[:, position]
+            strategy = np.where(top_valid[:, position], self.channel_strategy[atom], -1)
+            budget = self.channel_budget[atom]
+            for slot in range(3):
+                hit = strategy == strategies[:, slot]
+                # Same summation order as the Python loop keeps float results identical
+                sums[hit, slot] = sums[hit, slot] + budget[hit]
+                seen_at[hit, slot] = np.minimum(seen_at[hit, slot], position)
+
+        has_channel = seen_at < big
+        defaults = np.array([DEFAULT_STRATEGY_BUDGET.get(code, 20) for code in STRATEGY_CODES], dtype=np.float64)
+        amounts = np.where(has_channel, sums, defaults[strategies])
+        # Insertion order of the strategy map: channel strategies as met, then defaults in recommended order
+        inserted = np.where(has_channel, seen_at, TOP_CHANNELS + np.arange(3)[None, :])
+
+        by_insertion = np.argsort(inserted, axis=1, kind='stable')
+        ordered = np.take_along_axis(amounts, by_insertion, axis=1)
+        total = np.zeros(n)
+        for slot in range(3):
+            value = ordered[:, slot]
+            total = np.where(value > 0, total + value, total)
+
+        ranking = np.lexsort((inserted, -amounts), axis=1)
+        share_amounts = np.take_along_axis(amounts, ranking, axis=1)
+        share_strategies = np.where(share_amounts > 0, np.take_along_axis(strategies, ranking, axis=1), -1)
+        with np.errstate(divide='ignore', invalid='ignore'):
+            ratios = (share_amounts / total[:, None]) * 100
+        share_percentages = np.where(share_strategies >= 0, _round1(ratios), 0.0)
+
+        empty = (share_strategies < 0).all(axis=1)
+        if empty.any():
+            share_strategies[empty] = [_STRATEGY_INDEX[code] for code, _ in FALLBACK_BUDGET_SHARES]
+            share_percentages[empty] = [pct for _, pct in FALLBACK_BUDGET_SHARES]
+
+        # Compact the kept shares to the left, keeping their order
+        compact = np.argsort(share_strategies < 0, axis=1, kind='stable')
+        return (np.take_along_axis(share_strategies, compact, axis=1),
+                np.take_along_axis(share_percentages, compact, axis=1))
+
+    def _fill_from_engine(self, code_row, row, strategies, share_strategies, share_percentages):
+        key = tuple(list(SCENARIO_DIMENSIONS[d])[c].value for d, c in enumerate(code_row))
+        request = MarketingAnalysisRequest(
+            product_type=key[PRODUCT],
+            target_customer=key[CUSTOMER],
+            primary_goal=key[GOAL],
+            time_horizon=key[HORIZON],
+            content_capability=key[CONTENT],
+            sales_structure=key[SALES],
+            priority_kpi=key[KPI],
+            raw_budget_amount=budget_tier_sample_amount(BudgetLevel(key[TIER])),
+        )
+        template = compute_template(request, "native")
+        label_index = {label: _STRATEGY_INDEX[code] for code, label in STRATEGY_LABELS.items()}
+        strategies[row] = [label_index[label] for label in template.recommended_strategies]
+        share_strategies[row] = -1
+        share_percentages[row] = 0.0
+        for slot, share in enumerate(template.budget_shares):
+            share_strategies[row, slot] = label_index[share.strategy_code]
+            share_percentages[row, slot] = share.percentage
+
+
+def _csr(lists):
+    """Flatten a list of lists into (offsets, values) arrays"""
+    ptr = np.zeros(len(lists) + 1, dtype=np.int64)
+    ptr[1:] = np.cumsum([len(items) for items in lists])
+    values = np.array([v for items in lists for v in items], dtype=np.int64)
+    return ptr, values
+
+
+def _expand(rows, atoms, ptr):
+    """Pair every row with each CSR entry of its atom; returns (row, entry index) arrays"""
+    starts = ptr[atoms]
+    lengths = ptr[atoms + 1] - starts
+    total = lengths.sum()
+    offsets = np.arange(total) - np.repeat(np.cumsum(lengths) - lengths, lengths)
+    return np.repeat(rows, lengths), np.repeat(starts, lengths) + offsets
+
+
+def _position(enum, member) -> int:
+    return list(enum).index(member)
+
+
+def _round1(values: np.ndarray) -> np.ndarray:
+    """Python's round(x, 1) (correctly rounded), applied once per distinct value"""
+    flat = values.ravel()
+    finite = np.isfinite(flat)
+    unique, inverse = np.unique(flat[finite], return_inverse=True)
+    rounded = np.array([round(float(v), 1) for v in unique])
+    out = np.zeros_like(flat)
+    out[finite] = rounded[inverse] if len(unique) else 0.0
+    return out.reshape(values.shape)
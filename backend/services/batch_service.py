@@ -0,0 +1,144 @@
+"""
+Batch Analysis Service
+Analyzes a list of request payloads in one call. Items are validated one by one, so
+an invalid item only fails itself; valid items are grouped by scenario key so each
+distinct scenario is analyzed once, and those analyses run concurrently on the
+analysis workers. Results come back in input order.
+
+stream_batch_analysis is the streaming variant for large jobs: NDJSON in and out.
+"""
+import asyncio
+import json
+from typing import Any, AsyncIterator, Dict, List, Tuple
+
+from pydantic import ValidationError
+
+from models.request import MarketingAnalysisRequest
+from services.comprehensive_service import (
+    get_template,
+    get_analysis_admission,
+    scenario_key,
+    _calculate_monthly_budget
+)
+
+
+def validate_item(item: Any) -> Tuple[MarketingAnalysisRequest, List[dict]]:
+    """Request for one payload, or None and the validation errors"""
+    if not isinstance(item, dict):
+        return None, [{"loc": [], "msg": "Item must be a JSON object"}]
+    try:
+        return MarketingAnalysisRequest(**item), []
+    except ValidationError as e:
+        return None, [{"loc": list(err["loc"]), "msg": err["msg"]} for err in e.errors()]
+
+
+def item_result(index: int, request: MarketingAnalysisRequest = None, template=None,
+                error: str = None, details: List[dict] = None) -> dict:
+    """Per-item entry of a batch response"""
+    if error is not None:
+        result = {"index": index, "status": "error", "error": error}
+        if details:
+            result["details"] = details
+        return result
+    return {
+        "index": index,
+        "status": "success",
+        "data": template.bind(_calculate_monthly_budget(request)).dict()
+    }
+
+
+async def run_batch_analysis(items: List[Any]) -> dict:
+    """Analyze every item; per-item errors never fail the batch"""
+    results: List[dict] = [None] * len(items)
+    requests: Dict[int, MarketingAnalysisRequest] = {}
+    by_scenario: Dict[tuple, List[int]] = {}
+
+    for index, item in enumerate(items):
+        request, errors = validate_item(item)
+        if request is None:
+            results[index] = item_result(index, error="Invalid request", details=errors)
+            continue
+        requests[index] = request
+        by_scenario.setdefault(scenario_key(request), []).append(index)
+
+    # One analysis per distinct scenario, at most one per worker at a time so a large
+    # batch does not fill the shared wait queue on its own
+    limit = asyncio.Semaphore(get_analysis_admission().workers)
+
+    async def analyze(key: tuple, indexes: List[int]):
+        async with limit:
+            try:
+                template = await get_template(requests[indexes[0]], key)
+            except Exception as e:
+                for index in indexes:
+                    results[index] = item_result(index, requests[index], error=str(e))
+                return
+        for index in indexes:
+            results[index] = item_result(index, requests[index], template)
+
+    await asyncio.gather(*(analyze(key, indexes) for key, indexes in by_scenario.items()))
+
+    return {
+        "items": len(items),
+        "unique_scenarios": len(by_scenario),
+        "errors": sum(1 for result in results if result["status"] == "error"),
+        "results": results,
+    }
+
+
+async def _iter_lines(chunks: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Non-empty lines of a byte stream, without holding more than one partial line"""
+    buffer = b""
+    async for chunk in chunks:
+        buffer += chunk
+        *lines, buffer = buffer.split(b"\n")
+        for line in lines:
+            if line.strip():
+                yield line
+    if buffer.strip():
+        yield buffer
+
+
+async def _analyze_line(index: int, line: bytes) -> dict:
+    try:
+        item = json.loads(line)
+    except ValueError as e:
+        return item_result(index, error=f"Invalid JSON: {e}")
+
+    request, errors = validate_item(item)
+    if request is None:
+        return item_result(index, error="Invalid request", details=errors)
+    try:
+        template = await get_template(request)
+    except Exception as e:
+        return item_result(index, request, error=str(e))
+    return item_result(index, request, template)
+
+
+async def stream_batch_analysis(chunks: AsyncIterator[bytes]) -> AsyncIterator[str]:
+    """
+    NDJSON in, NDJSON out: analyze one payload per input line and yield one result line
+    per item as soon as its analysis finishes (so in completion order, tagged with the
+    input index). At most one item per analysis worker is read ahead, which keeps memory
+    flat however long the stream is.
+    """
+    window = get_analysis_admission().workers
+    pending = set()
+    index = 0
+    try:
+        async for line in _iter_lines(chunks):
+            pending.add(asyncio.ensure_future(_analyze_line(index, line)))
+            index += 1
+            if len(pending) >= window:
+                done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    yield json.dumps(task.result()) + "\n"
+
+        while pending:
+            done, pending = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+            for task in done:
+                yield json.dumps(task.result()) + "\n"
+    finally:
+        # Client went away mid-stream: do not keep analyzing for nobody
+        for task in pending:
+            task.cancel()
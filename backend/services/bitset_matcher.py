@@ -0,0 +1,144 @@
+"""
+Bitset Rule Matcher
+Every compiled fact pattern gets one bit. A declared fact sets the bits of the
+patterns it satisfies (memoized per fact identity, so the seven one-hot input
+facts and all precomputed rule outputs are looked up once per process; the raw
+budget, one identity per amount, is matched every time), and each
+rule branch becomes a pair of required/forbidden masks checked with integer ANDs.
+
+Agenda order is the one NativeMarketingEngine uses, so the facts handed to
+_aggregate_recommendations are identical.
+"""
+import heapq
+from dataclasses import dataclass, field, replace
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from experta import Fact
+
+from models.model import RawBudget
+from services.native_engine import NativeMarketingEngine, WorkingMemory
+from services.rule_compiler import CompiledRuleBase, compile_rule_base, fact_identity
+
+
+@dataclass
+class BitsetRuleBase:
+    rule_base: CompiledRuleBase
+    # [rule position][branch position] -> mask of positive / negated patterns
+    required: List[Tuple[int, ...]]
+    forbidden: List[Tuple[int, ...]]
+    # pattern bit -> [(rule position, branch position)] with the pattern on the positive side
+    triggers: Dict[int, List[Tuple[int, int]]]
+    # Fact identity -> indexes of the patterns it satisfies, shared by all engines.
+    # Raw budgets are left out: every distinct amount would add an entry for good.
+    pattern_memo: Dict[frozenset, Tuple[int, ...]] = field(default_factory=dict)
+
+    def patterns_for(self, fact: Fact, identity: frozenset) -> Tuple[int, ...]:
+        pattern_indexes = self.pattern_memo.get(identity)
+        if pattern_indexes is None:
+            pattern_indexes = tuple(self.rule_base.matching_patterns(fact))
+            if not isinstance(fact, RawBudget):
+                self.pattern_memo[identity] = pattern_indexes
+        return pattern_indexes
+
+
+@lru_cache(maxsize=None)
+def compile_bitsets(rule_base: CompiledRuleBase) -> BitsetRuleBase:
+    """Precompute the required/forbidden masks of every rule branch"""
+    required = []
+    forbidden = []
+    for rule in rule_base.rules:
+        required.append(tuple(_mask(b.positive) for b in rule.branches))
+        forbidden.append(tuple(_mask(b.negative) for b in rule.branches))
+
+    triggers: Dict[int, List[Tuple[int, int]]] = {}
+    for p_idx, uses in rule_base.pattern_uses.items():
+        seen = []
+        for r_pos, b_pos, _ in uses:
+            if (r_pos, b_pos) not in seen:
+                seen.append((r_pos, b_pos))
+        triggers[p_idx] = seen
+
+    return BitsetRuleBase(rule_base, required, forbidden, triggers)
+
+
+def _mask(pattern_indexes) -> int:
+    mask = 0
+    for p_idx in pattern_indexes:
+        mask |= 1 << p_idx
+    return mask
+
+
+class BitsetMarketingEngine(NativeMarketingEngine):
+    """NativeMarketingEngine with bit-mask matching instead of per-pattern fact lists"""
+
+    def __init__(self, rule_base: CompiledRuleBase = None):
+        super().__init__(rule_base or compile_rule_base())
+        self.bitsets = compile_bitsets(self.rule_base)
+        self.state = 0
+
+    def reset(self):
+        self.state = 0
+        super().reset()
+
+    def snapshot(self) -> WorkingMemory:
+        return replace(super().snapshot(), state=self.state)
+
+    def restore(self, memory: WorkingMemory):
+        super().restore(memory)
+        self.state = memory.state
+
+    def run(self, steps=float('inf')):
+        rules = self.rule_base.rules
+        forbidden = self.bitsets.forbidden
+        agenda = self._agenda
+
+        self.running = True
+        while steps > 0 and self.running and agenda:
+            _, _, r_pos, b_pos, fact_ids = heapq.heappop(agenda)
+            if self.state & forbidden[r_pos][b_pos]:
+                continue
+
+            steps -= 1
+            self.fired += 1
+            rule = rules[r_pos]
+            self._fire(rule, rule.branches[b_pos], fact_ids)
+
+        self.running = False
+
+    def _declare(self, fact: Fact, identity=None) -> Fact:
+        if identity is None:
+            identity = fact_identity(fact)
+        if identity in self._identities:
+            return fact
+        self._identities.add(identity)
+
+        fact_id = len(self.facts)
+        self.facts[fact_id] = fact
+
+        pattern_indexes = self.bitsets.patterns_for(fact, identity)
+        for p_idx in pattern_indexes:
+            self._matches[p_idx].append(fact_id)
+            self.state |= 1 << p_idx
+
+        required = self.bitsets.required
+        forbidden = self.bitsets.forbidden
+        state = self.state
+        for p_idx in pattern_indexes:
+            for r_pos, b_pos in self.bitsets.triggers.get(p_idx, ()):
+                need = required[r_pos][b_pos]
+                if state & need != need or state & forbidden[r_pos][b_pos]:
+                    continue
+                self._activate_branch(r_pos, b_pos, fact_id)
+        return fact
+
+    def _activate_branch(self, r_pos: int, b_pos: int, fact_id: int):
+        branch = self.rule_base.rules[r_pos].branches[b_pos]
+        matches = self._matches
+        if all(len(matches[p]) == 1 for p in branch.positive):
+            # Common case: each pattern has exactly one fact, a single activation
+            self._push(r_pos, b_pos, tuple(matches[p][0] for p in branch.positive))
+            return
+        for slot, p_idx in enumerate(branch.positive):
+            if matches[p_idx][-1] == fact_id:
+                self._activate(r_pos, b_pos, slot, fact_id)
@@ -3,15 +3,79 @@ Comprehensive Marketing Expert System with Layered Forward Chaining
 100+ rules organized in 10 layers for systematic inference
 """
 from experta import KnowledgeEngine, Rule, MATCH, AND, OR, NOT
+from experta.agenda import Agenda
+from services.shared_rete import SharedReteMatcher
 from models.model import *
 from models.intermediate_facts import *
 from models.output import *
 from typing import List, Dict
 
+# Inclusive upper bound (USD) of each budget tier; anything above the last one is enterprise
+BUDGET_TIER_LIMITS = [
+    (1000, BudgetLevel.MICRO),
+    (10000, BudgetLevel.SMALL),
+    (100000, BudgetLevel.MEDIUM),
+    (1000000, BudgetLevel.LARGE),
+]
+
+
+def classify_budget_amount(amount: float) -> BudgetLevel:
+    """Map a raw budget amount onto its BudgetLevel tier"""
+    for limit, tier in BUDGET_TIER_LIMITS:
+        if amount <= limit:
+            return tier
+    return BudgetLevel.ENTERPRISE
+
+
+def budget_tier_sample_amount(tier: BudgetLevel) -> float:
+    """Representative amount inside a tier (its upper bound, 10x the last bound for enterprise)"""
+    for limit, limit_tier in BUDGET_TIER_LIMITS:
+        if limit_tier == tier:
+            return float(limit)
+    return float(BUDGET_TIER_LIMITS[-1][0] * 10)
+
+
+class CountingAgenda(Agenda):
+    """Agenda that counts the activations handed out for firing"""
+
+    def __init__(self, activations=()):
+        super().__init__()
+        self.activations = list(activations)
+        self.fired = 0
+
+    def get_next(self):
+        activation = super().get_next()
+        if activation is not None:
+            self.fired += 1
+        return activation
+
+
 class ComprehensiveMarketingEngine(KnowledgeEngine):
+    # Rete network is compiled once per process and copied per engine
+    __matcher__ = SharedReteMatcher
 
     def __init__(self):
         super().__init__()
+        self.agenda = CountingAgenda(self.agenda.activations)
+        self.clear_recommendations()
+
+    def reset(self, **kwargs):
+        """Reset working memory and the per-instance recommendation storage (engines are reused)"""
+        super().reset(**kwargs)
+        # KnowledgeEngine.reset builds a plain Agenda (already holding InitialFact's activations)
+        self.agenda = CountingAgenda(self.agenda.activations)
+        self.clear_recommendations()
+
+    @property
+    def fired(self) -> int:
+        """Rules fired since the last reset, like the compiled engines' counter"""
+        return self.agenda.fired
+
+    def release(self):
+        """Called when a pooled engine is handed back"""
+        self.clear_recommendations()
+
+    def clear_recommendations(self):
         # Storage for recommendations
         self.channel_recommendations = []
         self.content_recommendations = []
@@ -42,16 +106,7 @@ class ComprehensiveMarketingEngine(KnowledgeEngine):
     @Rule(RawBudget(amount=MATCH.a))
     def classify_budget(self, a):
         """Rule 1: Classify budget into tiers"""
-        if a <= 1000:
-            self.declare(BudgetLevelFact(tier=BudgetLevel.MICRO.value))
-        elif a <= 10000:
-            self.declare(BudgetLevelFact(tier=BudgetLevel.SMALL.value))
-        elif a <= 100000:
-            self.declare(BudgetLevelFact(tier=BudgetLevel.MEDIUM.value))
-        elif a <= 1000000:
-            self.declare(BudgetLevelFact(tier=BudgetLevel.LARGE.value))
-        else:
-            self.declare(BudgetLevelFact(tier=BudgetLevel.ENTERPRISE.value))
+        self.declare(BudgetLevelFact(tier=classify_budget_amount(a).value))
 
     # ==================== LAYER 1: Market Context Analysis ====================
     # Fire ProductFact 
@@ -2,12 +2,40 @@
 Simplified Comprehensive Marketing Analysis Service
 Produces concise, actionable recommendations for university project
 """
-from services.comprehensive_engine import ComprehensiveMarketingEngine
+import hashlib
+import inspect
+import threading
+import time
+import traceback
+from collections import defaultdict
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+from functools import lru_cache
+
+import config
+from services.comprehensive_engine import ComprehensiveMarketingEngine, classify_budget_amount, budget_tier_sample_amount
 from models.model import *
 from models.request import MarketingAnalysisRequest
+import models.output
 from models.output import *
 from models.intermediate_facts import *
-from collections import defaultdict
+from services.analysis_executor import AnalysisAdmission, AnalysisQueueFull
+from services.bitset_matcher import BitsetMarketingEngine
+from services.decision_table import DecisionTable
+from services.engine_pool import EnginePool
+from services.metrics import observe_phase, record_engine_run
+from services.native_engine import NativeMarketingEngine
+from services.process_backend import ProcessBackend
+from services.product_engines import product_rule_base
+from services.result_cache import ResultCache
+from services.rule_compiler import CompiledRuleBase, compile_rule_base
+from services.rule_graph import SECTIONS, minimized_rule_base, section_dependencies, section_rule_base
+from services.rule_layers import describe_layers, get_layer_profile, layers_of_run
+from services.rule_profiler import PROFILED_ENGINE_CLASSES, get_rule_profiler, profiling_enabled
+from services.server_timing import record_cache, record_timing
+from services.single_flight import SingleFlight
+from services.staged_engine import StagedMarketingEngine, get_stage_cache_stats, stage_dependencies
+from services.warm_fork import WarmForks, declare_prefix
 
 # Channel to Strategy Code Mapping
 CHANNEL_TO_STRATEGY = {
@@ -39,48 +67,534 @@ STRATEGY_LABELS = {
     "S9": "S9 - Influencer/Partnership Marketing",
 }
 
+# Fill-in strategies when fewer than three come out of the rules, by time horizon
+DEFAULT_STRATEGIES_BY_HORIZON = {
+    TimeHorizon.SHORT: ["S2", "S3", "S4"],   # Short-term: favor paid channels over SEO (PPC, Social, Email)
+    TimeHorizon.MEDIUM: ["S2", "S5", "S1"],  # Medium: balanced (PPC, Content, SEO)
+    TimeHorizon.LONG: ["S1", "S5", "S2"],    # Long-term: favor organic channels (SEO, Content, PPC)
+}
+
+# ABM (S7) is added for large B2B customers of these products when there is a sales team
+ABM_PRODUCT_TYPES = [ProductType.B2B_SAAS, ProductType.CONSULTING]
+
+# Default percentages for recommended strategies without channel facts
+DEFAULT_STRATEGY_BUDGET = {
+    "S1": 20, "S2": 35, "S3": 30, "S4": 20, "S5": 25,
+    "S6": 25, "S7": 30, "S8": 25, "S9": 20
+}
+
+# Allocation used when no strategy ends up with a positive share
+FALLBACK_BUDGET_SHARES = [
+    ("S2", 40),
+    ("S3", 35),
+    ("S5", 25)
+]
+
+
+ENGINE_CLASSES = {
+    "native": NativeMarketingEngine,
+    "bitset": BitsetMarketingEngine,
+    "staged": StagedMarketingEngine,
+    "experta": ComprehensiveMarketingEngine,
+}
+
+_decision_table = None
+_decision_table_loaded = False
+_result_cache = ResultCache(config.RESULT_CACHE_SIZE, config.RESULT_CACHE_TTL)
+_single_flight = SingleFlight()
+_warm_forks = WarmForks(config.WARM_FORK_CACHE_SIZE)
+_engine_pools = {}
+_engine_pools_lock = threading.Lock()
+_process_backend = None
+_process_backend_lock = threading.Lock()
+_analysis_threads = None
+_analysis_admission = None
+_analysis_lock = threading.Lock()
+
+ANALYSIS_BACKENDS = ("thread", "process")
+# Engine modes that get one engine pool per product type, each engine running only the
+# rules that can fire for that product (MARX_PRODUCT_ENGINES, see product_engines), and
+# that run the minimized rule set if one is configured (MARX_RULE_SET, see rule_graph)
+PRODUCT_ENGINE_MODES = ("native", "bitset")
+
+
+def scenario_key(request: MarketingAnalysisRequest) -> tuple:
+    """Canonical key of a request: the seven enum inputs plus the budget tier"""
+    return (
+        request.product_type.value,
+        request.target_customer.value,
+        request.primary_goal.value,
+        request.time_horizon.value,
+        request.content_capability.value,
+        request.sales_structure.value,
+        request.priority_kpi.value,
+        classify_budget_amount(request.raw_budget_amount).value,
+    )
+
+
+def request_for_scenario(key: tuple) -> MarketingAnalysisRequest:
+    """Inverse of scenario_key: a request with the key's inputs and a representative budget of its tier"""
+    product, customer, goal, horizon, content, sales, kpi, tier = key
+    return MarketingAnalysisRequest(
+        product_type=product,
+        target_customer=customer,
+        primary_goal=goal,
+        time_horizon=horizon,
+        content_capability=content,
+        sales_structure=sales,
+        priority_kpi=kpi,
+        raw_budget_amount=budget_tier_sample_amount(BudgetLevel(tier)),
+    )
+
+
+def get_decision_table():
+    """Load the prebuilt decision table once, if one is configured"""
+    global _decision_table, _decision_table_loaded
+    if not _decision_table_loaded:
+        _decision_table_loaded = True
+        if config.DECISION_TABLE_PATH:
+            _decision_table = DecisionTable.load(config.DECISION_TABLE_PATH, aggregation_fingerprint())
+    return _decision_table
+
+
+@lru_cache(maxsize=None)
+def aggregation_fingerprint() -> str:
+    """
+    Hash of the code that turns inferred facts into a RecommendationTemplate: the input
+    declaration order, the aggregation functions, the strategy mappings and the output models.
+    A decision table stores it so that a change to any of them invalidates the table.
+    """
+    functions = [
+        _declare_inputs, _build_template, _extract_strategy_codes, _generate_critical_insights,
+        _generate_budget_shares, _generate_channel_tactics, _get_tactic_for_strategy,
+        _get_default_tactics, _build_action_plan, _build_resources,
+    ]
+    mappings = [
+        CHANNEL_TO_STRATEGY, STRATEGY_LABELS, DEFAULT_STRATEGIES_BY_HORIZON, ABM_PRODUCT_TYPES,
+        DEFAULT_STRATEGY_BUDGET, FALLBACK_BUDGET_SHARES,
+    ]
+    digest = hashlib.sha256()
+    for function in functions:
+        digest.update(inspect.getsource(function).encode())
+    digest.update(inspect.getsource(models.output).encode())
+    digest.update(repr(mappings).encode())
+    return digest.hexdigest()
+
+
+def get_cache_stats() -> dict:
+    """Counters of the in-process result cache"""
+    return _result_cache.stats()
+
+
+def get_engine_pool(mode: str = None, product: str = None) -> EnginePool:
+    """
+    Pool of pre-built engines for an engine mode, created (and warmed) on first use.
+    With product engines enabled, modes in PRODUCT_ENGINE_MODES have a pool per product type.
+    """
+    mode = mode or config.ENGINE_MODE
+    if not (config.PRODUCT_ENGINES and mode in PRODUCT_ENGINE_MODES):
+        product = None
+    key = f"{mode}:{product}" if product else mode
+    pool = _engine_pools.get(key)
+    if pool is None:
+        with _engine_pools_lock:
+            pool = _engine_pools.get(key)
+            if pool is None:
+                pool = EnginePool(lambda: _new_engine(mode, product), config.ENGINE_POOL_SIZE, config.ENGINE_POOL_TIMEOUT)
+                _engine_pools[key] = pool
+    return pool
+
+
+def warm_engine_pools(mode: str = None):
+    """Build the engine pools a mode serves from: one, or one per product type"""
+    for product in ProductType:
+        get_engine_pool(mode, product.value)
+
+
+def get_engine_pool_stats() -> dict:
+    """Checkout and wait-time counters of every engine pool in use ("mode:product" for product engines)"""
+    return {mode: pool.stats() for mode, pool in list(_engine_pools.items())}
+
+
+def get_stage_stats() -> dict:
+    """Per-stage cache counters of the staged engine (MARX_ENGINE=staged) and each stage's declared inputs"""
+    caches = get_stage_cache_stats()
+    return {
+        "stages": [{**stage, "cache": caches.get(stage["stage"])} for stage in stage_dependencies()],
+    }
+
+
+def get_process_backend() -> ProcessBackend:
+    """Worker processes of the process backend, created on first use"""
+    global _process_backend
+    if _process_backend is None:
+        with _process_backend_lock:
+            if _process_backend is None:
+                _process_backend = ProcessBackend(config.PROCESS_WORKERS, config.ENGINE_MODE)
+    return _process_backend
+
+
+def get_analysis_threads() -> ThreadPoolExecutor:
+    """Dedicated executor for thread-backend analyses, not shared with the loop's default pool"""
+    global _analysis_threads
+    if _analysis_threads is None:
+        with _analysis_lock:
+            if _analysis_threads is None:
+                _analysis_threads = ThreadPoolExecutor(config.ANALYSIS_WORKERS, thread_name_prefix="marx-analysis")
+    return _analysis_threads
+
+
+def get_analysis_admission() -> AnalysisAdmission:
+    """Bounded wait queue in front of the configured backend's workers"""
+    global _analysis_admission
+    if _analysis_admission is None:
+        with _analysis_lock:
+            if _analysis_admission is None:
+                workers = config.PROCESS_WORKERS if config.ANALYSIS_BACKEND == "process" else config.ANALYSIS_WORKERS
+                _analysis_admission = AnalysisAdmission(workers, config.ANALYSIS_QUEUE_SIZE, config.ANALYSIS_RETRY_AFTER)
+    return _analysis_admission
+
+
+def get_analysis_stats() -> dict:
+    """Queue depth, rejections and wait/run times of the analysis executor"""
+    return {
+        "backend": config.ANALYSIS_BACKEND,
+        **get_analysis_admission().stats(),
+        "single_flight": _single_flight.stats(),
+        # Snapshots used by this process's compiled engines (the process backend's workers keep their own)
+        "warm_fork": _warm_forks.stats(),
+    }
+
+
+def start_analysis_backend():
+    """Warm up the configured backend before serving: worker processes or the engine pool"""
+    if config.ANALYSIS_BACKEND not in ANALYSIS_BACKENDS:
+        raise ValueError(f"Unknown analysis backend {config.ANALYSIS_BACKEND!r}, expected one of {ANALYSIS_BACKENDS}")
+    if profiling_enabled() and config.ENGINE_MODE not in PROFILED_ENGINE_CLASSES:
+        # The staged engine replays cached activations: profiling it would silently record nothing
+        raise ValueError(f"MARX_PROFILE_RULES / MARX_PROFILE_LAYERS need MARX_ENGINE in {sorted(PROFILED_ENGINE_CLASSES)}, "
+                         f"not {config.ENGINE_MODE!r}")
+    if config.ANALYSIS_BACKEND == "process":
+        get_process_backend().start()
+    else:
+        get_analysis_threads()
+        warm_engine_pools()
+
+
+def get_rule_profile(sort: str = "time", top: int = None) -> dict:
+    """Per-rule activation/firing/time totals of this process (MARX_PROFILE_RULES=1)"""
+    return {"enabled": config.PROFILE_RULES, **get_rule_profiler().report(sort, top)}
+
+
+def reset_rule_profile():
+    get_rule_profiler().reset()
+
+
+def get_layer_report() -> dict:
+    """Per-layer firing time and facts added over every run of this process (MARX_PROFILE_LAYERS=1)"""
+    return {"enabled": config.PROFILE_LAYERS, **get_layer_profile().report()}
+
+
+def reset_layer_report():
+    get_layer_profile().reset()
+
+
+def profile_request_layers(request: MarketingAnalysisRequest, mode: str = None) -> dict:
+    """
+    Run one request on a fresh profiled engine, bypassing every cache, and break the
+    run down by layer. Works whether or not profiling is enabled.
+    """
+    mode = mode or config.ENGINE_MODE
+    if mode == "staged":
+        raise ValueError("The staged engine replays cached activations and cannot be layer-profiled, "
+                         f"pick one of {sorted(PROFILED_ENGINE_CLASSES)}")
+    if mode not in PROFILED_ENGINE_CLASSES:
+        raise ValueError(f"Unknown engine mode {mode!r}, expected one of {sorted(PROFILED_ENGINE_CLASSES)}")
+    engine = PROFILED_ENGINE_CLASSES[mode]()
+    engine.record_runs = False
+
+    started = time.perf_counter()
+    _declare_and_run(engine, request)
+    elapsed = time.perf_counter() - started
+    return {
+        "engine": mode,
+        "run_ms": round(elapsed * 1000, 4),
+        "rules_fired": engine.fired,
+        "facts": len(engine.facts),
+        "layers": describe_layers(layers_of_run(engine.last_run_counters)),
+    }
+
+
+def stop_analysis_backend():
+    """Shut down worker processes and analysis threads, if any were started"""
+    if config.PROFILE_RULES and config.RULE_PROFILE_PATH:
+        get_rule_profiler().dump(config.RULE_PROFILE_PATH)
+    if _process_backend is not None:
+        _process_backend.shutdown()
+    if _analysis_threads is not None:
+        _analysis_threads.shutdown(wait=True, cancel_futures=True)
+
+
+async def compute_template_async(request: MarketingAnalysisRequest, sections: tuple = None) -> tuple:
+    """
+    compute_template_timed off the event loop, on the configured backend: the template and
+    the run's (inference seconds, aggregation seconds, facts, rules fired).
+    Raises AnalysisQueueFull when the backend is saturated.
+    """
+    if config.ANALYSIS_BACKEND == "process":
+        template, run_stats = await get_process_backend().compute_template(request, get_analysis_admission(), sections)
+    elif config.ANALYSIS_BACKEND == "thread":
+        # engine.run() is CPU-bound, keep it off the event loop on the dedicated analysis threads
+        template, run_stats = await get_analysis_admission().run(
+            get_analysis_threads(), compute_template_timed, request, None, sections)
+    else:
+        raise ValueError(f"Unknown analysis backend {config.ANALYSIS_BACKEND!r}, expected one of {ANALYSIS_BACKENDS}")
+    record_engine_run(*run_stats)
+    return template, run_stats
+
+
+async def get_template(request: MarketingAnalysisRequest, key: tuple = None, sections: tuple = None) -> RecommendationTemplate:
+    """
+    Budget-invariant template of a request: result cache, then decision table, then an engine run.
+    With sections (see parse_sections) the template may only fill those, and a run only
+    fires the rules they depend on.
+    Raises AnalysisQueueFull when the engine run cannot be admitted.
+    """
+    key = key or scenario_key(request)
+    template = _lookup_template(key, sections)
+
+    if template is None:
+        # Templates of a selection are cached apart from full ones, which serve any selection
+        if sections is not None:
+            key = key + (sections,)
+        started = time.perf_counter()
+        if config.SINGLE_FLIGHT:
+            # Identical scenarios already being analyzed are awaited, not recomputed
+            template, run_stats = await _single_flight.do(key, lambda: compute_template_async(request, sections))
+        else:
+            template, run_stats = await compute_template_async(request, sections)
+        inference, aggregation = run_stats[:2]
+        # Whatever the run itself did not take was spent queued, coalesced or crossing to a worker
+        record_timing("queue", time.perf_counter() - started - inference - aggregation)
+        record_timing("engine", inference)
+        record_timing("aggregation", aggregation)
+        _result_cache.put(key, template)
+
+    return template
+
+
+def get_template_blocking(request: MarketingAnalysisRequest, key: tuple = None, mode: str = None) -> RecommendationTemplate:
+    """get_template for code outside the event loop (CLI tools, worker processes): runs the engine inline"""
+    key = key or scenario_key(request)
+    template = _lookup_template(key)
+
+    if template is None:
+        template = compute_template(request, mode)
+        _result_cache.put(key, template)
+
+    return template
+
+
+def _lookup_template(key: tuple, sections: tuple = None):
+    """Template from the result cache or the decision table, None when the engine has to run"""
+    started = time.perf_counter()
+    # Seen this scenario (in any budget of the tier) recently: skip the engine entirely
+    # A full template serves any selection of sections; one lookup either way for the cache stats
+    if sections is None:
+        template = _result_cache.get(key)
+    else:
+        template = _result_cache.get_any(key, key + (sections,))
+    status = "hit"
+
+    if template is None:
+        status = "miss"
+        # O(1) answer when the scenario was precomputed
+        table = get_decision_table()
+        if table is not None:
+            stored = table.lookup(key)
+            if stored is not None:
+                template = RecommendationTemplate(**stored)
+                _result_cache.put(key, template)
+                status = "table"
+
+    record_cache(status, time.perf_counter() - started)
+    return template
 
-import asyncio
 
 async def run_comprehensive_analysis(request: MarketingAnalysisRequest) -> MarketingRecommendation:
     """
     Run comprehensive marketing analysis using layered forward chaining
     Returns simplified, actionable recommendations
     """
-    try:
-        # Initialize the expert system engine
-        engine = ComprehensiveMarketingEngine()
-        engine.reset()
+    started = time.perf_counter()
+    with _analysis_errors():
+        template = await get_template(request)
 
-        # Declare initial facts from user input
-        engine.declare(ProductFact(product_type=request.product_type.value))
-        engine.declare(RawBudget(amount=request.raw_budget_amount))
-        engine.declare(TargetCustomerFact(customer=request.target_customer.value))
-        engine.declare(PrimaryGoalFact(goal=request.primary_goal.value))
-        engine.declare(TimeHorizonFact(horizon=request.time_horizon.value))
-        engine.declare(ContentCapabilityFact(capability=request.content_capability.value))
-        engine.declare(SalesStructureFact(structure=request.sales_structure.value))
-        engine.declare(PriorityKPIFact(kpi=request.priority_kpi.value))
+        # Monetary fields are the only budget-dependent part, bind them per request
+        recommendation = template.bind(_calculate_monthly_budget(request))
+        observe_phase("analysis", time.perf_counter() - started)
+        return recommendation
 
-        # Run forward chaining - rules will fire in layers
-        # Use to_thread to prevent blocking the event loop since engine.run() is CPU-bound
-        await asyncio.to_thread(engine.run)
 
-        # Aggregate inferred facts into simplified output
-        recommendation = _aggregate_recommendations(engine, request)
+async def run_section_analysis(request: MarketingAnalysisRequest, sections: tuple) -> dict:
+    """
+    run_comprehensive_analysis for callers that only need some output sections: a dict of
+    those MarketingRecommendation fields. Compiled engines only load and fire the rules
+    the sections depend on (section_dependencies()).
+    """
+    started = time.perf_counter()
+    with _analysis_errors():
+        template = await get_template(request, sections=sections)
+        result = template.bind_fields(_calculate_monthly_budget(request), sections)
+        observe_phase("analysis", time.perf_counter() - started)
+        return result
 
-        return recommendation
 
+@contextmanager
+def _analysis_errors():
+    """Re-raise analysis failures with their traceback in the message"""
+    try:
+        yield
+    except AnalysisQueueFull:
+        # Overload is not an analysis error, let the controller answer 503
+        raise
     except Exception as e:
-        import traceback
         error_detail = f"Error in comprehensive marketing analysis: {str(e)}\n{traceback.format_exc()}"
         raise Exception(error_detail)
 
 
+def parse_sections(fields: str) -> tuple:
+    """Comma-separated MarketingRecommendation fields as a canonical (model order) tuple; ValueError if unknown"""
+    names = {name.strip() for name in fields.split(",") if name.strip()}
+    unknown = sorted(names.difference(SECTIONS))
+    if unknown or not names:
+        raise ValueError(f"Unknown output fields {unknown or [fields]}, expected any of {list(SECTIONS)}")
+    return tuple(section for section in SECTIONS if section in names)
+
+
+def get_section_dependencies() -> dict:
+    """Output section -> the facts, rules and rule layers it needs, for the rules engines are built from"""
+    return section_dependencies(_engine_rule_base())
+
+
+def compute_template(request: MarketingAnalysisRequest, mode: str = None) -> RecommendationTemplate:
+    """
+    Run the engine and aggregate its facts into a budget-invariant template.
+    The result is valid for every budget in the request's tier.
+    """
+    template, run_stats = compute_template_timed(request, mode)
+    record_engine_run(*run_stats)
+    return template
+
+
+def compute_template_timed(request: MarketingAnalysisRequest, mode: str = None, sections: tuple = None) -> tuple:
+    """
+    compute_template without recording metrics: the template and the run's
+    (inference seconds, aggregation seconds, facts in working memory, rules fired).
+    With sections only those are filled in.
+    """
+    mode = mode or config.ENGINE_MODE
+    if sections is not None and mode in PRODUCT_ENGINE_MODES:
+        # Compiled engines over just the rules the sections need. Building one is cheap next
+        # to a run, and there are too many rule bases (selection x product) to pool them all.
+        product = request.product_type.value if config.PRODUCT_ENGINES else None
+        return _timed_run(_new_engine(mode, product, sections), request, sections)
+    with get_engine_pool(mode, request.product_type.value).checkout() as engine:
+        # Aggregate before the engine goes back to the pool and its facts are cleared
+        return _timed_run(engine, request, sections)
+
+
+def _timed_run(engine, request: MarketingAnalysisRequest, sections: tuple = None) -> tuple:
+    started = time.perf_counter()
+    _declare_and_run(engine, request)
+    inferred = time.perf_counter()
+    template = _build_template(engine, request, sections)
+    return template, (inferred - started, time.perf_counter() - inferred, len(engine.facts), engine.fired)
+
+
+def compute_recommendation(request: MarketingAnalysisRequest) -> MarketingRecommendation:
+    """Run the engine and aggregate its facts, without any table lookup"""
+    return compute_template(request).bind(_calculate_monthly_budget(request))
+
+
+def _new_engine(mode: str = None, product: str = None, sections: tuple = None):
+    """
+    Engine for the configured MARX_ENGINE mode (native, bitset or Experta). Compiled engines
+    are specialized for a product type and restricted to what some output sections need, if given.
+    """
+    mode = mode or config.ENGINE_MODE
+    try:
+        # The staged engine replays cached activations instead of firing rules, so it is never profiled
+        if profiling_enabled() and mode in PROFILED_ENGINE_CLASSES:
+            engine_class = PROFILED_ENGINE_CLASSES[mode]
+        else:
+            engine_class = ENGINE_CLASSES[mode]
+    except KeyError:
+        raise ValueError(f"Unknown engine mode {mode!r}, expected one of {sorted(ENGINE_CLASSES)}")
+    if mode in PRODUCT_ENGINE_MODES:
+        return engine_class(_engine_rule_base(product, sections))
+    return engine_class()
+
+
+def _engine_rule_base(product: str = None, sections: tuple = None) -> CompiledRuleBase:
+    """
+    Rules of the compiled engines: the minimized rule set if configured, pruned to the product
+    type and to the rules the output sections depend on if given
+    """
+    rule_base = minimized_rule_base(config.RULE_SET_PATH) if config.RULE_SET_PATH else compile_rule_base()
+    if product:
+        rule_base = product_rule_base(product, rule_base)
+    return section_rule_base(sections, rule_base) if sections is not None else rule_base
+
+
+def _run_engine(request: MarketingAnalysisRequest, mode: str = None):
+    """Build a dedicated (unpooled) engine and run the request through it, for callers that keep the engine"""
+    engine = _new_engine(mode)
+    _declare_and_run(engine, request)
+    return engine
+
+
+def _declare_and_run(engine, request: MarketingAnalysisRequest):
+    """Reset the engine, declare the user's input facts and run forward chaining"""
+    _declare_inputs(engine, request)
+
+    # Run forward chaining - rules will fire in layers
+    engine.run()
+
+
+def _declare_inputs(engine, request: MarketingAnalysisRequest):
+    """Reset the engine and declare the user's input facts, without running it"""
+    # Product, budget and customer: compiled engines start from a snapshot with them declared.
+    # Profiled engines do not, they count the activations the prefix queues.
+    if isinstance(engine, NativeMarketingEngine) and not profiling_enabled():
+        _warm_forks.start(engine, request)
+    else:
+        engine.reset()
+        declare_prefix(engine, request)
+
+    # Declare the remaining facts from user input
+    engine.declare(PrimaryGoalFact(goal=request.primary_goal.value))
+    engine.declare(TimeHorizonFact(horizon=request.time_horizon.value))
+    engine.declare(ContentCapabilityFact(capability=request.content_capability.value))
+    engine.declare(SalesStructureFact(structure=request.sales_structure.value))
+    engine.declare(PriorityKPIFact(kpi=request.priority_kpi.value))
+
+
 def _aggregate_recommendations(engine: ComprehensiveMarketingEngine, request: MarketingAnalysisRequest) -> MarketingRecommendation:
     """
     Aggregate all inferred facts from the engine into a simplified recommendation
     """
+    return _build_template(engine, request).bind(_calculate_monthly_budget(request))
+
+
+def _build_template(engine: ComprehensiveMarketingEngine, request: MarketingAnalysisRequest,
+                    sections: tuple = None) -> RecommendationTemplate:
+    """
+    Aggregate all inferred facts into everything except the monetary amounts
+    (only the given output sections, the others are left empty)
+    """
+    def wanted(*names):
+        return sections is None or any(name in sections for name in names)
 
     # Get facts from knowledge base
     facts = list(engine.facts.values())
@@ -89,33 +603,33 @@ def _aggregate_recommendations(engine: ComprehensiveMarketingEngine, request: Ma
     channel_facts = [f for f in facts if isinstance(f, ChannelPriorityFact)]
 
     # Map channels to strategy codes (TOP 3)
-    strategy_codes = _extract_strategy_codes(channel_facts, request)
+    strategy_codes = []
+    if wanted("recommended_strategies", "budget_allocation", "channel_tactics"):
+        strategy_codes = _extract_strategy_codes(channel_facts, request)
 
     # Generate 2-5 critical insights
-    critical_insights = _generate_critical_insights(facts, request)
+    critical_insights = _generate_critical_insights(facts, request) if wanted("critical_insights") else []
 
-    # Generate budget allocation (ONLY for top 3 strategies)
-    budget_allocation = _generate_budget_allocation(channel_facts, request, strategy_codes)
+    # Generate budget shares (ONLY for top 3 strategies)
+    budget_shares = _generate_budget_shares(channel_facts, request, strategy_codes) if wanted("budget_allocation") else []
 
     # Generate channel tactics (ONLY for top 3 strategies)
-    channel_tactics = _generate_channel_tactics(channel_facts, facts, request, strategy_codes)
-
-    # Calculate monthly budget
-    monthly_budget = _calculate_monthly_budget(request)
+    channel_tactics = []
+    if wanted("channel_tactics"):
+        channel_tactics = _generate_channel_tactics(channel_facts, facts, request, strategy_codes)
 
     # === BUILD COMBINED SECTIONS ===
 
     # Build action plan (quick wins + KPIs + risks + scaling)
-    action_plan = _build_action_plan(facts)
+    action_plan = _build_action_plan(facts) if wanted("action_plan") else []
 
     # Build resources (tools + capabilities + partners + cost tips)
-    resources = _build_resources(facts)
+    resources = _build_resources(facts) if wanted("resources") else []
 
-    return MarketingRecommendation(
+    return RecommendationTemplate(
         recommended_strategies=strategy_codes,
         critical_insights=critical_insights,
-        budget_allocation=budget_allocation,
-        total_monthly_budget=monthly_budget,
+        budget_shares=budget_shares,
         channel_tactics=channel_tactics,
         action_plan=action_plan,
         resources=resources
@@ -175,7 +689,7 @@ def _extract_strategy_codes(channel_facts: list, request: MarketingAnalysisReque
                         break
 
     # Add ABM (S7) for B2B enterprise with sales team
-    if (request.product_type in [ProductType.B2B_SAAS, ProductType.CONSULTING] and
+    if (request.product_type in ABM_PRODUCT_TYPES and
         request.target_customer == TargetCustomer.B2B_LARGE and
         request.sales_structure == SalesStructure.SALES_TEAM):
         strategy_set.add("S7")
@@ -188,15 +702,7 @@ def _extract_strategy_codes(channel_facts: list, request: MarketingAnalysisReque
     # Ensure at least 3 strategies with context-aware defaults
     if len(strategy_codes) < 3:
         # Choose defaults based on time horizon
-        if request.time_horizon == TimeHorizon.SHORT:
-            # Short-term: favor paid channels over SEO
-            defaults = ["S2", "S3", "S4"]  # PPC, Social, Email
-        elif request.time_horizon == TimeHorizon.LONG:
-            # Long-term: favor organic channels
-            defaults = ["S1", "S5", "S2"]  # SEO, Content, PPC
-        else:
-            # Medium: balanced
-            defaults = ["S2", "S5", "S1"]  # PPC, Content, SEO
+        defaults = DEFAULT_STRATEGIES_BY_HORIZON[request.time_horizon]
 
         for default in defaults:
             if STRATEGY_LABELS[default] not in strategy_codes:
@@ -258,10 +764,8 @@ def _generate_critical_insights(facts: list, request: MarketingAnalysisRequest)
     return insights[:5]  # Max 5 insights
 
 
-def _generate_budget_allocation(channel_facts: list, request: MarketingAnalysisRequest, strategy_codes: list) -> list:
-    """Generate simplified budget allocation - ONLY for recommended strategies"""
-
-    monthly_budget = _calculate_monthly_budget(request)
+def _generate_budget_shares(channel_facts: list, request: MarketingAnalysisRequest, strategy_codes: list) -> list:
+    """Generate simplified budget shares - ONLY for recommended strategies"""
 
     # Sort channels by priority
     sorted_channels = sorted(channel_facts, key=lambda f: f['priority'])
@@ -290,18 +794,12 @@ def _generate_budget_allocation(channel_facts: list, request: MarketingAnalysisR
             strategy_budget_map[strategy_code] += budget_percent
 
     # Ensure every recommended strategy has a budget allocation
-    # Default percentages for strategies without channel facts
-    default_budget_per_strategy = {
-        "S1": 20, "S2": 35, "S3": 30, "S4": 20, "S5": 25,
-        "S6": 25, "S7": 30, "S8": 25, "S9": 20
-    }
-
     for strategy_label in strategy_codes:
         # Extract code from label (e.g., "S1 - ..." -> "S1")
         strategy_code = strategy_label.split(" - ")[0]
         if strategy_code not in strategy_budget_map:
             # Add default budget for strategies without channel facts
-            strategy_budget_map[strategy_code] = default_budget_per_strategy.get(strategy_code, 20)
+            strategy_budget_map[strategy_code] = DEFAULT_STRATEGY_BUDGET.get(strategy_code, 20)
 
     # Calculate total to normalize BEFORE creating allocation objects
     total_percent = sum(p for p in strategy_budget_map.values() if p > 0)
@@ -311,24 +809,17 @@ def _generate_budget_allocation(channel_facts: list, request: MarketingAnalysisR
         if percentage > 0:
             # Normalize to 100% during creation to avoid Pydantic validation errors
             normalized_pct = round((percentage / total_percent) * 100, 1) if total_percent > 0 else percentage
-            allocations.append(BudgetAllocation(
+            allocations.append(StrategyBudgetShare(
                 strategy_code=STRATEGY_LABELS[strategy_code],
-                percentage=normalized_pct,
-                monthly_amount=round(monthly_budget * (normalized_pct / 100), 2)
+                percentage=normalized_pct
             ))
 
     # If no allocations, create default (should match recommended strategies)
     if not allocations:
-        defaults = [
-            ("S2", 40),
-            ("S3", 35),
-            ("S5", 25)
-        ]
-        for code, pct in defaults:
-            allocations.append(BudgetAllocation(
+        for code, pct in FALLBACK_BUDGET_SHARES:
+            allocations.append(StrategyBudgetShare(
                 strategy_code=STRATEGY_LABELS[code],
-                percentage=pct,
-                monthly_amount=round(monthly_budget * (pct / 100), 2)
+                percentage=pct
             ))
 
     return allocations
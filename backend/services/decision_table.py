@@ -0,0 +1,138 @@
+"""
+Precomputed Decision Table
+Every input except RawBudget is an enum and RawBudget collapses into five tiers,
+so the whole input space can be run through the engine once ahead of time.
+The API then answers with a dictionary lookup and binds the budget afterwards.
+
+A table records the fingerprints of the rule base and of the aggregation code it was
+built with, and refuses to load once either has changed. TABLE_VERSION covers the format.
+"""
+import gzip
+import json
+import itertools
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple
+
+from models.model import (
+    ProductType,
+    TargetCustomer,
+    BudgetLevel,
+    PrimaryGoal,
+    TimeHorizon,
+    ContentCapability,
+    SalesStructure,
+    PriorityKPI
+)
+from services.rule_compiler import compile_rule_base
+
+TABLE_VERSION = 3
+
+# Order of the values in a scenario key (see comprehensive_service.scenario_key)
+SCENARIO_DIMENSIONS = [
+    ProductType,
+    TargetCustomer,
+    PrimaryGoal,
+    TimeHorizon,
+    ContentCapability,
+    SalesStructure,
+    PriorityKPI,
+    BudgetLevel,
+]
+
+
+def iter_scenario_keys(product_types: Optional[Iterable[ProductType]] = None) -> Iterator[Tuple[str, ...]]:
+    """Enumerate the discrete input space, optionally restricted to some product types"""
+    dimensions = [[item.value for item in enum] for enum in SCENARIO_DIMENSIONS]
+    if product_types is not None:
+        dimensions[0] = [ProductType(p).value for p in product_types]
+    return itertools.product(*dimensions)
+
+
+def count_scenarios(product_types: Optional[Iterable[ProductType]] = None) -> int:
+    """Number of keys iter_scenario_keys() will yield"""
+    total = 1
+    for enum in SCENARIO_DIMENSIONS[1:]:
+        total *= len(enum)
+    products = len(ProductType) if product_types is None else len(list(product_types))
+    return total * products
+
+
+def _encode_key(key: Tuple[str, ...]) -> str:
+    return "|".join(key)
+
+
+class DecisionTable:
+    """
+    Scenario key -> RecommendationTemplate (as a plain dict).
+    Identical templates are stored once and referenced by index,
+    which keeps the full table small enough to load at startup.
+    """
+
+    def __init__(self):
+        self._entries: Dict[str, int] = {}
+        self._results: List[dict] = []
+        self._result_index: Optional[Dict[str, int]] = {}
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: Tuple[str, ...]) -> bool:
+        return _encode_key(key) in self._entries
+
+    @property
+    def unique_results(self) -> int:
+        return len(self._results)
+
+    def add(self, key: Tuple[str, ...], result: dict):
+        """Store the result for a scenario, sharing storage with identical results"""
+        if self._result_index is None:
+            self._result_index = {
+                json.dumps(r, sort_keys=True): i for i, r in enumerate(self._results)
+            }
+        fingerprint = json.dumps(result, sort_keys=True)
+        idx = self._result_index.get(fingerprint)
+        if idx is None:
+            idx = len(self._results)
+            self._results.append(result)
+            self._result_index[fingerprint] = idx
+        self._entries[_encode_key(key)] = idx
+
+    def lookup(self, key: Tuple[str, ...]) -> Optional[dict]:
+        """Return the stored result for a scenario, or None if it was not built"""
+        idx = self._entries.get(_encode_key(key))
+        if idx is None:
+            return None
+        return self._results[idx]
+
+    def save(self, path: str, aggregation: str):
+        """Write the table, recording the rule base and the aggregation fingerprint it was built with"""
+        payload = {
+            "version": TABLE_VERSION,
+            "rule_base": compile_rule_base().fingerprint(),
+            "aggregation": aggregation,
+            "results": self._results,
+            "entries": self._entries,
+        }
+        with gzip.open(path, "wt", encoding="utf-8") as f:
+            json.dump(payload, f, separators=(",", ":"))
+
+    @classmethod
+    def load(cls, path: str, aggregation: str) -> "DecisionTable":
+        """Read a table, refusing one built for other rules or another aggregation fingerprint"""
+        with gzip.open(path, "rt", encoding="utf-8") as f:
+            payload = json.load(f)
+
+        if payload.get("version") != TABLE_VERSION:
+            raise ValueError(
+                f"Decision table {path} has version {payload.get('version')}, expected {TABLE_VERSION}; rebuild it"
+            )
+        if payload.get("rule_base") != compile_rule_base().fingerprint():
+            raise ValueError(f"Decision table {path} was built for different rules; rebuild it")
+        if payload.get("aggregation") != aggregation:
+            raise ValueError(f"Decision table {path} was built with different aggregation code; rebuild it")
+
+        table = cls()
+        table._results = payload["results"]
+        table._entries = payload["entries"]
+        # Only needed when adding to a loaded table, built on demand
+        table._result_index = None
+        return table
@@ -0,0 +1,122 @@
+"""
+Engine Pool
+Bounded pool of pre-built engines that requests check out, reset, run and hand back,
+so no engine is constructed on the request path. Wait times are tracked to size it.
+"""
+import queue
+import threading
+import time
+from contextlib import contextmanager
+from typing import Callable
+
+
+class EnginePoolTimeout(Exception):
+    """No engine became available within the pool timeout"""
+
+
+class EnginePool:
+    """Thread-safe pool of engines built by `factory`; engines are cleaned on return"""
+
+    def __init__(self, factory: Callable, size: int, timeout: float = 30.0, warm: bool = True):
+        if size < 1:
+            raise ValueError("Engine pool size must be at least 1")
+        self.factory = factory
+        self.size = size
+        self.timeout = timeout
+        self._idle = queue.LifoQueue()
+        self._lock = threading.Lock()
+        self._created = 0
+        self.checkouts = 0
+        self.waited = 0
+        self.timeouts = 0
+        self.discarded = 0
+        self.total_wait = 0.0
+        self.max_wait = 0.0
+        if warm:
+            self.warm()
+
+    def warm(self):
+        """Build engines until the pool is full"""
+        while True:
+            with self._lock:
+                if self._created >= self.size:
+                    return
+                self._created += 1
+            self._idle.put(self._build())
+
+    def _build(self):
+        try:
+            return self.factory()
+        except Exception:
+            with self._lock:
+                self._created -= 1
+            raise
+
+    def _acquire(self):
+        try:
+            return self._idle.get_nowait(), False
+        except queue.Empty:
+            pass
+
+        # Grow up to the limit before making anyone wait (e.g. after an engine was discarded)
+        with self._lock:
+            grow = self._created < self.size
+            if grow:
+                self._created += 1
+        if grow:
+            try:
+                return self.factory(), False
+            except Exception:
+                with self._lock:
+                    self._created -= 1
+                raise
+
+        try:
+            return self._idle.get(timeout=self.timeout), True
+        except queue.Empty:
+            with self._lock:
+                self.timeouts += 1
+            raise EnginePoolTimeout(f"No engine available after {self.timeout}s (pool size {self.size})")
+
+    @contextmanager
+    def checkout(self):
+        """Borrow an engine for one analysis; it goes back to the pool cleaned, or is dropped on error"""
+        started = time.perf_counter()
+        engine, waited = self._acquire()
+        wait = time.perf_counter() - started
+        with self._lock:
+            self.checkouts += 1
+            self.total_wait += wait
+            self.max_wait = max(self.max_wait, wait)
+            if waited:
+                self.waited += 1
+
+        try:
+            yield engine
+        except BaseException:
+            # Engine state is unknown after a failure, replace it on next demand
+            with self._lock:
+                self._created -= 1
+                self.discarded += 1
+            raise
+        else:
+            release = getattr(engine, "release", None)
+            if release is not None:
+                release()
+            self._idle.put(engine)
+
+    def stats(self) -> dict:
+        with self._lock:
+            idle = self._idle.qsize()
+            return {
+                "size": self.size,
+                "created": self._created,
+                "idle": idle,
+                "in_use": self._created - idle,
+                "checkouts": self.checkouts,
+                "waited": self.waited,
+                "timeouts": self.timeouts,
+                "discarded": self.discarded,
+                "avg_wait_ms": round(self.total_wait / self.checkouts * 1000, 3) if self.checkouts else 0.0,
+                "max_wait_ms": round(self.max_wait * 1000, 3),
+            }
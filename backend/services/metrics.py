@@ -0,0 +1,172 @@
+"""
+Request Metrics
+Latency histograms for each phase of an analysis request and counters for requests,
+errors, facts declared and rules fired, rendered in the Prometheus text exposition
+format for GET /metrics (no client library needed).
+
+Phases of POST /api/analyze:
+    request        controller entry to response dict (analysis + serialization)
+    analysis       run_comprehensive_analysis: cache/table lookup, queueing, engine, bind
+    inference      reset, input facts and forward chaining (cache misses only)
+    aggregation    engine facts -> recommendation template (cache misses only)
+    serialization  MarketingRecommendation.dict()
+"""
+import threading
+from typing import Dict, Tuple
+
+# Upper bounds in seconds; the compiled engines answer in well under a millisecond,
+# Experta in tens of milliseconds, queued requests can take seconds
+DEFAULT_BUCKETS = (0.00005, 0.0001, 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01,
+                   0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+
+def _format_labels(names: Tuple[str, ...], values: Tuple[str, ...], extra: str = "") -> str:
+    pairs = [f'{name}="{_escape(value)}"' for name, value in zip(names, values)]
+    if extra:
+        pairs.append(extra)
+    return "{" + ",".join(pairs) + "}" if pairs else ""
+
+
+def _escape(value) -> str:
+    return str(value).replace("\\", "\\\\").replace("\n", "\\n").replace('"', '\\"')
+
+
+def _format_value(value: float) -> str:
+    if value == float("inf"):
+        return "+Inf"
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+class Counter:
+    """Monotonic counter, optionally split by labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self._values: Dict[tuple, float] = {}
+        self._lock = threading.Lock()
+
+    def inc(self, amount: float = 1, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            self._values[key] = self._values.get(key, 0) + amount
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} counter"]
+        with self._lock:
+            values = sorted(self._values.items())
+        if not values and not self.labelnames:
+            values = [((), 0)]
+        for key, value in values:
+            lines.append(f"{self.name}{_format_labels(self.labelnames, key)} {_format_value(value)}")
+        return lines
+
+
+class Histogram:
+    """Cumulative-bucket histogram, optionally split by labels"""
+
+    def __init__(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                 buckets: Tuple[float, ...] = DEFAULT_BUCKETS):
+        self.name = name
+        self.documentation = documentation
+        self.labelnames = labelnames
+        self.buckets = tuple(sorted(buckets)) + (float("inf"),)
+        # label values -> [count per bucket (not cumulative), sum, count]
+        self._series: Dict[tuple, list] = {}
+        self._lock = threading.Lock()
+
+    def observe(self, value: float, **labels):
+        key = tuple(str(labels[name]) for name in self.labelnames)
+        with self._lock:
+            series = self._series.get(key)
+            if series is None:
+                series = self._series[key] = [[0] * len(self.buckets), 0.0, 0]
+            for i, bound in enumerate(self.buckets):
+                if value <= bound:
+                    series[0][i] += 1
+                    break
+            series[1] += value
+            series[2] += 1
+
+    def render(self) -> list:
+        lines = [f"# HELP {self.name} {self.documentation}", f"# TYPE {self.name} histogram"]
+        with self._lock:
+            series = sorted((key, (list(buckets), total, count)) for key, (buckets, total, count) in self._series.items())
+        for key, (buckets, total, count) in series:
+            cumulative = 0
+            for bound, observed in zip(self.buckets, buckets):
+                cumulative += observed
+                le = 'le="' + _format_value(bound) + '"'
+                lines.append(f"{self.name}_bucket{_format_labels(self.labelnames, key, le)} {cumulative}")
+            labels = _format_labels(self.labelnames, key)
+            lines.append(f"{self.name}_sum{labels} {_format_value(total)}")
+            lines.append(f"{self.name}_count{labels} {count}")
+        return lines
+
+
+class MetricsRegistry:
+    def __init__(self):
+        self._metrics = []
+
+    def counter(self, name: str, documentation: str, labelnames: Tuple[str, ...] = ()) -> Counter:
+        metric = Counter(name, documentation, labelnames)
+        self._metrics.append(metric)
+        return metric
+
+    def histogram(self, name: str, documentation: str, labelnames: Tuple[str, ...] = (),
+                  buckets: Tuple[float, ...] = DEFAULT_BUCKETS) -> Histogram:
+        metric = Histogram(name, documentation, labelnames, buckets)
+        self._metrics.append(metric)
+        return metric
+
+    def render(self) -> str:
+        lines = []
+        for metric in self._metrics:
+            lines.extend(metric.render())
+        return "\n".join(lines) + "\n"
+
+
+_registry = MetricsRegistry()
+
+PHASE_SECONDS = _registry.histogram(
+    "marx_phase_duration_seconds", "Time spent in each phase of an analysis request", ("phase",))
+REQUESTS = _registry.counter(
+    "marx_requests_total", "Analysis requests received, by endpoint", ("endpoint",))
+REQUEST_ERRORS = _registry.counter(
+    "marx_request_errors_total", "Analysis requests that failed, by endpoint and HTTP status", ("endpoint", "status"))
+ENGINE_RUNS = _registry.counter(
+    "marx_engine_runs_total", "Forward-chaining runs (cache and decision-table misses)")
+FACTS_DECLARED = _registry.counter(
+    "marx_facts_declared_total", "Facts in working memory at the end of each engine run, summed")
+RULES_FIRED = _registry.counter(
+    "marx_rules_fired_total", "Rule firings over all engine runs")
+
+
+def get_registry() -> MetricsRegistry:
+    return _registry
+
+
+def render_metrics() -> str:
+    return _registry.render()
+
+
+def observe_phase(phase: str, seconds: float):
+    PHASE_SECONDS.observe(seconds, phase=phase)
+
+
+def record_engine_run(inference_seconds: float, aggregation_seconds: float, facts: int, rules_fired: int):
+    """Account one engine run; worker processes send these values back to be recorded here"""
+    ENGINE_RUNS.inc()
+    FACTS_DECLARED.inc(facts)
+    RULES_FIRED.inc(rules_fired)
+    PHASE_SECONDS.observe(inference_seconds, phase="inference")
+    PHASE_SECONDS.observe(aggregation_seconds, phase="aggregation")
+
+
+def count_request(endpoint: str):
+    REQUESTS.inc(endpoint=endpoint)
+
+
+def count_error(endpoint: str, status: int):
+    REQUEST_ERRORS.inc(endpoint=endpoint, status=status)
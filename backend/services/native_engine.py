@@ -0,0 +1,191 @@
+"""
+Native Decision Engine
+Runs the compiled ComprehensiveMarketingEngine rule base (see rule_compiler.py)
+without Experta's Rete network: patterns are matched through a hash index,
+activations go on a heap and most RHS are replaced by their precomputed facts.
+
+Firing order follows Experta's DepthStrategy (salience, then the most recent
+facts first). Where Experta's order is down to set iteration, the earlier rule
+in the class body fires first, so results no longer depend on PYTHONHASHSEED.
+"""
+import heapq
+import itertools
+from dataclasses import dataclass
+from typing import Dict, List, Optional, Tuple
+
+from experta import Fact
+from experta.fact import InitialFact
+
+from services.rule_compiler import CompiledRuleBase, compile_rule_base, fact_identity
+
+
+@dataclass(frozen=True)
+class WorkingMemory:
+    """Frozen copy of an engine's facts, pattern matches and agenda (see warm_fork)"""
+    facts: Tuple[Fact, ...]
+    identities: frozenset
+    matches: Tuple[Tuple[int, ...], ...]
+    agenda: tuple
+    seen: frozenset
+    # Bit per matched pattern, BitsetMarketingEngine only
+    state: int = 0
+
+
+class NativeMarketingEngine:
+    """Drop-in for ComprehensiveMarketingEngine as used by the service: reset(), declare(), run(), facts"""
+
+    def __init__(self, rule_base: Optional[CompiledRuleBase] = None):
+        self.rule_base = rule_base or compile_rule_base()
+        self.facts: Dict[int, Fact] = {}
+        self.running = False
+        self.fired = 0
+        self._identities = set()
+        self._matches: List[List[int]] = []
+        self._agenda = []
+        self._seen = set()
+        # Padding makes [5, 3, 1] sort before [5, 3], like Experta's list comparison
+        self._pad = (1,) * self.rule_base.max_branch_facts
+
+    def reset(self):
+        self.facts = {}
+        self.running = False
+        self.fired = 0
+        self._identities = set()
+        self._matches = [[] for _ in self.rule_base.patterns]
+        self._agenda = []
+        self._seen = set()
+        self._declare(InitialFact())
+
+    def release(self):
+        """Called when a pooled engine is handed back; drops the last run's facts"""
+        self.reset()
+
+    def declare(self, *facts: Fact) -> Optional[Fact]:
+        last = None
+        for fact in facts:
+            fact.validate()
+            last = self._declare(fact)
+        return last
+
+    def halt(self):
+        self.running = False
+
+    def snapshot(self) -> WorkingMemory:
+        """Copy of the working memory, agenda included, that later runs can start from"""
+        return WorkingMemory(
+            facts=tuple(self.facts.values()),
+            identities=frozenset(self._identities),
+            matches=tuple(tuple(fact_ids) for fact_ids in self._matches),
+            agenda=tuple(self._agenda),
+            seen=frozenset(self._seen),
+        )
+
+    def restore(self, memory: WorkingMemory):
+        """Reset to a snapshot instead of to an empty working memory"""
+        self.facts = dict(enumerate(memory.facts))
+        self.running = False
+        self.fired = 0
+        self._identities = set(memory.identities)
+        self._matches = [list(fact_ids) for fact_ids in memory.matches]
+        # A heap stays a heap when copied as is
+        self._agenda = list(memory.agenda)
+        self._seen = set(memory.seen)
+
+    def substitute(self, fact_id: int, fact: Fact):
+        """Put another fact in place of fact_id, one that satisfies exactly the same patterns"""
+        old = self.facts[fact_id]
+        if self.rule_base.matching_patterns(fact) != self.rule_base.matching_patterns(old):
+            raise ValueError(f"{fact!r} does not match the same patterns as {old!r}")
+        fact.validate()
+        self._identities.discard(fact_identity(old))
+        self._identities.add(fact_identity(fact))
+        self.facts[fact_id] = fact
+
+    def run(self, steps=float('inf')):
+        rules = self.rule_base.rules
+        matches = self._matches
+        agenda = self._agenda
+
+        self.running = True
+        while steps > 0 and self.running and agenda:
+            _, _, r_pos, b_pos, fact_ids = heapq.heappop(agenda)
+            rule = rules[r_pos]
+            branch = rule.branches[b_pos]
+            if any(matches[p] for p in branch.negative):
+                continue
+
+            steps -= 1
+            self.fired += 1
+            self._fire(rule, branch, fact_ids)
+
+        self.running = False
+
+    def _fire(self, rule, branch, fact_ids):
+        if rule.effects is not None:
+            for fact, identity in rule.effects:
+                self._declare(fact, identity)
+        else:
+            rule.rhs(self, **self._bindings(branch, fact_ids))
+
+    def _bindings(self, branch, fact_ids) -> dict:
+        patterns = self.rule_base.patterns
+        context = {}
+        for p_idx, fact_id in zip(branch.positive, fact_ids):
+            for var, key in patterns[p_idx].bindings:
+                context[var] = self.facts[fact_id][key]
+        return context
+
+    def _declare(self, fact: Fact, identity=None) -> Fact:
+        if identity is None:
+            identity = fact_identity(fact)
+        if identity in self._identities:
+            return fact
+        self._identities.add(identity)
+
+        fact_id = len(self.facts)
+        self.facts[fact_id] = fact
+        for p_idx in self.rule_base.matching_patterns(fact):
+            self._matches[p_idx].append(fact_id)
+            for r_pos, b_pos, slot in self.rule_base.pattern_uses.get(p_idx, ()):
+                self._activate(r_pos, b_pos, slot, fact_id)
+        return fact
+
+    def _activate(self, r_pos: int, b_pos: int, slot: int, fact_id: int):
+        """Queue every combination of facts for a branch that includes the new fact at `slot`"""
+        rule = self.rule_base.rules[r_pos]
+        branch = rule.branches[b_pos]
+        matches = self._matches
+        if any(matches[p] for p in branch.negative):
+            return
+
+        # Earlier slots only take older facts so a combination is produced exactly once
+        pools = []
+        for position, p_idx in enumerate(branch.positive):
+            if position == slot:
+                pools.append((fact_id,))
+            elif position < slot:
+                pools.append([i for i in matches[p_idx] if i < fact_id])
+            else:
+                pools.append(matches[p_idx])
+
+        for combo in itertools.product(*pools):
+            self._push(r_pos, b_pos, combo)
+
+    def _push(self, r_pos: int, b_pos: int, combo: tuple):
+        """Add an activation to the agenda unless the rule already has one for these facts"""
+        rule = self.rule_base.rules[r_pos]
+        branch = rule.branches[b_pos]
+        ids = frozenset(combo + (0,)) if branch.uses_initial_fact else frozenset(combo)
+        seen_key = (r_pos, ids)
+        if seen_key in self._seen:
+            return
+        self._seen.add(seen_key)
+        negated = tuple(-i for i in sorted(ids, reverse=True)) + self._pad
+        heapq.heappush(self._agenda, (
+            -rule.salience,
+            negated[:len(self._pad)],
+            # Position in this rule base: class-body order, also for a subset() of the rules
+            r_pos,
+            b_pos,
+            combo,
+        ))
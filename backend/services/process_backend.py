@@ -0,0 +1,149 @@
+"""
+Process Backend
+Runs engine + aggregation in a pool of worker processes, so analyses are no longer
+serialized by the GIL and one server process can use every core. Workers are spawned
+and warmed up front (rule base compiled, engine built, one analysis run), and only
+compact plain values cross the process boundary: the scenario as a tuple going in,
+the template as a dict coming back.
+"""
+import multiprocessing
+import os
+import threading
+from concurrent.futures import ProcessPoolExecutor
+from concurrent.futures.process import BrokenProcessPool
+from typing import Optional, Tuple
+
+from models.model import (
+    ProductType,
+    TargetCustomer,
+    PrimaryGoal,
+    TimeHorizon,
+    ContentCapability,
+    SalesStructure,
+    PriorityKPI
+)
+from models.output import RecommendationTemplate
+from models.request import MarketingAnalysisRequest
+from services.analysis_executor import AnalysisAdmission
+
+# Field order of the tuple a request is sent to a worker as
+REQUEST_FIELDS = (
+    "product_type",
+    "target_customer",
+    "primary_goal",
+    "time_horizon",
+    "content_capability",
+    "sales_structure",
+    "priority_kpi",
+    "raw_budget_amount",
+)
+
+# Scenario run once by every worker before it takes requests
+_WARMUP_REQUEST = (
+    ProductType.B2B_SAAS.value,
+    TargetCustomer.B2B_LARGE.value,
+    PrimaryGoal.LEAD_GEN.value,
+    TimeHorizon.MEDIUM.value,
+    ContentCapability.HIGH.value,
+    SalesStructure.SALES_TEAM.value,
+    PriorityKPI.SQL.value,
+    25000.0,
+)
+
+_worker_mode = None
+
+
+def encode_request(request: MarketingAnalysisRequest) -> Tuple:
+    """Request as a plain tuple of enum values and the budget amount"""
+    return tuple(
+        value.value if hasattr(value, "value") else value
+        for value in (getattr(request, name) for name in REQUEST_FIELDS)
+    )
+
+
+def decode_request(values: Tuple) -> MarketingAnalysisRequest:
+    return MarketingAnalysisRequest(**dict(zip(REQUEST_FIELDS, values)))
+
+
+def init_worker(mode: str):
+    """Runs once in every worker process: build the engine and exercise it before serving"""
+    global _worker_mode
+    import compat  # noqa: F401  (spawned workers start from a fresh interpreter)
+    import config
+    from services.comprehensive_service import compute_template, warm_engine_pools
+
+    # A worker runs one analysis at a time, so one pooled engine is enough
+    config.ENGINE_POOL_SIZE = 1
+    _worker_mode = mode
+    warm_engine_pools(mode)
+    compute_template(decode_request(_WARMUP_REQUEST), mode)
+
+
+def _worker_ready() -> int:
+    return os.getpid()
+
+
+def _compute_in_worker(values: Tuple, sections: Optional[Tuple[str, ...]] = None) -> Tuple[dict, tuple]:
+    """Template as a dict, plus the run's timings and counts for the server's metrics"""
+    from services.comprehensive_service import compute_template_timed
+    template, run_stats = compute_template_timed(decode_request(values), _worker_mode, sections)
+    return template.dict(), run_stats
+
+
+class ProcessBackend:
+    """Pool of pre-warmed worker processes computing recommendation templates"""
+
+    def __init__(self, workers: int, mode: str):
+        if workers < 1:
+            raise ValueError("Process backend needs at least one worker")
+        self.workers = workers
+        self.mode = mode
+        self._lock = threading.Lock()
+        self._executor = None
+        self.restarts = 0
+
+    def _new_executor(self) -> ProcessPoolExecutor:
+        # Spawn, not fork: the server process has running threads (event loop, engine pool)
+        return ProcessPoolExecutor(
+            max_workers=self.workers,
+            mp_context=multiprocessing.get_context("spawn"),
+            initializer=init_worker,
+            initargs=(self.mode,),
+        )
+
+    def start(self):
+        """Spawn every worker and wait until each has finished its warm-up"""
+        executor = self._get_executor()
+        # Each submit without an idle worker spawns a new one, so this brings up the whole pool
+        futures = [executor.submit(_worker_ready) for _ in range(self.workers)]
+        for future in futures:
+            future.result()
+
+    def shutdown(self):
+        with self._lock:
+            executor, self._executor = self._executor, None
+        if executor is not None:
+            executor.shutdown(wait=True, cancel_futures=True)
+
+    def _get_executor(self) -> ProcessPoolExecutor:
+        with self._lock:
+            if self._executor is None:
+                self._executor = self._new_executor()
+            return self._executor
+
+    async def compute_template(self, request: MarketingAnalysisRequest, admission: AnalysisAdmission,
+                               sections: Optional[Tuple[str, ...]] = None) -> Tuple[RecommendationTemplate, tuple]:
+        """The template (of the given output sections only, if any) and its run's timings and counts, computed in a worker process"""
+        executor = self._get_executor()
+        try:
+            result = await admission.run(executor, _compute_in_worker, encode_request(request), sections)
+        except BrokenProcessPool:
+            # A worker died (e.g. killed for memory); replace the pool so later requests recover
+            with self._lock:
+                if self._executor is executor:
+                    self._executor = None
+                    self.restarts += 1
+            executor.shutdown(wait=False, cancel_futures=True)
+            raise
+        template, run_stats = result
+        return RecommendationTemplate(**template), run_stats
@@ -0,0 +1,111 @@
+"""
+Product-Specialized Rule Bases
+Many rules can only ever fire for one product type: the market_maturity_* and base_*
+rules, the product-specific differentiated and gap-filling channel combinations, and
+every rule that only consumes facts those rules declare. For each ProductType this
+module keeps the rules that can fire when that is the only ProductFact, so the engine
+serving the product matches and queues fewer rules on every run.
+
+A rule is kept if one of its branches can fire: each positive pattern is satisfied by
+some reachable fact and no negated pattern is satisfied by a fact present in every run
+(InitialFact, the ProductFact). Reachable facts start as every input value of every
+other dimension and grow with the effects of kept rules until nothing changes. This
+over-approximates what a run can derive, so pruning never drops a rule that fires.
+"""
+import itertools
+from functools import lru_cache
+from typing import Dict, Iterator, List, Tuple
+
+from experta import Fact
+from experta.fact import InitialFact
+
+from models.model import (
+    BudgetLevel,
+    ContentCapability,
+    ContentCapabilityFact,
+    PrimaryGoal,
+    PrimaryGoalFact,
+    PriorityKPI,
+    PriorityKPIFact,
+    ProductFact,
+    ProductType,
+    RawBudget,
+    SalesStructure,
+    SalesStructureFact,
+    TargetCustomer,
+    TargetCustomerFact,
+    TimeHorizon,
+    TimeHorizonFact,
+)
+from services.comprehensive_engine import budget_tier_sample_amount
+from services.rule_compiler import CompiledRule, CompiledRuleBase, compile_rule_base, fact_identity, record_effects
+
+
+def input_facts(product: str) -> List[Fact]:
+    """Every input fact a request for the product can declare (one raw budget per tier)"""
+    facts = [InitialFact(), ProductFact(product_type=product)]
+    facts += [RawBudget(amount=budget_tier_sample_amount(tier)) for tier in BudgetLevel]
+    facts += [TargetCustomerFact(customer=v.value) for v in TargetCustomer]
+    facts += [PrimaryGoalFact(goal=v.value) for v in PrimaryGoal]
+    facts += [TimeHorizonFact(horizon=v.value) for v in TimeHorizon]
+    facts += [ContentCapabilityFact(capability=v.value) for v in ContentCapability]
+    facts += [SalesStructureFact(structure=v.value) for v in SalesStructure]
+    facts += [PriorityKPIFact(kpi=v.value) for v in PriorityKPI]
+    return facts
+
+
+def rule_effects(rule_base: CompiledRuleBase, rule: CompiledRule, branches, facts) -> Iterator[Tuple[Fact, frozenset]]:
+    """Facts the rule can declare through the given branches, given the reachable facts"""
+    if rule.effects is not None:
+        yield from rule.effects
+        return
+    # RHS with bindings: run it for every combination of reachable facts filling the bound patterns
+    for branch in branches:
+        bound = [rule_base.patterns[p] for p in branch.positive if rule_base.patterns[p].bindings]
+        candidates = [[fact for fact in facts if pattern.matches(fact)] for pattern in bound]
+        for combo in itertools.product(*candidates):
+            bindings = {var: fact[key] for pattern, fact in zip(bound, combo) for var, key in pattern.bindings}
+            yield from record_effects(rule.rhs, **bindings)
+
+
+def product_rule_names(product: str, rule_base: CompiledRuleBase = None) -> Tuple[str, ...]:
+    """Rules that can fire for the product type, in class-body order"""
+    rule_base = rule_base or compile_rule_base()
+    always = {p for fact in (InitialFact(), ProductFact(product_type=product))
+              for p in rule_base.matching_patterns(fact)}
+    reachable: Dict[frozenset, Fact] = {fact_identity(fact): fact for fact in input_facts(product)}
+    kept = set()
+
+    changed = True
+    while changed:
+        changed = False
+        matchable = {p for fact in reachable.values() for p in rule_base.matching_patterns(fact)}
+        for rule in rule_base.rules:
+            branches = [
+                branch for branch in rule.branches
+                if all(p in matchable for p in branch.positive) and not any(p in always for p in branch.negative)
+            ]
+            if not branches:
+                continue
+            kept.add(rule.name)
+            for fact, identity in rule_effects(rule_base, rule, branches, list(reachable.values())):
+                if identity not in reachable:
+                    reachable[identity] = fact
+                    changed = True
+
+    return tuple(rule.name for rule in rule_base.rules if rule.name in kept)
+
+
+@lru_cache(maxsize=None)
+def product_rule_base(product: str, rule_base: CompiledRuleBase = None) -> CompiledRuleBase:
+    """Compiled rule base (the full one by default) pruned to the rules that can fire for the product type"""
+    rule_base = rule_base or compile_rule_base()
+    return rule_base.subset(product_rule_names(ProductType(product).value, rule_base))
+
+
+def describe_product_rule_bases() -> List[dict]:
+    total = len(compile_rule_base().rules)
+    return [
+        {"product_type": product.value, "rules": len(product_rule_base(product.value).rules), "of": total}
+        for product in ProductType
+    ]
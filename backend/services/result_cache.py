@@ -0,0 +1,91 @@
+"""
+In-Process Result Cache
+Bounded LRU cache (with optional time-to-live) for recommendation templates,
+keyed by the canonical scenario key so any budget inside a tier hits the same entry
+"""
+import threading
+import time
+from collections import OrderedDict
+from typing import Any, Hashable, Optional
+
+
+class ResultCache:
+    """Thread-safe LRU/TTL cache with hit, miss, eviction and expiration counters"""
+
+    def __init__(self, max_size: int = 4096, ttl_seconds: float = 0):
+        # max_size <= 0 disables caching, ttl_seconds <= 0 means entries never expire
+        self.max_size = max_size
+        self.ttl_seconds = ttl_seconds
+        self._entries = OrderedDict()
+        self._lock = threading.Lock()
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self.expirations = 0
+
+    @property
+    def enabled(self) -> bool:
+        return self.max_size > 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        """Return the cached value and mark it recently used, or None on a miss"""
+        return self.get_any(key)
+
+    def get_any(self, *keys: Hashable) -> Optional[Any]:
+        """The value of the first cached key, counted as one lookup (one hit or one miss)"""
+        if not self.enabled:
+            return None
+
+        with self._lock:
+            now = time.monotonic()
+            for key in keys:
+                entry = self._entries.get(key)
+                if entry is None:
+                    continue
+
+                value, expires_at = entry
+                if expires_at is not None and expires_at <= now:
+                    del self._entries[key]
+                    self.expirations += 1
+                    continue
+
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return value
+
+            self.misses += 1
+            return None
+
+    def put(self, key: Hashable, value: Any):
+        """Insert or refresh a value, evicting the least recently used entries when full"""
+        if not self.enabled:
+            return
+
+        expires_at = time.monotonic() + self.ttl_seconds if self.ttl_seconds > 0 else None
+        with self._lock:
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_size:
+                self._entries.popitem(last=False)
+                self.evictions += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+
+    def stats(self) -> dict:
+        with self._lock:
+            lookups = self.hits + self.misses
+            return {
+                "size": len(self._entries),
+                "max_size": self.max_size,
+                "ttl_seconds": self.ttl_seconds,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else 0.0,
+                "evictions": self.evictions,
+                "expirations": self.expirations,
+            }
@@ -0,0 +1,309 @@
+"""
+Rule Compiler
+Turns the @Rule definitions of a KnowledgeEngine subclass into plain Python data:
+fact patterns, rule branches in disjunctive normal form and precomputed RHS effects.
+Native matchers (services/native_engine.py) run on this instead of Experta's Rete.
+"""
+import hashlib
+import inspect
+import itertools
+import json
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+from experta import AND, OR, NOT, Fact
+from experta.rule import Rule
+from experta.deffacts import DefFacts
+from experta.fieldconstraint import L, W
+
+from services.comprehensive_engine import ComprehensiveMarketingEngine
+
+
+@dataclass(frozen=True)
+class Pattern:
+    """A fact pattern: exact fact class, constant field values and variable bindings"""
+    fact_class: type
+    constants: Tuple[Tuple[Any, Any], ...]
+    bindings: Tuple[Tuple[str, Any], ...] = ()
+
+    def matches(self, fact: Fact) -> bool:
+        if type(fact) is not self.fact_class:
+            return False
+        for key, value in self.constants:
+            if key not in fact or fact[key] != value:
+                return False
+        for _, key in self.bindings:
+            if key not in fact:
+                return False
+        return True
+
+    def __str__(self):
+        parts = [f"{k}={v!r}" for k, v in self.constants]
+        parts += [f"{k}=MATCH.{var}" for var, k in self.bindings]
+        return f"{self.fact_class.__name__}({', '.join(parts)})"
+
+
+@dataclass(frozen=True)
+class Branch:
+    """One conjunction of a rule's DNF; each matching branch is a separate activation"""
+    positive: Tuple[int, ...]
+    negative: Tuple[int, ...]
+    # Experta prepends InitialFact when a branch starts with NOT or has no positive pattern
+    uses_initial_fact: bool
+
+
+@dataclass
+class CompiledRule:
+    name: str
+    # Position in the class body; decides between otherwise identical agenda keys
+    index: int
+    salience: int
+    branches: Tuple[Branch, ...]
+    rhs: Callable
+    # Facts the RHS always declares, in order, or None when it has to run (e.g. MATCH bindings)
+    effects: Optional[Tuple[Tuple[Fact, Any], ...]] = None
+
+    @property
+    def is_static(self) -> bool:
+        return self.effects is not None
+
+
+@dataclass(eq=False)
+class CompiledRuleBase:
+    engine_class: type
+    patterns: List[Pattern]
+    rules: List[CompiledRule]
+    # Longest positive-fact list of any branch, used to pad agenda keys
+    max_branch_facts: int
+    # pattern index -> [(rule position, branch position, slot in branch.positive)]
+    pattern_uses: Dict[int, List[Tuple[int, int, int]]] = field(default_factory=dict)
+    # pattern index -> [(rule position, branch position)] for negated patterns
+    negation_uses: Dict[int, List[Tuple[int, int]]] = field(default_factory=dict)
+    # fact class -> {(field, value) or None: [pattern index]}
+    alpha_index: Dict[type, Dict[Any, List[int]]] = field(default_factory=dict)
+
+    def rule(self, name: str) -> CompiledRule:
+        for rule in self.rules:
+            if rule.name == name:
+                return rule
+        raise KeyError(name)
+
+    def matching_patterns(self, fact: Fact) -> List[int]:
+        """Indexes of every pattern the fact satisfies"""
+        by_key = self.alpha_index.get(type(fact))
+        if not by_key:
+            return []
+        candidates = list(by_key.get(None, ()))
+        for key, value in fact.items():
+            if Fact.is_special(key):
+                continue
+            try:
+                candidates.extend(by_key.get((key, value), ()))
+            except TypeError:
+                # Unhashable field value, no constant pattern can test it
+                continue
+        return [idx for idx in candidates if self.patterns[idx].matches(fact)]
+
+    def fingerprint(self) -> str:
+        """
+        Digest of everything that decides what the rules derive: rule names and order,
+        saliences, conditions, static effects and the source of RHS that have to run
+        """
+        def describe(patterns):
+            return [str(self.patterns[p]) for p in patterns]
+
+        rules = []
+        for rule in self.rules:
+            effects = (
+                [[type(fact).__name__, sorted((k, v) for k, v in fact.items() if not Fact.is_special(k))]
+                 for fact, _ in rule.effects]
+                if rule.is_static else inspect.getsource(rule.rhs)
+            )
+            rules.append([
+                rule.name,
+                rule.salience,
+                [[describe(b.positive), describe(b.negative), b.uses_initial_fact] for b in rule.branches],
+                effects,
+            ])
+        return hashlib.sha256(json.dumps(rules, default=repr).encode()).hexdigest()
+
+    def subset(self, rule_names) -> "CompiledRuleBase":
+        """Same patterns, only the named rules (original indexes are kept for tie-breaking)"""
+        keep = set(rule_names)
+        return _index(CompiledRuleBase(
+            engine_class=self.engine_class,
+            patterns=self.patterns,
+            rules=[r for r in self.rules if r.name in keep],
+            max_branch_facts=self.max_branch_facts,
+        ))
+
+
+def fact_identity(fact: Fact):
+    """Same identity FactList uses to reject duplicate declarations"""
+    return frozenset(
+        [fact.__class__] + [(k, v) for k, v in fact.items() if not fact.is_special(k)]
+    )
+
+
+class _RecordingEngine:
+    """Stand-in engine that records what a rule's RHS declares"""
+
+    def __init__(self):
+        self.declared = []
+
+    def declare(self, *facts):
+        self.declared.extend(facts)
+        return facts[-1] if facts else None
+
+
+def _compile_pattern(fact: Fact) -> Pattern:
+    constants = []
+    bindings = []
+    for key, value in fact.items():
+        if Fact.is_special(key):
+            if key == '__bind__' and value is not None:
+                raise NotImplementedError(f"Fact bindings (AS.x << Fact) are not supported: {fact!r}")
+            continue
+        if isinstance(value, W):
+            if value.__bind__ is not None:
+                bindings.append((value.__bind__, key))
+        elif isinstance(value, L):
+            if value.__bind__ is not None:
+                raise NotImplementedError(f"Bound literal constraints are not supported: {fact!r}")
+            constants.append((key, value.value))
+        elif isinstance(value, tuple) and type(value).__module__.startswith('experta'):
+            raise NotImplementedError(f"Field constraint {value!r} is not supported in {fact!r}")
+        else:
+            constants.append((key, value))
+    return Pattern(type(fact), tuple(constants), tuple(bindings))
+
+
+def _dnf(ce) -> List[List[Tuple[bool, Fact]]]:
+    """Expand a conditional element into a list of conjunctions of (negated, pattern)"""
+    if isinstance(ce, Fact):
+        return [[(False, ce)]]
+    if isinstance(ce, AND):
+        branches = [[]]
+        for part in ce:
+            branches = [left + right for left in branches for right in _dnf(part)]
+        return branches
+    if isinstance(ce, OR):
+        return [branch for part in ce for branch in _dnf(part)]
+    if isinstance(ce, NOT):
+        inner = ce[0]
+        if isinstance(inner, Fact):
+            return [[(True, inner)]]
+        if isinstance(inner, NOT):
+            return _dnf(inner[0])
+        if isinstance(inner, OR):
+            return _dnf(AND(*[NOT(x) for x in inner]))
+        raise NotImplementedError(f"NOT over {type(inner).__name__} is not supported")
+    raise NotImplementedError(f"Conditional element {type(ce).__name__} is not supported")
+
+
+def record_effects(rhs: Callable, **bindings) -> Tuple[Tuple[Fact, Any], ...]:
+    """Run an RHS against a recording engine and return the facts it declares"""
+    recorder = _RecordingEngine()
+    rhs(recorder, **bindings)
+    for fact in recorder.declared:
+        fact.validate()
+    return tuple((fact, fact_identity(fact)) for fact in recorder.declared)
+
+
+def _static_effects(rhs: Callable) -> Optional[Tuple[Tuple[Fact, Any], ...]]:
+    """Probe an RHS that takes no arguments; it only qualifies if all it does is declare facts"""
+    params = list(inspect.signature(rhs).parameters.values())[1:]
+    if params:
+        return None
+    try:
+        return record_effects(rhs)
+    except Exception:
+        return None
+
+
+def _index(rule_base: CompiledRuleBase) -> CompiledRuleBase:
+    pattern_uses: Dict[int, List[Tuple[int, int, int]]] = {}
+    negation_uses: Dict[int, List[Tuple[int, int]]] = {}
+    for r_pos, rule in enumerate(rule_base.rules):
+        for b_pos, branch in enumerate(rule.branches):
+            for slot, p_idx in enumerate(branch.positive):
+                pattern_uses.setdefault(p_idx, []).append((r_pos, b_pos, slot))
+            for p_idx in branch.negative:
+                negation_uses.setdefault(p_idx, []).append((r_pos, b_pos))
+
+    alpha_index: Dict[type, Dict[Any, List[int]]] = {}
+    for p_idx, pattern in enumerate(rule_base.patterns):
+        key = pattern.constants[0] if pattern.constants else None
+        alpha_index.setdefault(pattern.fact_class, {}).setdefault(key, []).append(p_idx)
+
+    rule_base.pattern_uses = pattern_uses
+    rule_base.negation_uses = negation_uses
+    rule_base.alpha_index = alpha_index
+    return rule_base
+
+
+@lru_cache(maxsize=None)
+def compile_rule_base(engine_class: type = ComprehensiveMarketingEngine) -> CompiledRuleBase:
+    """
+    Compile every @Rule of a KnowledgeEngine subclass, in class-body order.
+    Raises NotImplementedError for constructs the native matchers cannot evaluate
+    (TEST, EXISTS, FORALL, predicate constraints, joins on shared variables).
+    """
+    rules = []
+    patterns: List[Pattern] = []
+    pattern_ids: Dict[Pattern, int] = {}
+
+    def pattern_id(fact):
+        pattern = _compile_pattern(fact)
+        if pattern not in pattern_ids:
+            pattern_ids[pattern] = len(patterns)
+            patterns.append(pattern)
+        return pattern_ids[pattern]
+
+    members = {}
+    for klass in reversed(engine_class.__mro__):
+        members.update(vars(klass))
+
+    for name, member in members.items():
+        if isinstance(member, DefFacts) and name != '_declare_initial_fact':
+            raise NotImplementedError(f"@DefFacts {name} is not supported by the rule compiler")
+        if not isinstance(member, Rule):
+            continue
+
+        branches = []
+        for conjunction in _dnf(AND(*member)):
+            positive = tuple(pattern_id(f) for negated, f in conjunction if not negated)
+            negative = tuple(pattern_id(f) for negated, f in conjunction if negated)
+
+            variables = list(itertools.chain.from_iterable(
+                (var for var, _ in patterns[p].bindings) for p in positive))
+            if len(variables) != len(set(variables)):
+                raise NotImplementedError(f"Rule {name}: joins on shared variables are not supported")
+            if any(patterns[p].bindings for p in negative):
+                raise NotImplementedError(f"Rule {name}: variables inside NOT are not supported")
+
+            branches.append(Branch(
+                positive=positive,
+                negative=negative,
+                uses_initial_fact=(not positive) or conjunction[0][0],
+            ))
+
+        rules.append(CompiledRule(
+            name=name,
+            index=len(rules),
+            salience=member.salience,
+            branches=tuple(branches),
+            rhs=member._wrapped,
+            effects=_static_effects(member._wrapped),
+        ))
+
+    max_branch_facts = max(
+        len(b.positive) + b.uses_initial_fact for r in rules for b in r.branches
+    )
+    return _index(CompiledRuleBase(
+        engine_class=engine_class,
+        patterns=patterns,
+        rules=rules,
+        max_branch_facts=max_branch_facts,
+    ))
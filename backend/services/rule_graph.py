@@ -0,0 +1,199 @@
+"""
+Rule Dependency Graph
+Static analysis of the compiled rule base: which fact classes every rule consumes
+(positive patterns), tests for absence (NOT) and produces, and from that the rules
+that cannot affect a recommendation:
+
+- unreachable: no branch can fire for any product type (see product_engines);
+- unused: everything the rule declares is of a fact class that neither aggregation
+  (_build_template) nor any rule that matters reads, transitively.
+
+Dropping such rules removes only facts nobody reads and keeps the relative order of
+all other facts and activations, so the recommendation is unchanged. Rules that fire
+but are overridden (a higher-layer ChannelPriorityFact for the same channel) can only
+be found by running the input space, see minimize_rules.py, which writes the minimized
+rule set that MARX_RULE_SET loads.
+
+The same closure, started from the fact classes of some output sections only, gives
+the rules a request needs when it selects sections (the `fields` of /api/analyze).
+"""
+import json
+from dataclasses import dataclass, field
+from functools import lru_cache
+from typing import Dict, FrozenSet, Iterable, List, Set
+
+from models.intermediate_facts import (
+    CapabilityRequirementFact,
+    ChannelPriorityFact,
+    CostOptimizationFact,
+    KPIRecommendationFact,
+    PartnerRecommendationFact,
+    QuickWinFact,
+    RiskIdentificationFact,
+    ScalingTriggerFact,
+    TacticalActionFact,
+    ToolRecommendationFact,
+)
+from models.model import BudgetLevelFact, ProductType
+from services.product_engines import input_facts, product_rule_names, rule_effects
+from services.rule_compiler import CompiledRuleBase, compile_rule_base
+from services.rule_layers import LAYER_ORDER, rule_layers
+
+# Fact classes _build_template reads; everything else only matters if a rule consumes it
+OUTPUT_FACT_CLASSES = (
+    BudgetLevelFact,
+    ChannelPriorityFact,
+    QuickWinFact,
+    TacticalActionFact,
+    KPIRecommendationFact,
+    RiskIdentificationFact,
+    ScalingTriggerFact,
+    ToolRecommendationFact,
+    CapabilityRequirementFact,
+    PartnerRecommendationFact,
+    CostOptimizationFact,
+)
+
+# Output sections (MarketingRecommendation fields) -> fact classes _build_template reads for
+# them. _generate_channel_tactics collects quick wins and tactical actions but never uses them.
+SECTION_FACT_CLASSES = {
+    "recommended_strategies": (ChannelPriorityFact,),
+    "critical_insights": (BudgetLevelFact,),
+    "budget_allocation": (ChannelPriorityFact,),
+    "total_monthly_budget": (),
+    "channel_tactics": (ChannelPriorityFact,),
+    "action_plan": (QuickWinFact, KPIRecommendationFact, RiskIdentificationFact, ScalingTriggerFact),
+    "resources": (ToolRecommendationFact, CapabilityRequirementFact, PartnerRecommendationFact, CostOptimizationFact),
+}
+SECTIONS = tuple(SECTION_FACT_CLASSES)
+
+
+@dataclass
+class RuleGraph:
+    """Rule name -> fact classes it consumes, negates and produces (in class-body order)"""
+    consumes: Dict[str, Set[type]] = field(default_factory=dict)
+    negates: Dict[str, Set[type]] = field(default_factory=dict)
+    produces: Dict[str, Set[type]] = field(default_factory=dict)
+
+    def producers(self, fact_class: type) -> List[str]:
+        return [name for name, classes in self.produces.items() if fact_class in classes]
+
+    def consumers(self, fact_class: type) -> List[str]:
+        return [name for name in self.consumes
+                if fact_class in self.consumes[name] or fact_class in self.negates[name]]
+
+    def fact_classes(self) -> List[type]:
+        classes = set()
+        for mapping in (self.consumes, self.negates, self.produces):
+            for names in mapping.values():
+                classes |= names
+        return sorted(classes, key=lambda c: c.__name__)
+
+    def to_dict(self) -> dict:
+        return {
+            "rules": {
+                name: {
+                    "consumes": sorted(c.__name__ for c in self.consumes[name]),
+                    "negates": sorted(c.__name__ for c in self.negates[name]),
+                    "produces": sorted(c.__name__ for c in self.produces[name]),
+                }
+                for name in self.consumes
+            },
+            "facts": {
+                c.__name__: {"producers": self.producers(c), "consumers": self.consumers(c),
+                             "output": c in OUTPUT_FACT_CLASSES}
+                for c in self.fact_classes()
+            },
+        }
+
+
+@lru_cache(maxsize=None)
+def build_rule_graph(rule_base: CompiledRuleBase = None) -> RuleGraph:
+    rule_base = rule_base or compile_rule_base()
+    patterns = rule_base.patterns
+    # Facts RHS with bindings are probed with: every input value, all product types
+    inputs = [fact for product in ProductType for fact in input_facts(product.value)]
+    graph = RuleGraph()
+    for rule in rule_base.rules:
+        graph.consumes[rule.name] = {patterns[p].fact_class for b in rule.branches for p in b.positive}
+        graph.negates[rule.name] = {patterns[p].fact_class for b in rule.branches for p in b.negative}
+        graph.produces[rule.name] = {type(fact) for fact, _ in rule_effects(rule_base, rule, rule.branches, inputs)}
+    return graph
+
+
+def unreachable_rules(rule_base: CompiledRuleBase = None) -> List[str]:
+    """Rules that cannot fire for any product type"""
+    rule_base = rule_base or compile_rule_base()
+    reachable = set()
+    for product in ProductType:
+        reachable.update(product_rule_names(product.value, rule_base))
+    return [rule.name for rule in rule_base.rules if rule.name not in reachable]
+
+
+def needed_rules(graph: RuleGraph, fact_classes: Iterable[type], excluded=()) -> List[str]:
+    """Rules that produce the fact classes, or facts those rules read, transitively (excluded rules don't count)"""
+    candidates = [name for name in graph.produces if name not in set(excluded)]
+    needed_classes = set(fact_classes)
+    needed = set()
+    changed = True
+    while changed:
+        changed = False
+        for name in candidates:
+            if name not in needed and graph.produces[name] & needed_classes:
+                needed.add(name)
+                needed_classes |= graph.consumes[name] | graph.negates[name]
+                changed = True
+    return [name for name in candidates if name in needed]
+
+
+def unused_rules(graph: RuleGraph, excluded=()) -> List[str]:
+    """Rules whose facts never reach aggregation, directly or through other rules (excluded rules don't count)"""
+    needed = set(needed_rules(graph, OUTPUT_FACT_CLASSES, excluded))
+    return [name for name in graph.produces if name not in needed and name not in set(excluded)]
+
+
+def section_fact_classes(sections: Iterable[str]) -> FrozenSet[type]:
+    unknown = [s for s in sections if s not in SECTION_FACT_CLASSES]
+    if unknown:
+        raise ValueError(f"Unknown output sections {unknown}, expected any of {list(SECTIONS)}")
+    return frozenset(c for s in sections for c in SECTION_FACT_CLASSES[s])
+
+
+@lru_cache(maxsize=None)
+def _fact_class_rule_base(fact_classes: FrozenSet[type], rule_base: CompiledRuleBase) -> CompiledRuleBase:
+    return rule_base.subset(needed_rules(build_rule_graph(rule_base), fact_classes))
+
+
+def section_rule_base(sections: Iterable[str], rule_base: CompiledRuleBase = None) -> CompiledRuleBase:
+    """The rules the given output sections depend on; selections reading the same facts share one rule base"""
+    return _fact_class_rule_base(section_fact_classes(sections), rule_base or compile_rule_base())
+
+
+def section_dependencies(rule_base: CompiledRuleBase = None) -> Dict[str, dict]:
+    """Output section -> fact classes, rule count and rule layers it depends on"""
+    rule_base = rule_base or compile_rule_base()
+    layers = rule_layers(rule_base.engine_class)
+    dependencies = {}
+    for section in SECTIONS:
+        rules = section_rule_base([section], rule_base).rules
+        section_layers = {layers.get(rule.name) for rule in rules}
+        dependencies[section] = {
+            "facts": sorted(c.__name__ for c in SECTION_FACT_CLASSES[section]),
+            "rules": len(rules),
+            "layers": [layer for layer in LAYER_ORDER if layer in section_layers],
+        }
+    return dependencies
+
+
+@lru_cache(maxsize=None)
+def minimized_rule_base(path: str) -> CompiledRuleBase:
+    """The full rule base restricted to a rule set written by minimize_rules.py"""
+    with open(path, "r", encoding="utf-8") as f:
+        rule_set = json.load(f)
+    rule_base = compile_rule_base()
+    names = {rule.name for rule in rule_base.rules}
+    listed = set(rule_set["rules"]) | set(rule_set["removed"])
+    if listed != names:
+        raise ValueError(
+            f"Rule set {path} was built for different rules ({len(listed ^ names)} differ), rerun minimize_rules.py")
+    return rule_base.subset(rule_set["rules"])
@@ -0,0 +1,152 @@
+"""
+Rule Layers
+The engine's twelve layers exist only as section headers in comprehensive_engine.py
+("# ===== LAYER 3B: Differentiated Channel Rules =====") and salience does not follow
+them (layer 3B and layer 11 overlap, several layers use the default salience). The
+layer of a rule is therefore the last header above its definition in the source.
+
+LayerProfile folds the per-rule counters of profiled engine runs (see rule_profiler)
+into per-layer firing time and facts added, per run and in total.
+"""
+import inspect
+import re
+import threading
+from functools import lru_cache
+from typing import Dict, List, Tuple
+
+from experta.rule import Rule
+
+from services.comprehensive_engine import ComprehensiveMarketingEngine
+from services.metrics import get_registry
+
+_LAYER_HEADER = re.compile(r"#\s*=+\s*LAYER\s+(\d+[A-Z]?)\s*:\s*(.*?)\s*=+\s*$")
+
+# Layers in firing-design order; the first channel block is headed "LAYER 3"
+LAYER_ORDER = ("0", "1", "2", "3A", "3B", "3C", "3D", "3E", "4", "5", "6", "7", "8", "9", "10", "11", "12")
+UNASSIGNED = "unassigned"
+
+# Per-layer firing time per run is microseconds with the compiled engines, milliseconds with Experta
+LAYER_BUCKETS = (0.000001, 0.0000025, 0.000005, 0.00001, 0.000025, 0.00005, 0.0001,
+                 0.00025, 0.0005, 0.001, 0.0025, 0.005, 0.01, 0.025, 0.05)
+
+LAYER_SECONDS = get_registry().histogram(
+    "marx_layer_duration_seconds", "Time spent firing each layer's rules per engine run (MARX_PROFILE_LAYERS=1)",
+    ("layer",), LAYER_BUCKETS)
+LAYER_FIRINGS = get_registry().counter(
+    "marx_layer_firings_total", "Rule firings per layer (MARX_PROFILE_LAYERS=1)", ("layer",))
+LAYER_FACTS = get_registry().counter(
+    "marx_layer_facts_total", "Facts added to working memory per layer (MARX_PROFILE_LAYERS=1)", ("layer",))
+
+
+def _normalize(layer: str) -> str:
+    return "3A" if layer == "3" else layer
+
+
+@lru_cache(maxsize=None)
+def layer_headers(engine_class: type = ComprehensiveMarketingEngine) -> Tuple[Tuple[int, str, str], ...]:
+    """(line number, layer, title) of every LAYER header in the engine's source"""
+    lines, first = inspect.getsourcelines(engine_class)
+    headers = []
+    for offset, line in enumerate(lines):
+        match = _LAYER_HEADER.search(line.strip())
+        if match:
+            title = re.sub(r"\s*\(Salience.*?\)", "", match.group(2))
+            headers.append((first + offset, _normalize(match.group(1)), title))
+    return tuple(headers)
+
+
+@lru_cache(maxsize=None)
+def rule_layers(engine_class: type = ComprehensiveMarketingEngine) -> Dict[str, str]:
+    """Rule method name -> layer"""
+    headers = layer_headers(engine_class)
+    members = {}
+    for klass in reversed(engine_class.__mro__):
+        members.update(vars(klass))
+
+    layers = {}
+    for name, member in members.items():
+        if not isinstance(member, Rule):
+            continue
+        line = member._wrapped.__code__.co_firstlineno
+        layers[name] = UNASSIGNED
+        for header_line, layer, _ in headers:
+            if header_line > line:
+                break
+            layers[name] = layer
+    return layers
+
+
+def layer_titles(engine_class: type = ComprehensiveMarketingEngine) -> Dict[str, str]:
+    return {layer: title for _, layer, title in layer_headers(engine_class)}
+
+
+def layers_of_run(run_counters: Dict[str, List]) -> Dict[str, List]:
+    """Per-rule counters of one run -> {layer: [firings, seconds, facts]} for every layer"""
+    layers = rule_layers()
+    totals = {layer: [0, 0.0, 0] for layer in LAYER_ORDER}
+    for name, (_, firings, seconds, facts) in run_counters.items():
+        layer_totals = totals.setdefault(layers.get(name, UNASSIGNED), [0, 0.0, 0])
+        layer_totals[0] += firings
+        layer_totals[1] += seconds
+        layer_totals[2] += facts
+    return totals
+
+
+def describe_layers(totals: Dict[str, List], runs: int = 1) -> List[dict]:
+    titles = layer_titles()
+    rule_counts = {}
+    for layer in rule_layers().values():
+        rule_counts[layer] = rule_counts.get(layer, 0) + 1
+    return [
+        {
+            "layer": layer,
+            "title": titles.get(layer, ""),
+            "rules": rule_counts.get(layer, 0),
+            "firings": firings,
+            "total_ms": round(seconds * 1000, 4),
+            "facts_added": facts,
+            "ms_per_run": round(seconds * 1000 / runs, 4) if runs else 0.0,
+            "facts_per_run": round(facts / runs, 3) if runs else 0.0,
+        }
+        for layer, (firings, seconds, facts) in totals.items()
+    ]
+
+
+class LayerProfile:
+    """Thread-safe per-layer totals across runs; also feeds the layer metrics"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.runs = 0
+            self.totals = {layer: [0, 0.0, 0] for layer in LAYER_ORDER}
+
+    def record(self, run_counters: Dict[str, List]):
+        run = layers_of_run(run_counters)
+        for layer, (firings, seconds, facts) in run.items():
+            LAYER_SECONDS.observe(seconds, layer=layer)
+            if firings:
+                LAYER_FIRINGS.inc(firings, layer=layer)
+                LAYER_FACTS.inc(facts, layer=layer)
+        with self._lock:
+            self.runs += 1
+            for layer, values in run.items():
+                totals = self.totals.setdefault(layer, [0, 0.0, 0])
+                for i, value in enumerate(values):
+                    totals[i] += value
+
+    def report(self) -> dict:
+        with self._lock:
+            runs = self.runs
+            totals = {layer: list(values) for layer, values in self.totals.items()}
+        return {"runs": runs, "layers": describe_layers(totals, runs)}
+
+
+_layer_profile = LayerProfile()
+
+
+def get_layer_profile() -> LayerProfile:
+    return _layer_profile
@@ -0,0 +1,203 @@
+"""
+Rule Firing Profiler
+Opt-in (MARX_PROFILE_RULES=1) per-rule statistics: how often each rule method is
+activated and fired, the time spent in its RHS and how many new facts it declared.
+Profiled engines collect counters for one run and merge them into the process-wide
+RuleProfiler when the run ends, so the report aggregates every analysis served.
+The same counters feed the per-layer profile (MARX_PROFILE_LAYERS=1, rule_layers).
+"""
+import json
+import threading
+import time
+from typing import Dict, List
+
+import config
+from services.bitset_matcher import BitsetMarketingEngine
+from services.comprehensive_engine import ComprehensiveMarketingEngine
+from services.native_engine import NativeMarketingEngine
+from services.rule_layers import get_layer_profile
+
+SORT_KEYS = ("time", "firings", "activations", "facts", "name")
+
+
+class RuleProfiler:
+    """Thread-safe per-rule totals across runs"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.reset()
+
+    def reset(self):
+        with self._lock:
+            self.runs = 0
+            # rule name -> [activations, firings, seconds, facts declared]
+            self.rules: Dict[str, List] = {}
+
+    def record(self, run_counters: Dict[str, List]):
+        """Merge the counters of one engine run"""
+        with self._lock:
+            self.runs += 1
+            for name, counters in run_counters.items():
+                totals = self.rules.setdefault(name, [0, 0, 0.0, 0])
+                for i, value in enumerate(counters):
+                    totals[i] += value
+
+    def report(self, sort: str = "time", top: int = None) -> dict:
+        if sort not in SORT_KEYS:
+            raise ValueError(f"Unknown sort key {sort!r}, expected one of {SORT_KEYS}")
+        with self._lock:
+            runs = self.runs
+            rules = [
+                {
+                    "rule": name,
+                    "activations": activations,
+                    "firings": firings,
+                    "fire_ratio": round(firings / activations, 4) if activations else 0.0,
+                    "total_ms": round(seconds * 1000, 3),
+                    "mean_us": round(seconds / firings * 1e6, 3) if firings else 0.0,
+                    "facts_declared": facts,
+                    "firings_per_run": round(firings / runs, 4) if runs else 0.0,
+                }
+                for name, (activations, firings, seconds, facts) in self.rules.items()
+            ]
+
+        field = {"time": "total_ms", "firings": "firings", "activations": "activations",
+                 "facts": "facts_declared", "name": "rule"}[sort]
+        rules.sort(key=lambda r: r[field], reverse=sort != "name")
+        return {
+            "runs": runs,
+            "rules_seen": len(rules),
+            "total_firings": sum(r["firings"] for r in rules),
+            "total_rhs_ms": round(sum(r["total_ms"] for r in rules), 3),
+            "rules": rules[:top] if top else rules,
+        }
+
+    def dump(self, path: str, sort: str = "time"):
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump(self.report(sort), f, indent=2)
+
+
+_profiler = RuleProfiler()
+
+
+def get_rule_profiler() -> RuleProfiler:
+    return _profiler
+
+
+def profiling_enabled() -> bool:
+    return config.PROFILE_RULES or config.PROFILE_LAYERS
+
+
+def _record_run(engine, run_counters: dict):
+    """End of a profiled run: keep its counters on the engine and merge them into the enabled profiles"""
+    engine.last_run_counters = run_counters
+    if not engine.record_runs:
+        return
+    if config.PROFILE_RULES:
+        _profiler.record(run_counters)
+    if config.PROFILE_LAYERS:
+        get_layer_profile().record(run_counters)
+
+
+def _counters(run_counters: dict, name: str) -> list:
+    counters = run_counters.get(name)
+    if counters is None:
+        counters = run_counters[name] = [0, 0, 0.0, 0]
+    return counters
+
+
+class _ProfiledNative:
+    """Profiling for the compiled engines: wraps activation queueing and rule firing"""
+    # False for one-off debug runs that should not count towards the process-wide profiles
+    record_runs = True
+
+    def __init__(self, *args, **kwargs):
+        self._run_counters = {}
+        self.last_run_counters = {}
+        super().__init__(*args, **kwargs)
+
+    def reset(self):
+        self._run_counters = {}
+        super().reset()
+
+    def run(self, steps=float('inf')):
+        try:
+            super().run(steps)
+        finally:
+            _record_run(self, self._run_counters)
+            self._run_counters = {}
+
+    def _push(self, r_pos: int, b_pos: int, combo: tuple):
+        queued = len(self._agenda)
+        super()._push(r_pos, b_pos, combo)
+        if len(self._agenda) > queued:
+            _counters(self._run_counters, self.rule_base.rules[r_pos].name)[0] += 1
+
+    def _fire(self, rule, branch, fact_ids):
+        facts = len(self.facts)
+        started = time.perf_counter()
+        super()._fire(rule, branch, fact_ids)
+        counters = _counters(self._run_counters, rule.name)
+        counters[1] += 1
+        counters[2] += time.perf_counter() - started
+        counters[3] += len(self.facts) - facts
+
+
+class ProfiledNativeEngine(_ProfiledNative, NativeMarketingEngine):
+    pass
+
+
+class ProfiledBitsetEngine(_ProfiledNative, BitsetMarketingEngine):
+    pass
+
+
+class ProfiledComprehensiveEngine(ComprehensiveMarketingEngine):
+    """ComprehensiveMarketingEngine that times every rule it fires"""
+    record_runs = True
+
+    def __init__(self):
+        self._run_counters = {}
+        self.last_run_counters = {}
+        super().__init__()
+
+    def reset(self, **kwargs):
+        self._run_counters = {}
+        super().reset(**kwargs)
+
+    def get_activations(self):
+        added, removed = super().get_activations()
+        for activation in added:
+            _counters(self._run_counters, activation.rule.__name__)[0] += 1
+        return added, removed
+
+    def run(self, steps=float('inf')):
+        # KnowledgeEngine.run without the watcher logging, with each RHS call timed
+        self.running = True
+        try:
+            while steps > 0 and self.running:
+                added, removed = self.get_activations()
+                self.strategy.update_agenda(self.agenda, added, removed)
+
+                activation = self.agenda.get_next()
+                if activation is None:
+                    break
+                steps -= 1
+
+                facts = len(self.facts)
+                started = time.perf_counter()
+                activation.rule(self, **{k: v for k, v in activation.context.items() if not k.startswith('__')})
+                counters = _counters(self._run_counters, activation.rule.__name__)
+                counters[1] += 1
+                counters[2] += time.perf_counter() - started
+                counters[3] += len(self.facts) - facts
+        finally:
+            self.running = False
+            _record_run(self, self._run_counters)
+            self._run_counters = {}
+
+
+PROFILED_ENGINE_CLASSES = {
+    "native": ProfiledNativeEngine,
+    "bitset": ProfiledBitsetEngine,
+    "experta": ProfiledComprehensiveEngine,
+}
@@ -0,0 +1,76 @@
+"""
+Server-Timing
+Per-request phase durations reported back to the client in a Server-Timing header.
+A ServerTiming is bound to the current request through a context variable, so the
+service layer can record phases without passing it around; outside an instrumented
+request (batch items, CLI tools, worker processes) recording is a no-op.
+"""
+import time
+from contextvars import ContextVar
+from typing import Optional
+
+_current: ContextVar[Optional["ServerTiming"]] = ContextVar("server_timing", default=None)
+
+
+class ServerTiming:
+    """Durations (seconds) of the phases of one request, in the order first recorded"""
+
+    def __init__(self):
+        self.started = time.perf_counter()
+        self.durations = {}
+        self.cache = None
+        # perf_counter() when the handler returned, to time the response encoding after it
+        self.handler_done = None
+
+    def add(self, name: str, seconds: float):
+        self.durations[name] = self.durations.get(name, 0.0) + seconds
+
+    def header(self) -> str:
+        """validation;dur=0.120, cache;desc="miss";dur=0.004, ..., total;dur=1.530 (milliseconds)"""
+        now = time.perf_counter()
+        if self.handler_done is not None:
+            self.add("serialization", now - self.handler_done)
+        entries = []
+        for name, seconds in self.durations.items():
+            desc = f';desc="{self.cache}"' if name == "cache" and self.cache else ""
+            entries.append(f"{name}{desc};dur={seconds * 1000:.3f}")
+        entries.append(f"total;dur={(now - self.started) * 1000:.3f}")
+        return ", ".join(entries)
+
+
+def start_timing() -> ServerTiming:
+    """Bind a new ServerTiming to the current request context"""
+    timing = ServerTiming()
+    _current.set(timing)
+    return timing
+
+
+def current_timing() -> Optional[ServerTiming]:
+    return _current.get()
+
+
+def record_timing(name: str, seconds: float):
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, seconds)
+
+
+def record_since_start(name: str):
+    """Time from the start of the request until now, e.g. body parsing and validation"""
+    timing = _current.get()
+    if timing is not None:
+        timing.add(name, time.perf_counter() - timing.started)
+
+
+def record_cache(status: str, seconds: float):
+    """Cache lookup duration and outcome: hit (result cache), table (decision table) or miss"""
+    timing = _current.get()
+    if timing is not None:
+        timing.cache = status
+        timing.add("cache", seconds)
+
+
+def mark_handler_done():
+    timing = _current.get()
+    if timing is not None:
+        timing.handler_done = time.perf_counter()
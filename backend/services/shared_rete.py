@@ -0,0 +1,97 @@
+"""
+Shared Rete Network
+Experta's ReteMatcher compiles every @Rule (DNF, alpha checks, beta wiring) each time
+an engine is constructed. SharedReteMatcher compiles the network once per engine class
+and keeps it as a frozen prototype; each engine only gets a structural copy of the
+nodes with empty memories, i.e. its own working memory and nothing else.
+"""
+import copy
+import threading
+from types import SimpleNamespace
+
+from experta.abstract import Matcher
+from experta.matchers.rete import ReteMatcher
+from experta.matchers.rete.mixins import ChildNode
+from experta.matchers.rete.nodes import BusNode
+
+
+def _walk(root):
+    """Every node reachable from root, each once"""
+    seen = {}
+    stack = [root]
+    while stack:
+        node = stack.pop()
+        if id(node) not in seen:
+            seen[id(node)] = node
+            stack.extend(child.node for child in node.children)
+    return list(seen.values())
+
+
+class ReteNetwork:
+    """
+    Compiled network of one engine class. It is never activated: children are frozen
+    into tuples so any attempt to grow or feed it fails, and engines work on copies.
+    """
+
+    def __init__(self, engine):
+        root = BusNode()
+        ruleset = ReteMatcher.prepare_ruleset(engine)
+        alpha_terminals = ReteMatcher.build_alpha_part(ruleset, root)
+        ReteMatcher.build_beta_part(ruleset, alpha_terminals)
+
+        # Same traversal ReteMatcher uses, so activations are collected in the same node order
+        conflict_set_nodes = ReteMatcher._get_conflict_set_nodes.__wrapped__(SimpleNamespace(root_node=root))
+
+        self.root_node = root
+        self.nodes = _walk(root)
+        self.conflict_set_nodes = conflict_set_nodes
+        for node in self.nodes:
+            node.children = tuple(node.children)
+
+    def instantiate(self):
+        """Copy of the network with its own memories; returns (root node, conflict set nodes)"""
+        clones = {}
+        for node in self.nodes:
+            clone = copy.copy(node)
+            for name, value in vars(node).items():
+                # The prototype never saw a token, so every container is empty: give the copy its own
+                if isinstance(value, (list, set, dict)):
+                    setattr(clone, name, type(value)())
+            clone._reset()
+            clones[id(node)] = clone
+
+        for node in self.nodes:
+            clones[id(node)].children = [
+                ChildNode(clones[id(child.node)], getattr(clones[id(child.node)], child.callback.__name__))
+                for child in node.children
+            ]
+
+        return clones[id(self.root_node)], tuple(clones[id(n)] for n in self.conflict_set_nodes)
+
+
+_networks = {}
+_networks_lock = threading.Lock()
+
+
+def get_network(engine) -> ReteNetwork:
+    """Build the network of the engine's class on first use, then reuse it"""
+    engine_class = type(engine)
+    network = _networks.get(engine_class)
+    if network is None:
+        with _networks_lock:
+            network = _networks.get(engine_class)
+            if network is None:
+                network = ReteNetwork(engine)
+                _networks[engine_class] = network
+    return network
+
+
+class SharedReteMatcher(ReteMatcher):
+    """ReteMatcher whose network is copied from the per-class prototype instead of rebuilt"""
+
+    def __init__(self, engine):
+        Matcher.__init__(self, engine)
+        self.root_node, self._conflict_set_nodes = get_network(engine).instantiate()
+
+    def _get_conflict_set_nodes(self):
+        return self._conflict_set_nodes
@@ -0,0 +1,50 @@
+"""
+Single-Flight Coalescing
+Concurrent requests for the same scenario key share one in-flight computation:
+the first caller starts it, later callers await the same result instead of
+running their own engine. Bursts of identical payloads then cost one analysis.
+"""
+import asyncio
+from typing import Awaitable, Callable, Dict, Hashable
+
+
+class SingleFlight:
+    """Deduplicates concurrent calls per key on the running event loop"""
+
+    def __init__(self):
+        self._calls: Dict[Hashable, asyncio.Task] = {}
+        self._waiters: Dict[Hashable, int] = {}
+        self.leaders = 0
+        self.coalesced = 0
+        self.max_waiters = 0
+
+    async def do(self, key: Hashable, fn: Callable[[], Awaitable]):
+        """Await fn() for key, joining the computation already running for it if there is one"""
+        task = self._calls.get(key)
+        if task is None:
+            task = asyncio.ensure_future(fn())
+            self._calls[key] = task
+            self._waiters[key] = 0
+            self.leaders += 1
+            task.add_done_callback(lambda _, key=key: self._forget(key, task))
+        else:
+            self.coalesced += 1
+            self._waiters[key] += 1
+            self.max_waiters = max(self.max_waiters, self._waiters[key])
+
+        # Shielded: a caller that goes away must not cancel the others' computation
+        return await asyncio.shield(task)
+
+    def _forget(self, key: Hashable, task: asyncio.Task):
+        if self._calls.get(key) is task:
+            del self._calls[key]
+            del self._waiters[key]
+
+    def stats(self) -> dict:
+        return {
+            "in_flight": len(self._calls),
+            "waiting": sum(self._waiters.values()),
+            "leaders": self.leaders,
+            "coalesced": self.coalesced,
+            "max_waiters": self.max_waiters,
+        }
@@ -0,0 +1,348 @@
+"""
+Staged Engine
+Splits inference into stages (groups of layers, see rule_layers) with declared input
+dependencies: the working-memory facts that match any pattern of the stage's rules.
+Each stage is memoized on its own narrow key, those input facts, so e.g. the market
+context stage (layer 1) is derived once per product type and target customer and
+reused by every request that shares them, whatever the goal, KPI or budget.
+
+What a stage caches is the list of activations it fired: rule, branch, the facts the
+activation matched and the facts its RHS declared. A request assembles its working
+memory by replaying the activations of all stages through an agenda that orders them
+exactly like NativeMarketingEngine (salience, then recency), so facts end up in the
+same order as a full engine run and aggregation gives identical results. Replay only
+orders known activations; no pattern matching or RHS runs on a stage cache hit.
+
+This is exact because derived facts are never retracted and NOT patterns only test
+input facts; both are checked when a stage is derived (StageOrderError otherwise).
+
+The raw budget is only matched as RawBudget(amount=MATCH.a) and classify_budget only
+uses its tier, so stages see it under the identity of its tier's sample amount: stage
+keys and the fact -> stages map stay bounded however many amounts requests send.
+"""
+import heapq
+import threading
+from dataclasses import dataclass
+from functools import lru_cache
+from typing import Dict, List, Optional, Tuple
+
+from experta import Fact
+from experta.fact import InitialFact
+
+import config
+from models.model import RawBudget
+from services.comprehensive_engine import budget_tier_sample_amount, classify_budget_amount
+from services.native_engine import NativeMarketingEngine
+from services.result_cache import ResultCache
+from services.rule_compiler import CompiledRuleBase, compile_rule_base, fact_identity
+from services.rule_layers import rule_layers
+
+# Stages in dependency order: each only consumes input facts and facts of earlier stages.
+# The channel layers (3A-3E, 11, 12) do not read each other's facts, so each gets its own
+# stage and its own, narrower key.
+STAGES = (
+    ("budget_tier", ("0",)),
+    ("market_context", ("1",)),
+    ("strategic_direction", ("2",)),
+    ("channel_suitability", ("3A",)),
+    ("differentiated_channels", ("3B",)),
+    ("product_base_channels", ("3C",)),
+    ("segment_channels", ("3D",)),
+    ("gap_filling_channels", ("3E",)),
+    ("sensitivity_channels", ("11",)),
+    ("combination_channels", ("12",)),
+    ("content", ("4",)),
+    ("quick_wins", ("5",)),
+    ("kpis", ("6",)),
+    ("risks", ("7",)),
+    ("budget_allocation", ("8",)),
+    ("scaling", ("9",)),
+    ("resources", ("10",)),
+)
+
+_INITIAL_IDENTITY = fact_identity(InitialFact())
+
+
+def stage_identity(fact: Fact) -> frozenset:
+    """Identity stages key, match and replay a fact under: a raw budget counts as its tier"""
+    if isinstance(fact, RawBudget):
+        fact = RawBudget(amount=budget_tier_sample_amount(classify_budget_amount(fact["amount"])))
+    return fact_identity(fact)
+
+
+class StageOrderError(RuntimeError):
+    """A stage derived a fact that an earlier stage (or a NOT pattern) depends on"""
+
+
+@dataclass(frozen=True)
+class Stage:
+    name: str
+    layers: Tuple[str, ...]
+    rule_base: CompiledRuleBase
+    # Pattern indexes (of the full rule base) the stage's rules test: its input dependencies
+    patterns: frozenset
+
+
+@dataclass(frozen=True)
+class Activation:
+    """One rule firing as recorded by a stage, with facts referred to by identity"""
+    salience: int
+    rule_index: int
+    branch: int
+    # Identities of the matched facts, in branch order
+    combo: Tuple[frozenset, ...]
+    uses_initial_fact: bool
+    # (fact, identity) of everything the RHS declared, in order, duplicates included
+    declared: Tuple[Tuple[Fact, frozenset], ...]
+    # Distinct facts the activation waits for before it can be on the agenda
+    needed: frozenset
+
+
+@lru_cache(maxsize=None)
+def build_stages(rule_base: CompiledRuleBase = None) -> Tuple[Stage, ...]:
+    rule_base = rule_base or compile_rule_base()
+    layers = rule_layers(rule_base.engine_class)
+    stages = []
+    assigned = set()
+    for name, stage_layers in STAGES:
+        names = [rule.name for rule in rule_base.rules if layers.get(rule.name) in stage_layers]
+        assigned.update(names)
+        subset = rule_base.subset(names)
+        patterns = frozenset(
+            p for rule in subset.rules for branch in rule.branches for p in branch.positive + branch.negative)
+        stages.append(Stage(name, stage_layers, subset, patterns))
+
+    missing = [rule.name for rule in rule_base.rules if rule.name not in assigned]
+    if missing:
+        raise StageOrderError(f"Rules outside every stage: {missing}")
+    return tuple(stages)
+
+
+def stage_dependencies(rule_base: CompiledRuleBase = None) -> List[dict]:
+    """Declared inputs of every stage, as fact patterns"""
+    rule_base = rule_base or compile_rule_base()
+    return [
+        {
+            "stage": stage.name,
+            "layers": list(stage.layers),
+            "rules": len(stage.rule_base.rules),
+            "inputs": sorted(str(rule_base.patterns[p]) for p in stage.patterns),
+        }
+        for stage in build_stages(rule_base)
+    ]
+
+
+class _StageCaches:
+    """One LRU cache per stage, shared by every staged engine of the process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._caches: Dict[str, ResultCache] = {}
+
+    def get(self, stage: str) -> ResultCache:
+        with self._lock:
+            cache = self._caches.get(stage)
+            if cache is None:
+                cache = self._caches[stage] = ResultCache(config.STAGE_CACHE_SIZE)
+            return cache
+
+    def stats(self) -> dict:
+        with self._lock:
+            caches = dict(self._caches)
+        return {name: cache.stats() for name, cache in caches.items()}
+
+
+_stage_caches = _StageCaches()
+# Stage identity -> indexes of the stages that depend on it. Inputs and derived facts are
+# small, fixed sets (raw budgets count as their tier); the bound is only a safety net.
+_fact_stages: Dict[frozenset, Tuple[int, ...]] = {}
+_FACT_STAGES_LIMIT = 65536
+
+
+def get_stage_cache_stats() -> dict:
+    return _stage_caches.stats()
+
+
+class _RecordingStageEngine(NativeMarketingEngine):
+    """Native engine over one stage's rules that records every activation it fires"""
+
+    def __init__(self, stage: Stage):
+        super().__init__(stage.rule_base)
+        self.activations: List[Activation] = []
+        self._declared = None
+
+    def reset(self):
+        super().reset()
+        self.activations = []
+
+    def _fire(self, rule, branch, fact_ids):
+        self._declared = []
+        super()._fire(rule, branch, fact_ids)
+        combo = tuple(self._identity_of(i) for i in fact_ids)
+        self.activations.append(Activation(
+            salience=rule.salience,
+            rule_index=rule.index,
+            branch=rule.branches.index(branch),
+            combo=combo,
+            uses_initial_fact=branch.uses_initial_fact,
+            declared=tuple(self._declared),
+            needed=frozenset(combo),
+        ))
+        self._declared = None
+
+    def _declare(self, fact: Fact, identity=None) -> Fact:
+        if identity is None:
+            identity = fact_identity(fact)
+        if self._declared is not None:
+            self._declared.append((fact, identity))
+        return super()._declare(fact, identity)
+
+    def _identity_of(self, fact_id: int) -> frozenset:
+        return stage_identity(self.facts[fact_id])
+
+
+class StagedMarketingEngine:
+    """Drop-in engine (reset(), declare(), run(), facts) that derives each stage at most once per input"""
+
+    def __init__(self, rule_base: Optional[CompiledRuleBase] = None):
+        self.rule_base = rule_base or compile_rule_base()
+        self.stages = build_stages(self.rule_base)
+        self._stage_engines = [_RecordingStageEngine(stage) for stage in self.stages]
+        # Patterns that earlier stages (or any NOT) depend on, to check each stage's output
+        self._guarded = []
+        negated = frozenset(p for rule in self.rule_base.rules for b in rule.branches for p in b.negative)
+        earlier = set()
+        for stage in self.stages:
+            self._guarded.append(frozenset(earlier) | negated)
+            earlier |= stage.patterns
+        self._pad = (1,) * self.rule_base.max_branch_facts
+        self.facts: Dict[int, Fact] = {}
+        self.running = False
+        self.fired = 0
+        self.stage_hits = 0
+        self._inputs: List[Tuple[Fact, frozenset]] = []
+
+    def reset(self):
+        self.facts = {}
+        self.running = False
+        self.fired = 0
+        self.stage_hits = 0
+        self._inputs = [(InitialFact(), _INITIAL_IDENTITY)]
+
+    def release(self):
+        self.reset()
+
+    def declare(self, *facts: Fact) -> Optional[Fact]:
+        last = None
+        for fact in facts:
+            fact.validate()
+            self._inputs.append((fact, stage_identity(fact)))
+            last = fact
+        return last
+
+    def halt(self):
+        self.running = False
+
+    def _stages_for(self, fact: Fact, identity: frozenset) -> Tuple[int, ...]:
+        stages = _fact_stages.get(identity)
+        if stages is None:
+            patterns = self.rule_base.matching_patterns(fact)
+            stages = tuple(i for i, stage in enumerate(self.stages) if stage.patterns.intersection(patterns))
+            if len(_fact_stages) < _FACT_STAGES_LIMIT:
+                _fact_stages[identity] = stages
+        return stages
+
+    def run(self, steps=float('inf')):
+        self.running = True
+        # Facts each stage depends on, filled in as inputs are known and stages derive facts
+        relevant = [[] for _ in self.stages]
+        for fact, identity in self._inputs:
+            for index in self._stages_for(fact, identity):
+                relevant[index].append((fact, identity))
+
+        known = {identity for _, identity in self._inputs}
+        activations: List[Activation] = []
+        for index, stage in enumerate(self.stages):
+            key = frozenset([identity for _, identity in relevant[index]])
+            cache = _stage_caches.get(stage.name)
+            fired = cache.get(key)
+            if fired is None:
+                fired = self._derive(index, relevant[index])
+                cache.put(key, fired)
+            else:
+                self.stage_hits += 1
+
+            for activation in fired:
+                for fact, identity in activation.declared:
+                    if identity in known:
+                        continue
+                    known.add(identity)
+                    for later in self._stages_for(fact, identity):
+                        relevant[later].append((fact, identity))
+            activations.extend(fired)
+
+        self._replay(activations, steps)
+        self.running = False
+
+    def _derive(self, index: int, relevant) -> Tuple[Activation, ...]:
+        engine = self._stage_engines[index]
+        engine.reset()
+        for fact, identity in relevant:
+            engine._declare(fact, identity)
+        engine.run()
+
+        guarded = self._guarded[index]
+        for activation in engine.activations:
+            for fact, _ in activation.declared:
+                if guarded.intersection(self.rule_base.matching_patterns(fact)):
+                    raise StageOrderError(
+                        f"Stage {self.stages[index].name} derives {fact!r}, which an earlier stage or a NOT depends on")
+        return tuple(engine.activations)
+
+    def _replay(self, activations: List[Activation], steps):
+        """Fire the recorded activations in NativeMarketingEngine's agenda order, building working memory"""
+        ids: Dict[frozenset, int] = {}
+        facts: Dict[int, Fact] = {}
+        # fact identity -> activations still waiting for it
+        waiting: Dict[frozenset, List[int]] = {}
+        missing = []
+        agenda = []
+
+        def push(a_pos: int):
+            activation = activations[a_pos]
+            fact_ids = tuple(ids[identity] for identity in activation.combo)
+            id_set = frozenset(fact_ids + (0,)) if activation.uses_initial_fact else frozenset(fact_ids)
+            negated = tuple(-i for i in sorted(id_set, reverse=True)) + self._pad
+            heapq.heappush(agenda, (-activation.salience, negated[:len(self._pad)],
+                                    activation.rule_index, activation.branch, fact_ids, a_pos))
+
+        def declare(fact: Fact, identity: frozenset):
+            if identity in ids:
+                return
+            ids[identity] = len(facts)
+            facts[len(facts)] = fact
+            for a_pos in waiting.pop(identity, ()):
+                missing[a_pos] -= 1
+                if not missing[a_pos]:
+                    push(a_pos)
+
+        for a_pos, activation in enumerate(activations):
+            missing.append(len(activation.needed))
+            for identity in activation.needed:
+                waiting.setdefault(identity, []).append(a_pos)
+
+        for fact, identity in self._inputs:
+            declare(fact, identity)
+        # Activations on InitialFact alone (rules with only NOT conditions)
+        for a_pos, count in enumerate(missing):
+            if not count and not activations[a_pos].combo:
+                push(a_pos)
+
+        while steps > 0 and self.running and agenda:
+            a_pos = heapq.heappop(agenda)[-1]
+            steps -= 1
+            self.fired += 1
+            for fact, identity in activations[a_pos].declared:
+                declare(fact, identity)
+
+        self.facts = facts
@@ -0,0 +1,65 @@
+"""
+Warm Fork
+Layer 0-1 inference depends only on product type, target customer and budget tier,
+which are also the first inputs the service declares. WarmForks keeps, per engine
+class, rule base and (product, customer, tier), a snapshot of the working memory
+right after those facts are declared: matched against every pattern, activations queued.
+A request restores the snapshot, swaps in its own raw budget and declares only the
+remaining five inputs.
+
+The snapshot is taken before the engine runs. Letting the prefix rules fire first
+would number their facts before the remaining inputs, so the agenda's recency order
+(and with it the order of the facts aggregation reads) would differ from a full run.
+"""
+from typing import Optional
+
+from models.model import ProductFact, RawBudget, TargetCustomerFact
+from models.request import MarketingAnalysisRequest
+from services.comprehensive_engine import classify_budget_amount
+from services.result_cache import ResultCache
+
+def prefix_key(request: MarketingAnalysisRequest) -> tuple:
+    """The inputs layers 0 and 1 depend on"""
+    return (
+        request.product_type.value,
+        request.target_customer.value,
+        classify_budget_amount(request.raw_budget_amount).value,
+    )
+
+
+def declare_prefix(engine, request: MarketingAnalysisRequest) -> Optional[int]:
+    """
+    Declare the first three inputs, in the order the service always declares them.
+    Returns the fact id the raw budget was declared under, or None for engines that
+    only number facts when they run (the staged engine).
+    """
+    engine.declare(ProductFact(product_type=request.product_type.value))
+    budget = engine.declare(RawBudget(amount=request.raw_budget_amount))
+    engine.declare(TargetCustomerFact(customer=request.target_customer.value))
+    return next((fact_id for fact_id, fact in engine.facts.items() if fact is budget), None)
+
+
+class WarmForks:
+    """Working-memory snapshots of the declared input prefix, for the compiled engines"""
+
+    def __init__(self, max_size: int):
+        # max_size <= 0 disables snapshots: every request resets and declares the prefix
+        self._snapshots = ResultCache(max_size)
+
+    def start(self, engine, request: MarketingAnalysisRequest):
+        """Leave the engine as reset() followed by declare_prefix(engine, request) would"""
+        key = (type(engine), engine.rule_base) + prefix_key(request)
+        snapshot = self._snapshots.get(key)
+        if snapshot is None:
+            engine.reset()
+            budget_id = declare_prefix(engine, request)
+            self._snapshots.put(key, (engine.snapshot(), budget_id))
+            return
+
+        memory, budget_id = snapshot
+        engine.restore(memory)
+        # Any amount of the tier matches the same pattern; classify_budget reads the request's own
+        engine.substitute(budget_id, RawBudget(amount=request.raw_budget_amount))
+
+    def stats(self) -> dict:
+        return self._snapshots.stats()
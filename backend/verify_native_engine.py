@@ -0,0 +1,81 @@
+"""
+Check the native (compiled) or bitset engine against the Experta reference engine.
+
+Runs sampled scenarios through both engines and compares the inferred fact sets
+and the resulting recommendation templates.
+
+Usage:
+    python verify_native_engine.py --samples 500 --seed 1
+    python verify_native_engine.py --all --product local_service
+    python verify_native_engine.py --engine bitset
+
+Fact sets must always match. Templates can differ only where Experta itself is not
+deterministic (rules tied on salience and facts), so run it under several PYTHONHASHSEED
+values before treating a template difference as a bug.
+"""
+import compat
+import argparse
+import random
+import sys
+import time
+
+from models.model import ProductType
+from services.comprehensive_service import _run_engine, _build_template, request_for_scenario
+from services.decision_table import iter_scenario_keys
+from services.rule_compiler import fact_identity
+
+
+def compare(keys, engine="native"):
+    fact_mismatches = []
+    template_mismatches = []
+    timings = {"experta": 0.0, engine: 0.0}
+
+    for key in keys:
+        request = request_for_scenario(key)
+        engines = {}
+        for mode in timings:
+            started = time.perf_counter()
+            engines[mode] = _run_engine(request, mode)
+            timings[mode] += time.perf_counter() - started
+
+        reference = {fact_identity(f) for f in engines["experta"].facts.values()}
+        candidate = {fact_identity(f) for f in engines[engine].facts.values()}
+        if reference != candidate:
+            fact_mismatches.append(key)
+        elif _build_template(engines["experta"], request) != _build_template(engines[engine], request):
+            template_mismatches.append(key)
+
+    return fact_mismatches, template_mismatches, timings
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare the native engine with the Experta engine")
+    parser.add_argument("--engine", choices=["native", "bitset"], default="native")
+    parser.add_argument("--samples", type=int, default=300)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--all", action="store_true", help="Check every scenario instead of a sample")
+    parser.add_argument("--product", action="append", choices=[p.value for p in ProductType],
+                        help="Only check scenarios for this product type (repeatable)")
+    args = parser.parse_args()
+
+    keys = list(iter_scenario_keys(args.product))
+    if not args.all and args.samples < len(keys):
+        keys = random.Random(args.seed).sample(keys, args.samples)
+
+    fact_mismatches, template_mismatches, timings = compare(keys, args.engine)
+
+    for key in fact_mismatches:
+        print(f"FACTS differ: {'|'.join(key)}", file=sys.stderr)
+    for key in template_mismatches:
+        print(f"template differs (tie order): {'|'.join(key)}", file=sys.stderr)
+
+    print(f"{len(keys)} scenarios: {len(fact_mismatches)} fact set mismatches, "
+          f"{len(template_mismatches)} template differences")
+    for mode, total in timings.items():
+        print(f"  {mode}: {total / len(keys) * 1000:.2f} ms per scenario")
+
+    sys.exit(1 if fact_mismatches else 0)
+
+
+if __name__ == "__main__":
+    main()
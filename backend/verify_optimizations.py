@@ -0,0 +1,426 @@
+"""
+Check the serving optimizations against a plain engine run and their own contracts.
+
+Engines are compared, on sampled scenarios at two amounts of each budget tier, against
+a cold run (reset + declare, no warm fork) of the native engine over the full rule base.
+
+Checks:
+- equal templates from warm fork snapshots (the second amount of a tier restores the
+  snapshot the first one took), product-pruned rule bases, the bitset and staged engines,
+  the rule base without unused/unreachable rules, the minimized rule set (--rule-set) and
+  every ?fields= section rule base;
+- decision table round trip, and refusal of tables built for other rules or aggregation code;
+- refusal of rule sets written for other rules;
+- result cache hits, misses, LRU eviction, TTL expiry and single-lookup counting;
+- engine pool reset on release and discard on error;
+- admission control (rejected when full, slots held until cancelled work finishes);
+- single-flight dedupe and error fan-out;
+- per-item errors and scenario dedupe of /api/analyze/batch and /api/analyze/stream, results
+  equal to an uncached run, and ?fields= selection and validation.
+
+Usage:
+    python verify_optimizations.py --samples 300 --seed 1
+    python verify_optimizations.py --rule-set rule_set.json
+
+Exits 1 if any check fails.
+"""
+import compat
+import argparse
+import asyncio
+import gzip
+import json
+import os
+import random
+import sys
+import tempfile
+import threading
+import time
+from concurrent.futures import ThreadPoolExecutor
+from contextlib import contextmanager
+
+from fastapi.testclient import TestClient
+
+from app import app
+from services import comprehensive_service as service
+from services.analysis_executor import AnalysisAdmission, AnalysisQueueFull
+from services.comprehensive_engine import budget_tier_sample_amount, classify_budget_amount
+from services.decision_table import DecisionTable, iter_scenario_keys
+from services.engine_pool import EnginePool
+from services.native_engine import NativeMarketingEngine
+from services.product_engines import product_rule_base
+from services.result_cache import ResultCache
+from services.rule_compiler import compile_rule_base
+from services.rule_graph import (
+    build_rule_graph,
+    minimized_rule_base,
+    section_rule_base,
+    unreachable_rules,
+    unused_rules,
+)
+from services.single_flight import SingleFlight
+from services.warm_fork import WarmForks
+
+# Template attribute of each output section (total_monthly_budget needs no rules)
+SECTION_ATTRIBUTES = {
+    "recommended_strategies": "recommended_strategies",
+    "critical_insights": "critical_insights",
+    "budget_allocation": "budget_shares",
+    "channel_tactics": "channel_tactics",
+    "action_plan": "action_plan",
+    "resources": "resources",
+}
+
+_reference_engine = None
+_reference_templates = {}
+
+
+# === TEMPLATE EQUIVALENCE ===
+
+@contextmanager
+def warm_forks(max_size: int):
+    """Compiled engines start from fresh warm fork snapshots; with 0, they reset and declare every input"""
+    previous = service._warm_forks
+    service._warm_forks = WarmForks(max_size)
+    try:
+        yield
+    finally:
+        service._warm_forks = previous
+
+
+def run_template(engine, request, sections=None):
+    service._declare_and_run(engine, request)
+    return service._build_template(engine, request, sections)
+
+
+def reference_template(request):
+    """Template of a cold native run over the full rule base, computed once per request"""
+    global _reference_engine
+    key = request.model_dump_json()
+    if key not in _reference_templates:
+        if _reference_engine is None:
+            _reference_engine = NativeMarketingEngine(compile_rule_base())
+        with warm_forks(0):
+            _reference_templates[key] = run_template(_reference_engine, request)
+    return _reference_templates[key]
+
+
+def other_amount(request, rng) -> float:
+    """A different budget amount of the same tier"""
+    tier = classify_budget_amount(request.raw_budget_amount)
+    upper = budget_tier_sample_amount(tier)
+    while True:
+        amount = round(upper * rng.uniform(0.01, 1.0), 2)
+        if classify_budget_amount(amount) == tier:
+            return amount
+
+
+def sample_requests(keys, rng) -> list:
+    """Each scenario at its tier's sample amount and at another amount of the same tier"""
+    requests = []
+    for key in keys:
+        request = service.request_for_scenario(key)
+        requests.append(request)
+        requests.append(request.model_copy(update={"raw_budget_amount": other_amount(request, rng)}))
+    return requests
+
+
+def label(request) -> str:
+    return "|".join(service.scenario_key(request)) + f" @ {request.raw_budget_amount}"
+
+
+def check_engine(requests, engine, snapshots: int = 0) -> list:
+    """Requests whose template from engine differs from the reference, run cold unless snapshots are allowed"""
+    with warm_forks(snapshots):
+        return [label(request) for request in requests if run_template(engine, request) != reference_template(request)]
+
+
+def pruned_rule_base():
+    """The full rule base without unreachable rules and rules no output depends on"""
+    full = compile_rule_base()
+    removed = set(unreachable_rules(full))
+    removed.update(unused_rules(build_rule_graph(full), removed))
+    return full.subset([rule.name for rule in full.rules if rule.name not in removed])
+
+
+def check_product_engines(requests) -> list:
+    """Each product's requests on an engine over the rules pruned to that product"""
+    failures = []
+    for product in sorted({request.product_type.value for request in requests}):
+        engine = NativeMarketingEngine(product_rule_base(product))
+        failures += check_engine([request for request in requests if request.product_type.value == product], engine)
+    return failures
+
+
+def check_sections(requests) -> list:
+    """Each output section from an engine over just the rules it depends on, for the request's product"""
+    failures = []
+    with warm_forks(0):
+        for section, attribute in SECTION_ATTRIBUTES.items():
+            engines = {}
+            for request in requests:
+                product = request.product_type.value
+                if product not in engines:
+                    engines[product] = NativeMarketingEngine(section_rule_base([section], product_rule_base(product)))
+                template = run_template(engines[product], request, (section,))
+                if getattr(template, attribute) != getattr(reference_template(request), attribute):
+                    failures.append(f"?fields={section}: {label(request)}")
+    return failures
+
+
+# === DECISION TABLE ===
+
+def _rewrite(path: str, **changes):
+    with gzip.open(path, "rt", encoding="utf-8") as f:
+        payload = json.load(f)
+    payload.update(changes)
+    with gzip.open(path, "wt", encoding="utf-8") as f:
+        json.dump(payload, f)
+
+
+def check_decision_table(keys) -> list:
+    failures = []
+    full = compile_rule_base()
+    aggregation = service.aggregation_fingerprint()
+    with tempfile.TemporaryDirectory() as directory:
+        table = DecisionTable()
+        for key in keys[:5]:
+            table.add(key, service.compute_template(service.request_for_scenario(key), "native").model_dump())
+        path = os.path.join(directory, "table.json.gz")
+        table.save(path, aggregation)
+        loaded = DecisionTable.load(path, aggregation)
+        if any(loaded.lookup(key) != table.lookup(key) for key in keys[:5]):
+            failures.append("round trip")
+
+        stale = {
+            "rules": {"rule_base": full.subset([r.name for r in full.rules[1:]]).fingerprint()},
+            "aggregation code": {"aggregation": "0" * 64},
+        }
+        for name, changes in stale.items():
+            table.save(path, aggregation)
+            _rewrite(path, **changes)
+            try:
+                DecisionTable.load(path, aggregation)
+                failures.append(f"table for other {name} loaded")
+            except ValueError:
+                pass
+    return failures
+
+
+# === RESULT CACHE ===
+
+def check_result_cache() -> list:
+    failures = []
+    cache = ResultCache(2)
+    cache.put("a", 1)
+    cache.put("b", 2)
+    cache.get("a")
+    cache.put("c", 3)  # evicts b, the least recently used
+    if cache.get("b") is not None or cache.get("a") != 1 or cache.get("c") != 3:
+        failures.append("LRU eviction")
+    # get_any counts one hit or one miss, however many keys it tries
+    if cache.get_any("x", "c") != 3 or cache.get_any("x", "y") is not None:
+        failures.append("get_any values")
+    stats = cache.stats()
+    if (stats["hits"], stats["misses"], stats["evictions"]) != (4, 2, 1):
+        failures.append(f"counters {stats}")
+
+    expiring = ResultCache(2, ttl_seconds=0.01)
+    expiring.put("a", 1)
+    time.sleep(0.02)
+    if expiring.get("a") is not None or expiring.stats()["expirations"] != 1:
+        failures.append("TTL expiry")
+    if ResultCache(0).get("a") is not None:
+        failures.append("disabled cache")
+    return failures
+
+
+# === ENGINE POOL ===
+
+def check_engine_pool(request) -> list:
+    failures = []
+    pool = EnginePool(NativeMarketingEngine, 1, timeout=1.0)
+    with pool.checkout() as engine:
+        run_template(engine, request)
+        first = engine
+    # Reset leaves only InitialFact
+    if len(first.facts) != 1:
+        failures.append("released engine still holds the run's facts")
+
+    try:
+        with pool.checkout() as engine:
+            raise RuntimeError("analysis failed")
+    except RuntimeError:
+        pass
+    with pool.checkout() as engine:
+        if engine is first:
+            failures.append("engine of a failed analysis went back to the pool")
+    if pool.stats()["discarded"] != 1:
+        failures.append(f"discard counter {pool.stats()}")
+    return failures
+
+
+# === ADMISSION CONTROL ===
+
+async def _check_admission() -> list:
+    failures = []
+    executor = ThreadPoolExecutor(1)
+    admission = AnalysisAdmission(workers=1, max_queue=1)
+    release = threading.Event()
+
+    running = asyncio.ensure_future(admission.run(executor, release.wait, 5))
+    queued = asyncio.ensure_future(admission.run(executor, time.sleep, 0))
+    await asyncio.sleep(0.05)
+    try:
+        await admission.run(executor, time.sleep, 0)
+        failures.append("admitted past workers + max_queue")
+    except AnalysisQueueFull as e:
+        if e.retry_after < 1:
+            failures.append("Retry-After below the floor")
+
+    # A cancelled caller keeps its slot until the worker is done with the analysis
+    running.cancel()
+    await asyncio.sleep(0.05)
+    if admission.stats()["in_flight"] != 2:
+        failures.append(f"slot freed before the analysis finished: {admission.stats()}")
+    release.set()
+    await queued
+
+    try:
+        await admission.run(executor, lambda: 1 / 0)
+    except ZeroDivisionError:
+        pass
+    await asyncio.sleep(0.05)
+    stats = admission.stats()
+    expected = {"in_flight": 0, "rejected": 1, "completed": 2, "failed": 1, "cancelled": 1}
+    if {k: stats[k] for k in expected} != expected:
+        failures.append(f"counters {stats}")
+    executor.shutdown()
+    return failures
+
+
+# === SINGLE-FLIGHT ===
+
+async def _check_single_flight() -> list:
+    failures = []
+    flight = SingleFlight()
+    calls = []
+
+    async def compute():
+        calls.append(1)
+        await asyncio.sleep(0.02)
+        return object()
+
+    results = await asyncio.gather(*(flight.do("key", compute) for _ in range(5)))
+    if len(calls) != 1 or any(result is not results[0] for result in results):
+        failures.append(f"{len(calls)} computations for 5 identical calls")
+
+    async def fail():
+        await asyncio.sleep(0.02)
+        raise AnalysisQueueFull("full", 1)
+
+    outcomes = await asyncio.gather(*(flight.do("failing", fail) for _ in range(3)), return_exceptions=True)
+    if not all(isinstance(outcome, AnalysisQueueFull) for outcome in outcomes):
+        failures.append("failure did not reach every waiter")
+    if flight.stats()["in_flight"]:
+        failures.append("finished keys still in flight")
+    return failures
+
+
+# === API ===
+
+def check_api(requests) -> list:
+    """Results served through caches and pools equal an uncached run of the configured engine"""
+    failures = []
+    # The same scenario at two amounts of its tier
+    request, same_tier = requests[0], requests[1]
+    payload, same_tier_payload = request.model_dump(mode="json"), same_tier.model_dump(mode="json")
+
+    def expected(r):
+        return service.compute_recommendation(r).model_dump(mode="json")
+
+    with TestClient(app) as client:
+        body = client.post("/api/analyze/batch", json=[payload, {"product_type": "nope"}, same_tier_payload, 7]).json()["data"]
+        statuses = [item["status"] for item in body["results"]]
+        if statuses != ["success", "error", "success", "error"] or body["unique_scenarios"] != 1:
+            failures.append(f"batch statuses {statuses}, {body['unique_scenarios']} scenarios")
+        elif body["results"][0]["data"] != expected(request) or body["results"][2]["data"] != expected(same_tier):
+            failures.append("batch result differs from an uncached run")
+
+        lines = "\n".join([json.dumps(payload), "{not json", json.dumps({"product_type": "nope"})]) + "\n"
+        response = client.post("/api/analyze/stream", content=lines.encode())
+        results = sorted((json.loads(line) for line in response.text.splitlines()), key=lambda r: r["index"])
+        if [r["status"] for r in results] != ["success", "error", "error"]:
+            failures.append(f"stream statuses {[r['status'] for r in results]}")
+        elif results[0]["data"] != expected(request):
+            failures.append("stream result differs from an uncached run")
+
+        selected = client.post("/api/analyze?fields=budget_allocation,recommended_strategies", json=payload)
+        full = expected(request)
+        if selected.json()["data"] != {k: full[k] for k in ("recommended_strategies", "budget_allocation")}:
+            failures.append("?fields= result differs from an uncached run")
+        if client.post("/api/analyze?fields=bogus", json=payload).status_code != 400:
+            failures.append("unknown ?fields= not rejected")
+    return failures
+
+
+# === RULE SETS ===
+
+def check_rule_set_loader() -> list:
+    names = [rule.name for rule in compile_rule_base().rules]
+    with tempfile.TemporaryDirectory() as directory:
+        path = os.path.join(directory, "rule_set.json")
+        with open(path, "w", encoding="utf-8") as f:
+            json.dump({"rules": names[1:], "removed": {}}, f)
+        try:
+            minimized_rule_base(path)
+            return ["rule set for other rules loaded"]
+        except ValueError:
+            return []
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Check serving optimizations against their contracts")
+    parser.add_argument("--samples", type=int, default=200)
+    parser.add_argument("--seed", type=int, default=1)
+    parser.add_argument("--rule-set", help="Also check a rule set written by minimize_rules.py")
+    args = parser.parse_args()
+
+    rng = random.Random(args.seed)
+    keys = list(iter_scenario_keys())
+    keys = rng.sample(keys, min(args.samples, len(keys)))
+    requests = sample_requests(keys, rng)
+
+    checks = [
+        ("warm fork", lambda: check_engine(requests, NativeMarketingEngine(compile_rule_base()), len(requests))),
+        ("product rule bases", lambda: check_product_engines(requests)),
+        ("unused rules removed", lambda: check_engine(requests, NativeMarketingEngine(pruned_rule_base()))),
+        ("bitset", lambda: check_engine(requests, service._new_engine("bitset"))),
+        ("sections", lambda: check_sections(requests)),
+        # Stage caches are keyed on the budget tier, so the second amount of a tier replays the first
+        ("staged", lambda: check_engine(requests, service._new_engine("staged"))),
+        ("decision table", lambda: check_decision_table(keys)),
+        ("rule set loader", check_rule_set_loader),
+        ("result cache", check_result_cache),
+        ("engine pool", lambda: check_engine_pool(requests[0])),
+        ("admission", lambda: asyncio.run(_check_admission())),
+        ("single flight", lambda: asyncio.run(_check_single_flight())),
+        ("api", lambda: check_api(requests)),
+    ]
+    if args.rule_set:
+        checks.insert(0, ("minimized rule set",
+                          lambda: check_engine(requests, NativeMarketingEngine(minimized_rule_base(args.rule_set)))))
+    failed = 0
+    for name, check in checks:
+        started = time.perf_counter()
+        failures = check()
+        failed += len(failures)
+        for failure in failures:
+            print(f"{name}: {failure}", file=sys.stderr)
+        print(f"{name}: {'ok' if not failures else f'{len(failures)} failures'} "
+              f"({time.perf_counter() - started:.1f}s)")
+
+    sys.exit(1 if failed else 0)
+
+
+if __name__ == "__main__":
+    main()